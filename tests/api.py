@@ -0,0 +1,36 @@
+
+# -*- coding: utf-8 -*-
+# this file is generated by register_api function, dont't change it
+
+from typing import List, Union
+
+import pandas as pd
+from sqlalchemy.orm import Session
+from zvdata.api import get_data
+from zvdata import IntervalLevel
+
+from tests.domain import Stock
+
+def get_stock(
+        ids: List[str] = None,
+        entity_ids: List[str] = None,
+        entity_id: str = None,
+        codes: List[str] = None,
+        code: str = None,
+        level: Union[IntervalLevel, str] = None,
+        provider: str = 'sina',
+        columns: List = None,
+        return_type: str = 'df',
+        start_timestamp: Union[pd.Timestamp, str] = None,
+        end_timestamp: Union[pd.Timestamp, str] = None,
+        filters: List = None,
+        session: Session = None,
+        order=None,
+        limit: int = None,
+        index: Union[str, list] = 'timestamp',
+        time_field: str = 'timestamp'):
+    return get_data(data_schema=Stock, ids=ids, entity_ids=entity_ids, entity_id=entity_id, codes=codes,
+                    code=code, level=level, provider=provider, columns=columns, return_type=return_type,
+                    start_timestamp=start_timestamp, end_timestamp=end_timestamp, filters=filters, session=session,
+                    order=order, limit=limit,index=index,time_field=time_field)
+
@@ -0,0 +1,235 @@
+# -*- coding: utf-8 -*-
+"""
+offline benchmark of the recorders,the data is from the local fake provider instead of the real data source
+
+usage:
+    python -m tests.benchmark_recorder --entities 500 --bars 250 --latency 0.001 --output result.json
+    python -m tests.benchmark_recorder --entities 500 --baseline result.json
+"""
+import argparse
+import json
+import os
+import sys
+import tempfile
+import time
+
+from sqlalchemy import Column, String, Float, DateTime
+from sqlalchemy.ext.declarative import declarative_base
+
+from tests.fake_provider import FakeKdataProvider
+from zvdata import Mixin
+from zvdata.contract import EntityMixin, register_schema, register_entity, init_data_env, zvdata_env, \
+    get_db_session
+from zvdata.rate_control import AdaptiveRateController, register_rate_controller
+from zvdata.recorder import FixedCycleDataRecorder, TimeSeriesDataRecorder
+from zvdata.snapshot import mark_rewritten
+
+BENCHMARK_DATA_PATH = os.path.join(tempfile.gettempdir(), 'zvdata_benchmark')
+
+# requests per second of the fake provider
+FAKE_MAX_RATE = 1e6
+
+BenchMetaBase = declarative_base()
+
+
+@register_entity(entity_type='bench')
+class BenchStock(BenchMetaBase, EntityMixin):
+    __tablename__ = 'bench_stock'
+    list_date = Column(DateTime)
+
+
+BenchKdataBase = declarative_base()
+
+
+class BenchStock1dKdata(BenchKdataBase, Mixin):
+    __tablename__ = 'bench_stock_1d_kdata'
+
+    provider = Column(String(length=32))
+    code = Column(String(length=32))
+    name = Column(String(length=32))
+    level = Column(String(length=32))
+
+    open = Column(Float)
+    close = Column(Float)
+    high = Column(Float)
+    low = Column(Float)
+    volume = Column(Float)
+    turnover = Column(Float)
+
+
+class FakeKdataRecorder(FixedCycleDataRecorder):
+    entity_provider = 'fake'
+    entity_schema = BenchStock
+
+    provider = 'fake'
+    data_schema = BenchStock1dKdata
+
+    # retry the transient errors of the fake provider
+    adaptive_rate = True
+    backoff_base = 0.001
+
+    fake_provider: FakeKdataProvider = None
+
+    def record(self, entity, start, end, size, timestamps):
+        kdata_list = self.fake_provider.get_kdata(entity.id, start_timestamp=start, size=size)
+        for kdata in kdata_list:
+            kdata['level'] = self.level.value
+            kdata['provider'] = self.provider
+        return kdata_list
+
+
+class FakeTimeSeriesRecorder(TimeSeriesDataRecorder):
+    entity_provider = 'fake'
+    entity_schema = BenchStock
+
+    provider = 'fake'
+    data_schema = BenchStock1dKdata
+
+    # retry the transient errors of the fake provider
+    adaptive_rate = True
+    backoff_base = 0.001
+
+    fake_provider: FakeKdataProvider = None
+
+    def record(self, entity, start, end, size, timestamps):
+        return self.fake_provider.get_kdata(entity.id, start_timestamp=start, size=size)
+
+
+BENCHMARK_RECORDERS = {
+    'fixed_cycle': FakeKdataRecorder,
+    'time_series': FakeTimeSeriesRecorder
+}
+
+_benchmark_env_inited = False
+
+
+def init_benchmark_env(data_path: str = BENCHMARK_DATA_PATH):
+    """
+    create the benchmark dbs in data_path,the data env set before is kept
+
+    """
+    global _benchmark_env_inited
+    if _benchmark_env_inited:
+        return
+
+    old_env = dict(zvdata_env)
+    init_data_env(data_path=data_path, domain_module='tests.benchmark_recorder')
+    try:
+        register_schema(providers=['fake'], db_name='bench_meta', schema_base=BenchMetaBase, entity_type='bench')
+        register_schema(providers=['fake'], db_name='bench_stock_1d_kdata', schema_base=BenchKdataBase,
+                        entity_type='bench')
+    finally:
+        # the engines are created,restore the env for others
+        if old_env:
+            zvdata_env.update(old_env)
+
+    _benchmark_env_inited = True
+
+
+def prepare_data(entity_count: int, list_date):
+    session = get_db_session(provider='fake', data_schema=BenchStock)
+    session.query(BenchStock).delete()
+    session.commit()
+
+    kdata_session = get_db_session(provider='fake', data_schema=BenchStock1dKdata)
+    kdata_session.query(BenchStock1dKdata).delete()
+    kdata_session.commit()
+    # the snapshots of the readers are invalid
+    mark_rewritten(provider='fake', data_schema=BenchStock1dKdata, min_timestamp=list_date)
+
+    entities = []
+    for i in range(entity_count):
+        code = '{:06d}'.format(i)
+        entity_id = f'bench_sz_{code}'
+        entities.append(BenchStock(id=entity_id, entity_id=entity_id, entity_type='bench', exchange='sz', code=code,
+                                   name=f'bench{code}', timestamp=list_date, list_date=list_date))
+    session.add_all(entities)
+    session.commit()
+
+
+def run_benchmark(entity_count: int = 100,
+                  bars: int = 250,
+                  latency: float = 0,
+                  error_rate: float = 0,
+                  recorder: str = 'fixed_cycle',
+                  seed: int = 0) -> dict:
+    """
+    record the synthetic kdata of entity_count entities from the fake provider to an empty db
+
+    :return: throughput and the time spent per stage
+    :rtype: dict
+    """
+    init_benchmark_env()
+
+    fake_provider = FakeKdataProvider(bars=bars, latency=latency, error_rate=error_rate, seed=seed)
+    # the fake provider has no rate limit,every run starts from the same rate
+    register_rate_controller(AdaptiveRateController(provider='fake', rate=FAKE_MAX_RATE, max_rate=FAKE_MAX_RATE))
+    prepare_data(entity_count=entity_count, list_date=fake_provider.timestamps[0])
+
+    recorder_cls = BENCHMARK_RECORDERS[recorder]
+    the_recorder = recorder_cls(entity_type='bench', exchanges=None, sleeping_time=0)
+    the_recorder.fake_provider = fake_provider
+
+    start = time.time()
+    the_recorder.run()
+    elapsed = time.time() - start
+
+    summary = the_recorder.metrics.summary()
+    rows = summary['counters'].get('rows_new', 0)
+
+    return {
+        'recorder': recorder_cls.__name__,
+        'entities': entity_count,
+        'bars': bars,
+        'latency': latency,
+        'error_rate': error_rate,
+        'elapsed': round(elapsed, 6),
+        'rows': rows,
+        'entities_per_second': round(entity_count / elapsed, 3),
+        'rows_per_second': round(rows / elapsed, 3),
+        'requests': fake_provider.requests,
+        'errors': fake_provider.errors,
+        'stages': summary['stages'],
+        'counters': summary['counters']
+    }
+
+
+def compare_with_baseline(result: dict, baseline: dict, tolerance: float = 0.2) -> list:
+    """
+    the throughput regressions bigger than tolerance compared with the baseline
+
+    """
+    regressions = []
+    for key in ('entities_per_second', 'rows_per_second'):
+        if baseline.get(key) and result[key] < baseline[key] * (1 - tolerance):
+            regressions.append(f'{key}:{result[key]} < baseline {baseline[key]}')
+    return regressions
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--entities', help='entity count', default=100, type=int)
+    parser.add_argument('--bars', help='bars of every entity', default=250, type=int)
+    parser.add_argument('--latency', help='seconds of every request', default=0, type=float)
+    parser.add_argument('--error-rate', help='probability of transient errors', default=0, type=float)
+    parser.add_argument('--recorder', help='the recorder to benchmark', default='fixed_cycle',
+                        choices=list(BENCHMARK_RECORDERS.keys()))
+    parser.add_argument('--output', help='json file to save the result')
+    parser.add_argument('--baseline', help='json file of the baseline result')
+    parser.add_argument('--tolerance', help='the throughput drop allowed', default=0.2, type=float)
+    args = parser.parse_args()
+
+    result = run_benchmark(entity_count=args.entities, bars=args.bars, latency=args.latency,
+                           error_rate=args.error_rate, recorder=args.recorder)
+    print(json.dumps(result, indent=2))
+
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(result, f, indent=2)
+
+    if args.baseline:
+        with open(args.baseline) as f:
+            regressions = compare_with_baseline(result, json.load(f), tolerance=args.tolerance)
+        if regressions:
+            print('regressions:{}'.format(regressions))
+            sys.exit(1)
@@ -0,0 +1,81 @@
+# -*- coding: utf-8 -*-
+"""
+benchmark of the vectorized time utils against the scalar versions
+
+usage:
+    python -m tests.benchmark_time_utils --size 100000
+"""
+import argparse
+import json
+import time
+
+import numpy as np
+import pandas as pd
+
+from zvdata import IntervalLevel
+from zvdata.utils.time_utils import to_pd_timestamp, to_pd_timestamps, to_time_str, to_time_strs, \
+    TIME_FORMAT_ISO8601, TIME_FORMAT_MINUTE, next_timestamp, next_timestamps, floor_timestamps, \
+    is_in_same_interval, same_interval_mask
+
+
+def make_timestamps(size: int, seed: int = 0) -> pd.DatetimeIndex:
+    rng = np.random.RandomState(seed)
+    seconds = rng.randint(0, 10 * 365 * 24 * 3600, size=size)
+    return pd.DatetimeIndex(pd.Timestamp('2010-01-01') + pd.to_timedelta(seconds, unit='s'))
+
+
+def _elapsed(func) -> float:
+    start = time.time()
+    func()
+    return time.time() - start
+
+
+def get_benchmark_cases(timestamps: pd.DatetimeIndex) -> dict:
+    """
+    name -> (scalar func,vectorized func)
+
+    """
+    ms = (timestamps.asi8 // 1000000).tolist()
+    shifted = timestamps + pd.Timedelta(minutes=7)
+    level = IntervalLevel.LEVEL_15MIN
+
+    return {
+        'to_pd_timestamp': (lambda: [to_pd_timestamp(t) for t in ms],
+                            lambda: to_pd_timestamps(np.array(ms))),
+        'to_time_str_day': (lambda: [to_time_str(t) for t in timestamps],
+                            lambda: to_time_strs(timestamps)),
+        'to_time_str_iso8601': (lambda: [to_time_str(t, fmt=TIME_FORMAT_ISO8601) for t in timestamps],
+                                lambda: to_time_strs(timestamps, fmt=TIME_FORMAT_ISO8601)),
+        'to_time_str_minute': (lambda: [to_time_str(t, fmt=TIME_FORMAT_MINUTE) for t in timestamps],
+                               lambda: to_time_strs(timestamps, fmt=TIME_FORMAT_MINUTE)),
+        'floor_timestamp': (lambda: [level.floor_timestamp(t) for t in timestamps],
+                            lambda: floor_timestamps(timestamps, level)),
+        'next_timestamp': (lambda: [next_timestamp(t, level) for t in timestamps],
+                           lambda: next_timestamps(timestamps, level)),
+        'is_in_same_interval': (lambda: [is_in_same_interval(t1, t2, level) for t1, t2 in zip(timestamps, shifted)],
+                                lambda: same_interval_mask(timestamps, shifted, level))
+    }
+
+
+def run_benchmark(size: int = 100000, seed: int = 0) -> dict:
+    """
+    the seconds of the scalar and vectorized versions for size timestamps
+
+    """
+    timestamps = make_timestamps(size, seed=seed)
+
+    result = {}
+    for name, (scalar_func, vectorized_func) in get_benchmark_cases(timestamps).items():
+        scalar = _elapsed(scalar_func)
+        vectorized = _elapsed(vectorized_func)
+        result[name] = {'scalar': scalar, 'vectorized': vectorized,
+                        'speedup': scalar / vectorized if vectorized else None}
+    return result
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--size', help='timestamps count', default=100000, type=int)
+    args = parser.parse_args()
+
+    print(json.dumps(run_benchmark(size=args.size), indent=2))
@@ -0,0 +1,40 @@
+# -*- coding: utf-8 -*-
+import pytest
+
+from tests.benchmark_recorder import init_benchmark_env, run_benchmark
+from zvdata.contract import zvdata_env
+
+
+@pytest.fixture(scope='session')
+def bench_data_path(tmp_path_factory):
+    """
+    the benchmark dbs are created in the temp dir once for the session
+
+    """
+    data_path = str(tmp_path_factory.mktemp('zvdata_benchmark'))
+    init_benchmark_env(data_path=data_path)
+    return data_path
+
+
+@pytest.fixture
+def bench_env(bench_data_path, tmp_path, monkeypatch):
+    """
+    the snapshots,rewrites and caches written by the test go to its temp dir,the engines of the benchmark dbs are
+    created already
+
+    """
+    monkeypatch.setitem(zvdata_env, 'data_path', str(tmp_path))
+    return str(tmp_path)
+
+
+@pytest.fixture
+def bench_data(bench_env):
+    """
+    fill the benchmark dbs with the kdata of entity_count entities from 2018-01-01,e.g. bench_data(entity_count=2)
+
+    """
+
+    def prepare(entity_count: int = 2, bars: int = 20, **kwargs) -> dict:
+        return run_benchmark(entity_count=entity_count, bars=bars, **kwargs)
+
+    return prepare
@@ -0,0 +1,117 @@
+# -*- coding: utf-8 -*-
+import random
+import time
+import zlib
+from collections import deque
+from typing import List
+
+import numpy as np
+import pandas as pd
+
+from zvdata.rate_control import ThrottledError, TransientError
+
+
+class FakeProvider(object):
+    """
+    local fake provider simulating the rate limit,latency and random errors of the real one
+
+    the time is passed by the caller,so the simulation is not related to the wall clock
+    """
+
+    def __init__(self, max_rate: float = 5, latency: float = 0.05, error_rate: float = 0, seed: int = 0) -> None:
+        """
+
+        :param max_rate: the requests per second allowed,exceeding requests would be throttled
+        :type max_rate: float
+        :param latency: seconds for every request
+        :type latency: float
+        :param error_rate: the probability of transient error
+        :type error_rate: float
+        :param seed:
+        :type seed: int
+        """
+        self.max_rate = max_rate
+        self.latency = latency
+        self.error_rate = error_rate
+        self.random = random.Random(seed)
+
+        self.request_times = deque()
+        self.requests = 0
+        self.throttled = 0
+        self.errors = 0
+
+    def request(self, now: float):
+        self.requests += 1
+
+        # requests in the last second
+        while self.request_times and self.request_times[0] <= now - 1:
+            self.request_times.popleft()
+        if len(self.request_times) >= self.max_rate:
+            self.throttled += 1
+            raise ThrottledError(f'more than {self.max_rate} requests per second')
+        self.request_times.append(now)
+
+        if self.error_rate and self.random.random() < self.error_rate:
+            self.errors += 1
+            raise TransientError('fake transient error')
+
+        return self.latency
+
+
+class FakeKdataProvider(object):
+    """
+    in-process stub generating synthetic daily kdata for the entities,with configurable latency and error rate
+    """
+
+    def __init__(self,
+                 start_timestamp: str = '2018-01-01',
+                 bars: int = 250,
+                 latency: float = 0,
+                 error_rate: float = 0,
+                 seed: int = 0) -> None:
+        """
+
+        :param start_timestamp: the timestamp of the first bar
+        :type start_timestamp: str
+        :param bars: bars of every entity
+        :type bars: int
+        :param latency: seconds slept for every request
+        :type latency: float
+        :param error_rate: the probability of transient error
+        :type error_rate: float
+        :param seed:
+        :type seed: int
+        """
+        self.timestamps = pd.date_range(start_timestamp, periods=bars, freq='D')
+        self.latency = latency
+        self.error_rate = error_rate
+        self.random = random.Random(seed)
+
+        self.requests = 0
+        self.errors = 0
+
+    def get_kdata(self, entity_id: str, start_timestamp=None, size: int = None) -> List[dict]:
+        self.requests += 1
+        if self.latency:
+            time.sleep(self.latency)
+
+        if self.error_rate and self.random.random() < self.error_rate:
+            self.errors += 1
+            raise TransientError('fake transient error')
+
+        timestamps = self.timestamps
+        if start_timestamp is not None:
+            timestamps = timestamps[timestamps >= pd.Timestamp(start_timestamp)]
+        if size:
+            timestamps = timestamps[:size]
+
+        # deterministic prices for the entity
+        base = 10 + zlib.crc32(entity_id.encode()) % 100
+        prices = base + np.sin(np.arange(len(timestamps)) / 10.0)
+        return [{'timestamp': timestamp,
+                 'open': price,
+                 'close': price + 0.1,
+                 'high': price + 0.2,
+                 'low': price - 0.2,
+                 'volume': 10000.0,
+                 'turnover': price * 10000} for timestamp, price in zip(timestamps, prices)]
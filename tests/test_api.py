@@ -0,0 +1,56 @@
+# -*- coding: utf-8 -*-
+import pandas as pd
+
+from tests.benchmark_recorder import BenchStock1dKdata
+from zvdata.api import get_data_asof, get_data_asof_panel, get_data
+
+
+def test_get_data_asof(bench_data):
+    bench_data(entity_count=3, bars=20)
+
+    df = get_data_asof(BenchStock1dKdata, timestamp='2018-01-05 12:00', provider='fake',
+                       entity_ids=['bench_sz_000000', 'bench_sz_000002'], columns=['close'])
+    assert df['entity_id'].tolist() == ['bench_sz_000000', 'bench_sz_000002']
+    assert df['timestamp'].tolist() == [pd.Timestamp('2018-01-05')] * 2
+
+    df = get_data_asof(BenchStock1dKdata, timestamp='2017-12-31', provider='fake')
+    assert df.empty
+
+
+def test_get_data_asof_panel(bench_data):
+    bench_data(entity_count=2, bars=20)
+
+    timestamps = ['2017-12-31', '2018-01-03 10:00', '2018-01-08', '2018-01-30']
+    panel = get_data_asof_panel(BenchStock1dKdata, timestamps=timestamps, provider='fake', columns=['close'])
+    assert len(panel) == 6
+
+    all_df = get_data(BenchStock1dKdata, provider='fake', index=['entity_id', 'timestamp'])
+    for timestamp in timestamps[1:]:
+        expected = all_df[all_df['timestamp'] <= pd.Timestamp(timestamp)].groupby(level=0).last()
+        got = panel.xs(pd.Timestamp(timestamp), level=1)
+        assert got['close'].tolist() == expected['close'].tolist()
+        assert got['timestamp'].tolist() == expected['timestamp'].tolist()
+
+    # the same as the as of query of every timestamp
+    panel = get_data_asof_panel(BenchStock1dKdata, timestamps=timestamps[1:3], provider='fake',
+                                entity_ids=['bench_sz_000001'])
+    for timestamp in timestamps[1:3]:
+        df = get_data_asof(BenchStock1dKdata, timestamp=timestamp, provider='fake', entity_ids=['bench_sz_000001'])
+        got = panel.xs(pd.Timestamp(timestamp), level=1)
+        assert got['id'].tolist() == df['id'].tolist()
+
+    panel = get_data_asof_panel(BenchStock1dKdata, timestamps=['2018-01-05'], provider='fake')
+    assert panel['timestamp'].tolist() == [pd.Timestamp('2018-01-05')] * 2
+    assert get_data_asof_panel(BenchStock1dKdata, timestamps=[], provider='fake') is None
+
+
+def test_get_data_ordered_by_index(bench_data):
+    bench_data(entity_count=3, bars=5)
+
+    df = get_data(BenchStock1dKdata, provider='fake', index=['entity_id', 'timestamp'])
+    assert df.index.is_monotonic_increasing
+    assert df['entity_id'].tolist() == ['bench_sz_000000'] * 5 + ['bench_sz_000001'] * 5 + ['bench_sz_000002'] * 5
+
+    # the order asked is kept
+    df = get_data(BenchStock1dKdata, provider='fake', order=BenchStock1dKdata.timestamp.desc(), limit=3)
+    assert df['timestamp'].tolist() == [pd.Timestamp('2018-01-05')] * 3
@@ -0,0 +1,49 @@
+# -*- coding: utf-8 -*-
+import pandas as pd
+
+from tests.benchmark_recorder import run_benchmark, compare_with_baseline, FakeTimeSeriesRecorder
+from zvdata.utils.time_utils import TIME_FORMAT_DAY, TIME_FORMAT_ISO8601
+
+
+def test_benchmark_fixed_cycle_recorder(bench_env):
+    result = run_benchmark(entity_count=3, bars=20, error_rate=0.1, seed=1)
+
+    assert result['rows'] == 60
+    assert result['errors'] == result['counters'].get('retries', 0)
+    for stage in ('evaluate', 'record', 'generate_domain', 'persist'):
+        assert stage in result['stages']
+
+
+def test_benchmark_time_series_recorder(bench_env):
+    result = run_benchmark(entity_count=2, bars=10, recorder='time_series')
+
+    assert result['rows'] == 20
+    assert result['rows_per_second'] > 0
+
+
+def test_compare_with_baseline():
+    baseline = {'entities_per_second': 100, 'rows_per_second': 10000}
+
+    assert not compare_with_baseline({'entities_per_second': 90, 'rows_per_second': 9000}, baseline, tolerance=0.2)
+    assert len(compare_with_baseline({'entities_per_second': 50, 'rows_per_second': 9000}, baseline,
+                                     tolerance=0.2)) == 1
+
+
+def test_generate_domain_ids(bench_data):
+    bench_data(entity_count=1, bars=5, recorder='time_series')
+    recorder = FakeTimeSeriesRecorder(entity_type='bench', exchanges=None, sleeping_time=0)
+    assert recorder.is_default_domain_id()
+
+    entity = recorder.entities[0]
+    times = [pd.Timestamp('2019-10-08 09:35:00.123456'), '2019-10-09', pd.Timestamp('2019-10-10'), 1570000000000]
+    for time_fmt in (TIME_FORMAT_DAY, TIME_FORMAT_ISO8601):
+        ids = recorder.generate_domain_ids(entity, times, time_fmt=time_fmt)
+        assert ids.tolist() == [recorder.generate_domain_id(entity, {'timestamp': t}, time_fmt=time_fmt) for t in
+                                times]
+
+    original_list = [{'timestamp': t} for t in times]
+    assert recorder.generate_original_domain_ids(entity, original_list).tolist() == [
+        recorder.generate_domain_id(entity, original_data) for original_data in original_list]
+    # fall back to generate_domain_id
+    assert recorder.generate_original_domain_ids(entity, [{'timestamp': 'not a time'}]) is None
+    recorder.on_finish()
@@ -0,0 +1,91 @@
+# -*- coding: utf-8 -*-
+import threading
+import time
+
+import pandas as pd
+
+from zvdata.dispatcher import ListenerDispatcher, ListenerWorker, DROP_OLDEST, COALESCE
+
+
+class SlowListener(object):
+    def __init__(self) -> None:
+        self.gate = threading.Event()
+        self.data = []
+        self.added = {}
+
+    def on_data_changed(self, data) -> object:
+        self.gate.wait(5)
+        self.data.append(data)
+
+    def on_entity_data_changed(self, entity, added_data) -> object:
+        self.gate.wait(5)
+        self.added.setdefault(entity, []).append(added_data)
+
+
+def test_drop_oldest():
+    listener = SlowListener()
+    worker = ListenerWorker(listener, policy=DROP_OLDEST, queue_size=2)
+    for i in range(5):
+        worker.submit('on_data_changed', i)
+    listener.gate.set()
+    assert worker.join(5)
+    worker.stop()
+
+    # the first one may be taken by the thread before the others submitted
+    assert listener.data[-2:] == [3, 4]
+    assert worker.dropped + len(listener.data) == 5
+
+
+def test_coalesce():
+    listener = SlowListener()
+    worker = ListenerWorker(listener, policy=COALESCE)
+    # block the worker with the first call
+    worker.submit('on_data_changed', 0)
+    while worker.pending:
+        time.sleep(0.001)
+    for i in range(1, 5):
+        worker.submit('on_data_changed', i)
+        worker.submit('on_entity_data_changed', entity='a', added_data=pd.DataFrame({'close': [i]}))
+    listener.gate.set()
+    assert worker.join(5)
+    worker.stop()
+
+    assert listener.data == [0, 4]
+    assert len(listener.added['a']) == 1
+    assert listener.added['a'][0]['close'].tolist() == [1, 2, 3, 4]
+
+
+def test_slow_listener_not_stalling_others():
+    slow = SlowListener()
+    fast = SlowListener()
+    fast.gate.set()
+
+    dispatcher = ListenerDispatcher(mode='thread')
+    dispatcher.add(slow)
+    dispatcher.add(fast)
+    for i in range(3):
+        dispatcher.dispatch('on_data_changed', i)
+
+    assert dispatcher.workers[list(dispatcher.workers)[1]].join(5)
+    assert fast.data == [0, 1, 2]
+    assert slow.data == []
+
+    slow.gate.set()
+    assert dispatcher.join(5)
+    assert slow.data == [0, 1, 2]
+    assert [stats['latency']['count'] for stats in dispatcher.stats().values()] == [3, 3]
+    dispatcher.close()
+
+
+def test_listener_appended_directly():
+    for mode in ('sync', 'thread'):
+        dispatcher = ListenerDispatcher(mode=mode)
+        listener = SlowListener()
+        listener.gate.set()
+        # the worker and latency are created on first dispatching
+        dispatcher.listeners.append(listener)
+        dispatcher.dispatch('on_data_changed', 1)
+        assert dispatcher.join(5)
+        assert listener.data == [1]
+        assert list(dispatcher.stats().values())[0]['latency']['count'] == 1
+        dispatcher.close()
@@ -0,0 +1,40 @@
+# -*- coding: utf-8 -*-
+import os
+
+from zvdata.metrics import RecorderMetrics, PrometheusTextFileSink, to_prometheus_text
+
+
+def test_recorder_metrics():
+    metrics = RecorderMetrics(recorder='TestRecorder', provider='netease', data_schema='Stock1dKdata')
+    metrics.reset()
+
+    with metrics.timer('record'):
+        pass
+    metrics.incr('rows_fetched', 10)
+    metrics.incr('rows_new', 8)
+    metrics.observe('entity_seconds', 0.2)
+    metrics.observe('entity_seconds', 100)
+
+    summary = metrics.summary()
+    assert summary['recorder'] == 'TestRecorder'
+    assert summary['stages']['record']['calls'] == 1
+    assert summary['counters'] == {'rows_fetched': 10, 'rows_new': 8}
+    assert summary['histograms']['entity_seconds']['count'] == 2
+    assert summary['histograms']['entity_seconds']['buckets']['0.25'] == 1
+    assert summary['histograms']['entity_seconds']['buckets']['inf'] == 2
+
+    text = to_prometheus_text(metrics)
+    assert 'zvdata_recorder_rows_fetched_total{recorder="TestRecorder",provider="netease",schema="Stock1dKdata"} 10' in text
+    assert 'zvdata_recorder_entity_seconds_bucket{recorder="TestRecorder",provider="netease",schema="Stock1dKdata",le="+Inf"} 2' in text
+
+
+def test_prometheus_text_file_sink(tmp_path):
+    path = os.path.join(str(tmp_path), 'metrics', 'recorder.prom')
+    metrics = RecorderMetrics(recorder='TestRecorder')
+    metrics.reset()
+    metrics.incr('entities')
+
+    PrometheusTextFileSink(path).on_run_finished(metrics)
+
+    with open(path) as f:
+        assert 'zvdata_recorder_entities_total{recorder="TestRecorder"} 1' in f.read()
@@ -0,0 +1,132 @@
+# -*- coding: utf-8 -*-
+import numpy as np
+import pandas as pd
+
+from zvdata import normal_data as normal_data_module
+from zvdata.normal_data import NormalData
+from zvdata.utils.pd_utils import fill_with_same_index
+
+
+def make_df():
+    timestamps = pd.date_range('2019-01-01', periods=5)
+    df = pd.DataFrame({'entity_id': ['b'] * 3 + ['a'] * 5,
+                       'timestamp': list(timestamps[2:]) + list(timestamps),
+                       'close': np.arange(8, dtype=float)})
+    return df
+
+
+def test_normal_data():
+    normal_data = NormalData(make_df())
+    assert normal_data.entity_ids == ['a', 'b']
+    assert normal_data._df_list is None
+
+    df = normal_data.entity_map_df['b']
+    pd.testing.assert_frame_equal(df, normal_data.data_df.loc[('b',)])
+    # a view of data_df
+    assert np.shares_memory(df['close'].values, normal_data.data_df['close'].values)
+    assert normal_data.entity_map_df['b'] is df
+
+    assert [len(df) for df in normal_data.df_list] == [5, 3]
+    assert list(normal_data.entity_map_df) == ['a', 'b']
+
+
+def test_normal_data_fill_index():
+    normal_data = NormalData(make_df(), fill_index=True)
+    df_list = normal_data.df_list
+    assert [len(df) for df in df_list] == [5, 5]
+    assert df_list[1]['close'].isnull().sum() == 2
+
+    assert NormalData(None).empty()
+    assert NormalData(None).df_list == []
+
+
+def test_normal_data_append():
+    normal_data = NormalData(make_df())
+    df_a = normal_data.entity_map_df['a']
+
+    timestamps = pd.date_range('2019-01-05', periods=2)
+
+    def make_new_df():
+        return pd.DataFrame({'entity_id': ['b', 'b', 'c'],
+                             'timestamp': [timestamps[0], timestamps[1], timestamps[1]],
+                             'close': [100., 101., 102.]})
+
+    normal_data.append(make_new_df())
+
+    assert normal_data.entity_ids == ['a', 'b', 'c']
+    # not touched
+    assert normal_data.entity_map_df['a'] is df_a
+    # the same time replaced
+    assert normal_data.entity_map_df['b']['close'].to_list() == [0., 1., 100., 101.]
+
+    expected = NormalData(pd.concat([make_df().iloc[:2], make_df().iloc[3:], make_new_df()])).data_df
+    pd.testing.assert_frame_equal(normal_data.data_df, expected)
+    pd.testing.assert_frame_equal(normal_data.entity_map_df['a'], expected.loc[('a',)])
+    # the entities are the views of the rebuilt data_df,the old frames are not kept
+    for entity_id in normal_data.entity_ids:
+        assert np.shares_memory(normal_data.entity_map_df[entity_id]['close'].values,
+                                normal_data.data_df['close'].values)
+    assert not np.shares_memory(normal_data.entity_map_df['a']['close'].values, df_a['close'].values)
+
+
+def test_normal_data_append_at_tail():
+    normal_data = NormalData(make_df())
+    df_b = normal_data.entity_map_df['b']
+
+    timestamps = pd.date_range('2019-01-06', periods=3)
+    for timestamp, close in zip(timestamps, [100., 101., 102.]):
+        normal_data.append(pd.DataFrame({'entity_id': ['b', 'c'], 'timestamp': [timestamp] * 2,
+                                         'close': [close, close]}))
+    # the history is not concatenated for every append
+    assert normal_data.entity_map_df.cache['b'] is df_b
+    assert [len(df) for df in normal_data.entity_map_df.pending['b']] == [1, 1, 1]
+
+    assert normal_data.entity_map_df['b']['close'].to_list() == [0., 1., 2., 100., 101., 102.]
+    assert normal_data.entity_map_df['c'].index.to_list() == list(timestamps)
+
+    # the time replaced after the tail appended
+    normal_data.append(pd.DataFrame({'entity_id': ['c'], 'timestamp': [timestamps[1]], 'close': [0.]}))
+    assert normal_data.entity_map_df['c']['close'].to_list() == [100., 0., 102.]
+    assert normal_data.data_df['close'].to_list() == [3., 4., 5., 6., 7., 0., 1., 2., 100., 101., 102., 100., 0.,
+                                                      102.]
+
+
+def test_normal_data_append_fill_index(monkeypatch):
+    normal_data = NormalData(make_df(), fill_index=True)
+    df_list = normal_data.df_list
+
+    new_df = pd.DataFrame({'entity_id': ['b'], 'timestamp': [pd.Timestamp('2019-01-04')], 'close': [100.]})
+    normal_data.append(new_df)
+    # the index not grown,a is not reindexed
+    assert normal_data.df_list[0] is df_list[0]
+    assert normal_data.df_list[1].loc['2019-01-04', 'close'] == 100.
+
+    new_df = pd.DataFrame({'entity_id': ['a'], 'timestamp': [pd.Timestamp('2019-01-06')], 'close': [200.]})
+    normal_data.append(new_df)
+    assert [len(df) for df in normal_data.df_list] == [6, 6]
+    assert np.isnan(normal_data.df_list[1].loc['2019-01-06', 'close'])
+    df_b = normal_data.df_list[1]
+
+    # aligned lazily,b is extended at the tail without reindexing the history
+    for day in ('2019-01-07', '2019-01-08'):
+        normal_data.append(pd.DataFrame({'entity_id': ['a'], 'timestamp': [pd.Timestamp(day)], 'close': [300.]}))
+    assert normal_data._df_list is None
+
+    filled = []
+
+    def recording_fill_with_same_index(df_list, target_index=None, fill_method=None):
+        filled.append(len(df_list))
+        return fill_with_same_index(df_list, target_index=target_index, fill_method=fill_method)
+
+    monkeypatch.setattr(normal_data_module, 'fill_with_same_index', recording_fill_with_same_index)
+    df_list = normal_data.df_list
+    # only a is filled again
+    assert filled == [1]
+    pd.testing.assert_frame_equal(df_list[1].iloc[:6], df_b)
+    for df, expected in zip(df_list, NormalData(normal_data.data_df, fill_index=True).df_list):
+        pd.testing.assert_frame_equal(df, expected)
+
+    # the timestamp inserted into the history
+    normal_data.append(pd.DataFrame({'entity_id': ['a'], 'timestamp': [pd.Timestamp('2018-12-31')], 'close': [0.]}))
+    for df, expected in zip(normal_data.df_list, NormalData(normal_data.data_df, fill_index=True).df_list):
+        pd.testing.assert_frame_equal(df, expected)
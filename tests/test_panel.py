@@ -0,0 +1,64 @@
+# -*- coding: utf-8 -*-
+import os
+import tempfile
+
+import numpy as np
+import pandas as pd
+import pytest
+
+from zvdata.normal_data import NormalData
+from zvdata.panel import Panel
+
+
+def make_df(entity_ids, start, periods):
+    dfs = []
+    for i, entity_id in enumerate(entity_ids):
+        timestamps = pd.date_range(start, periods=periods)
+        dfs.append(pd.DataFrame({'entity_id': entity_id, 'timestamp': timestamps, 'code': entity_id,
+                                 'close': np.arange(periods, dtype=float) + i * 100,
+                                 'volume': np.arange(periods) * 10}))
+    return pd.concat(dfs)
+
+
+def test_panel():
+    df = make_df(['a', 'b'], '2019-01-01', 5)
+    # b has no data on 2019-01-03
+    df = df[~((df['entity_id'] == 'b') & (df['timestamp'] == pd.Timestamp('2019-01-03')))]
+    normal_data = NormalData(df)
+
+    panel = Panel.from_normal_data(normal_data)
+    assert panel.fields == ['close', 'volume']
+    assert panel.values.shape == (2, 5, 2)
+
+    expected = normal_data.data_df['close'].unstack(level=0)
+    pd.testing.assert_frame_equal(panel.field_df('close'), expected, check_names=False, check_freq=False)
+    assert np.isnan(panel.field('close')[2, 1])
+    assert panel.field('close').base is not None
+
+    panel.append(NormalData(make_df(['c', 'b'], '2019-01-06', 3)).data_df)
+    assert panel.entity_ids == ['a', 'b', 'c']
+    assert panel.time_index().tolist() == list(pd.date_range('2019-01-01', periods=8))
+    assert np.isnan(panel.field('close')[5:, 0]).all()
+    assert panel.field('close')[5:, 1].tolist() == [100, 101, 102]
+
+    with pytest.raises(ValueError):
+        panel.append(NormalData(make_df(['a'], '2018-01-01', 1)).data_df)
+
+    # the panel is not changed by the rows failed
+    with pytest.raises(ValueError):
+        panel.append(NormalData(make_df(['d'], '2018-01-01', 1)).data_df)
+    assert panel.entity_ids == ['a', 'b', 'c']
+    assert 'd' not in panel.entity_map_code
+    assert panel.values.shape[2] == 3
+    assert panel.times == 8
+
+
+def test_memory_mapped_panel():
+    path = os.path.join(tempfile.mkdtemp(), 'panel.bin')
+    panel = Panel.from_df(make_df(['a', 'b'], '2019-01-01', 3), fields=['close'], path=path)
+    panel.append(NormalData(make_df(['a', 'b'], '2019-01-04', 3)).data_df)
+    panel.flush()
+
+    assert isinstance(panel.values, np.memmap)
+    values = np.memmap(path, dtype=np.float64, mode='r', shape=panel.values.shape)
+    assert values[0, :6, 1].tolist() == [100, 101, 102, 100, 101, 102]
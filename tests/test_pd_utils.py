@@ -0,0 +1,71 @@
+# -*- coding: utf-8 -*-
+import pandas as pd
+
+from zvdata.utils.pd_utils import fill_with_same_index, index_df
+
+
+def make_df(timestamps, values):
+    return pd.DataFrame({'close': values}, index=pd.DatetimeIndex(timestamps, name='timestamp'))
+
+
+def test_fill_with_same_index():
+    df1 = make_df(['2019-01-01', '2019-01-03'], [1.0, 3.0])
+    df2 = make_df(['2019-01-02', '2019-01-03', '2019-01-04'], [2.0, 3.0, 4.0])
+
+    result = fill_with_same_index([df1, df2])
+    for df in result:
+        assert df.index.tolist() == list(pd.date_range('2019-01-01', '2019-01-04'))
+        assert df.index.name == 'timestamp'
+        assert df['close'].dtype == float
+    assert result[0]['close'].isnull().tolist() == [False, True, False, True]
+
+    result = fill_with_same_index([df1, df2], fill_method='ffill')
+    assert result[0]['close'].tolist()[1:] == [1.0, 3.0, 3.0]
+
+
+def test_fill_with_target_index():
+    df1 = make_df(['2019-01-01', '2019-01-03'], [1.0, 3.0])
+    # duplicated index
+    df2 = make_df(['2019-01-02', '2019-01-02'], [2.0, 2.5])
+
+    target_index = pd.date_range('2019-01-01', '2019-01-03')
+    result = fill_with_same_index([df1, df2], target_index=target_index)
+    assert result[0].index.tolist() == list(target_index)
+    assert len(result[1]) == 4
+
+
+def test_fill_with_duplicated_index():
+    duplicated_df = make_df(['2018-12-31', '2019-01-02', '2019-01-04', '2019-01-06', '2019-01-04'],
+                            [0.0, None, 3.0, 6.0, 4.0])
+
+    target_index = pd.date_range('2019-01-01', '2019-01-05')
+    for fill_method in (None, 'ffill', 'bfill'):
+        # the same as filling from the last duplicated row before or the first one after
+        keep = 'first' if fill_method == 'bfill' else 'last'
+        df = duplicated_df[~duplicated_df.index.duplicated(keep=keep)]
+        expected = fill_with_same_index([df], target_index=target_index, fill_method=fill_method)[0]
+
+        result = fill_with_same_index([duplicated_df], target_index=target_index, fill_method=fill_method)[0]
+        # the rows out of the target index are dropped,the NaN in the data is kept
+        assert result.index.tolist() == [pd.Timestamp(t) for t in
+                                         ['2019-01-01', '2019-01-02', '2019-01-03', '2019-01-04', '2019-01-04',
+                                          '2019-01-05']]
+        assert result['close'].dtype == float
+        pd.testing.assert_frame_equal(result[~result.index.duplicated(keep=keep)], expected, check_freq=False)
+
+
+def test_index_df_presorted():
+    df = pd.DataFrame({'entity_id': ['a', 'a', 'b'],
+                       'timestamp': pd.to_datetime(['2019-01-01', '2019-01-02', '2019-01-01']),
+                       'close': [1.0, 2.0, 3.0]})
+    result = index_df(df.copy(), index=['entity_id', 'timestamp'], presorted=True)
+    assert result['close'].tolist() == [1.0, 2.0, 3.0]
+
+    # the order is checked
+    result = index_df(df.iloc[::-1].copy(), index=['entity_id', 'timestamp'], presorted=True)
+    assert result['close'].tolist() == [1.0, 2.0, 3.0]
+    assert result.index.is_monotonic_increasing
+
+    df['timestamp'] = ['2019-01-01', '2019-01-02', '2019-01-01']
+    result = index_df(df, index=['entity_id', 'timestamp'])
+    assert result.index.get_level_values(1).dtype.kind == 'M'
@@ -0,0 +1,102 @@
+# -*- coding: utf-8 -*-
+from tests.fake_provider import FakeProvider
+from zvdata.rate_control import AdaptiveRateController, CircuitBreaker, ThrottledError, TransientError, \
+    backoff_with_jitter, is_transient_error
+
+
+def simulate(controller: AdaptiveRateController, provider: FakeProvider, steps: int):
+    now = 0
+    rates = []
+    for _ in range(steps):
+        now = now + controller.interval()
+        try:
+            latency = provider.request(now)
+            controller.on_success(latency=latency)
+        except ThrottledError:
+            controller.on_throttled()
+        except TransientError:
+            controller.on_error()
+        rates.append(controller.rate)
+    return rates
+
+
+def test_aimd_converge_to_provider_limit():
+    provider = FakeProvider(max_rate=5)
+    controller = AdaptiveRateController(provider='fake', rate=1, rate_increase=0.2)
+
+    rates = simulate(controller, provider, steps=2000)
+
+    assert provider.throttled > 0
+    # the rate oscillates under the limit of the provider
+    avg_rate = sum(rates[-500:]) / 500
+    assert 2.5 < avg_rate < 6
+    # most requests succeed
+    assert provider.throttled / provider.requests < 0.1
+
+
+def test_aimd_with_errors_and_latency():
+    provider = FakeProvider(max_rate=100, latency=2, error_rate=0.05)
+    controller = AdaptiveRateController(provider='fake', rate=10, target_latency=1)
+
+    simulate(controller, provider, steps=200)
+
+    # the latency is always too big
+    assert controller.rate == controller.min_rate
+
+
+def test_state_persistence(tmp_path):
+    path = str(tmp_path / 'fake.json')
+    controller = AdaptiveRateController(provider='fake', rate=3.5)
+    controller.save(path)
+
+    restored = AdaptiveRateController(provider='fake').restore(path)
+    assert restored.rate == 3.5
+
+
+def test_backoff_with_jitter():
+    for attempt in range(10):
+        seconds = backoff_with_jitter(attempt, base=1, cap=30)
+        assert 0 <= seconds <= min(30, 2 ** attempt)
+
+    assert is_transient_error(ThrottledError())
+    assert is_transient_error(ConnectionError())
+    assert not is_transient_error(ValueError())
+
+
+def test_circuit_breaker():
+    breaker = CircuitBreaker(failure_threshold=2, reset_timeout=0)
+    assert breaker.allow_request()
+
+    breaker.on_failure()
+    assert breaker.state == CircuitBreaker.CLOSED
+    breaker.on_failure()
+    assert breaker.state == CircuitBreaker.OPEN
+
+    # reset_timeout passed,one request is allowed to test the provider
+    assert breaker.allow_request()
+    assert breaker.state == CircuitBreaker.HALF_OPEN
+    breaker.on_failure()
+    assert breaker.state == CircuitBreaker.OPEN
+
+    breaker.allow_request()
+    breaker.on_success()
+    assert breaker.state == CircuitBreaker.CLOSED
+
+    breaker = CircuitBreaker(failure_threshold=1, reset_timeout=60)
+    breaker.on_failure()
+    assert not breaker.allow_request()
+    assert breaker.remaining() > 0
+
+    # only one trial request in half open
+    breaker.opened_at -= 60
+    assert breaker.allow_request()
+    assert breaker.state == CircuitBreaker.HALF_OPEN
+    assert not breaker.allow_request()
+    assert breaker.remaining() > 0
+
+    # the trial request is not finished in reset_timeout
+    breaker.opened_at -= 60
+    assert breaker.allow_request()
+    breaker.on_success()
+    assert breaker.allow_request()
+    assert breaker.allow_request()
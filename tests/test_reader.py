@@ -0,0 +1,335 @@
+# -*- coding: utf-8 -*-
+import threading
+import time
+
+import pandas as pd
+import pytest
+
+from tests.benchmark_recorder import BenchStock, BenchStock1dKdata
+from zvdata.contract import get_db_session
+from zvdata.notify import publish_data_changed
+from zvdata.snapshot import mark_rewritten, load_snapshot, save_snapshot
+from zvdata import IntervalLevel, reader as reader_module
+from zvdata.reader import DataReader, DataListener, ChunkedDataReader, MultiLevelDataReader
+
+
+class RecordingListener(DataListener):
+    def __init__(self) -> None:
+        self.loaded = 0
+        self.changed = 0
+        self.entity_changed = {}
+
+    def on_data_loaded(self, data: pd.DataFrame) -> object:
+        self.loaded += 1
+
+    def on_data_changed(self, data: pd.DataFrame) -> object:
+        self.changed += 1
+
+    def on_entity_data_changed(self, entity: str, added_data: pd.DataFrame) -> object:
+        self.entity_changed[entity] = len(added_data)
+
+
+def get_reader(end_timestamp='2018-01-10', computing_window=None, change_notification=None, snapshot=False,
+               listener_dispatch='sync'):
+    return DataReader(data_schema=BenchStock1dKdata, entity_schema=BenchStock, provider='fake',
+                      entity_provider='fake', start_timestamp='2018-01-01', end_timestamp=end_timestamp,
+                      computing_window=computing_window, change_notification=change_notification,
+                      snapshot=snapshot, listener_dispatch=listener_dispatch)
+
+
+def test_move_on(bench_data):
+    bench_data(entity_count=3, bars=20)
+
+    reader = get_reader()
+    listener = RecordingListener()
+    reader.register_data_listener(listener)
+    assert len(reader.data_df) == 30
+    assert listener.loaded == 1
+
+    reader.move_on(to_timestamp='2018-01-12', timeout=0)
+    assert len(reader.data_df) == 36
+    assert reader.data_df.index.is_monotonic_increasing
+    assert listener.changed == 1
+    assert listener.entity_changed == {'bench_sz_000000': 2, 'bench_sz_000001': 2, 'bench_sz_000002': 2}
+
+    # no more data
+    reader.move_on(to_timestamp='2018-01-12', timeout=0, poll_interval=0)
+    assert len(reader.data_df) == 36
+    assert listener.changed == 1
+
+
+def test_move_on_with_computing_window(bench_data):
+    bench_data(entity_count=2, bars=20)
+
+    reader = get_reader(computing_window=5)
+    reader.move_on(timeout=0)
+
+    assert len(reader.data_df) == 10
+    assert reader.get_watermarks().tolist() == [pd.Timestamp('2018-01-20')] * 2
+
+
+def test_load_window_df(bench_data):
+    bench_data(entity_count=3, bars=20)
+
+    reader = get_reader()
+    window_df = reader.load_window_df(provider='fake', data_schema=BenchStock1dKdata, window=4)
+    assert len(window_df) == 12
+    assert window_df.index.is_monotonic_increasing
+
+    for entity_id in reader.entity_ids:
+        df = BenchStock1dKdata.query_data(provider='fake', entity_id=entity_id, order=BenchStock1dKdata.timestamp.desc(),
+                                          limit=4, index=['entity_id', 'timestamp'])
+        pd.testing.assert_frame_equal(window_df.loc[[entity_id]], df.sort_index(level=[0, 1]))
+
+    df = BenchStock1dKdata.query_window_data(window=2, provider='fake', columns=['close'],
+                                             end_timestamp='2018-01-05')
+    assert df['timestamp'].tolist() == [pd.Timestamp('2018-01-04'), pd.Timestamp('2018-01-05')] * 3
+    assert set(df.columns) == {'close', 'entity_id', 'timestamp'}
+
+
+def test_load_added_df_with_lagging_entity(bench_data, monkeypatch):
+    bench_data(entity_count=3, bars=20)
+
+    reader = get_reader()
+    watermarks = pd.Series([pd.Timestamp('2018-01-02'), pd.Timestamp('2018-01-10'), pd.Timestamp('2018-01-10')],
+                           index=reader.entity_ids)
+
+    # the rows before the watermark of other entities are not queried
+    df = BenchStock1dKdata.query_data(provider='fake', filters=[reader.get_watermark_filter(watermarks)])
+    assert len(df) == 18 + 10 + 10
+    assert len(reader.load_added_df(watermarks)) == 18 + 10 + 10
+
+    # the bucketed watermarks query more,but the rows got are the same
+    monkeypatch.setattr(reader_module, 'MAX_WATERMARK_GROUPS', 1)
+    df = BenchStock1dKdata.query_data(provider='fake', filters=[reader.get_watermark_filter(watermarks)])
+    assert len(df) == 18 * 3
+    added_df = reader.load_added_df(watermarks, to_timestamp='2018-01-12')
+    assert added_df.groupby(level=0).size().tolist() == [10, 2, 2]
+
+
+def add_kdata(entity_id, timestamp, publish=True):
+    session = get_db_session(provider='fake', data_schema=BenchStock1dKdata)
+    timestamp = pd.Timestamp(timestamp)
+    session.add(BenchStock1dKdata(id=f'{entity_id}_{timestamp.date()}', entity_id=entity_id, timestamp=timestamp,
+                                  provider='fake', level='1d', close=1.0))
+    session.commit()
+    if publish:
+        publish_data_changed(provider='fake', data_schema=BenchStock1dKdata, entity_ids=[entity_id],
+                             timestamp=timestamp)
+
+
+def test_move_on_with_change_notification(bench_data):
+    bench_data(entity_count=2, bars=20)
+
+    reader = get_reader(end_timestamp=None, change_notification='local')
+    listener = RecordingListener()
+    reader.register_data_listener(listener)
+
+    queried = []
+    load_added_df = reader.load_added_df
+
+    def recording_load_added_df(watermarks, to_timestamp=None):
+        queried.append(watermarks.index.tolist())
+        return load_added_df(watermarks, to_timestamp=to_timestamp)
+
+    reader.load_added_df = recording_load_added_df
+
+    timer = threading.Timer(0.1, add_kdata, args=('bench_sz_000001', '2018-01-21'))
+    timer.start()
+    # bench_sz_000000 has no new data and waits until timeout
+    reader.move_on(timeout=1)
+    timer.join()
+    reader.close()
+
+    assert listener.entity_changed == {'bench_sz_000001': 1}
+    # the first query for all,then only the changed one
+    assert queried == [['bench_sz_000000', 'bench_sz_000001'], ['bench_sz_000001']]
+
+
+def test_move_on_with_sqlite_watcher(bench_data):
+    bench_data(entity_count=1, bars=20)
+
+    reader = get_reader(end_timestamp=None, change_notification='sqlite')
+    listener = RecordingListener()
+    reader.register_data_listener(listener)
+
+    timer = threading.Timer(0.3, add_kdata, args=('bench_sz_000000', '2018-01-21'), kwargs={'publish': False})
+    timer.start()
+    reader.move_on(timeout=5)
+    timer.join()
+    reader.close()
+
+    assert listener.entity_changed == {'bench_sz_000000': 1}
+
+
+def test_chunked_data_reader(bench_data):
+    bench_data(entity_count=2, bars=20)
+
+    reader = ChunkedDataReader(data_schema=BenchStock1dKdata, entity_schema=BenchStock, provider='fake',
+                               entity_provider='fake', start_timestamp='2018-01-01', end_timestamp='2018-01-20',
+                               computing_window=7, chunk_size='5D')
+    listener = RecordingListener()
+    reader.register_data_listener(listener)
+    assert len(reader.data_df) == 10
+
+    reader.move_on()
+    assert len(reader.data_df) == 14
+    assert reader.get_watermarks().tolist() == [pd.Timestamp('2018-01-10')] * 2
+
+    reader.move_on(to_timestamp='2018-01-12')
+    assert reader.get_watermarks().tolist() == [pd.Timestamp('2018-01-12')] * 2
+    assert listener.entity_changed == {'bench_sz_000000': 2, 'bench_sz_000001': 2}
+
+    while not reader.finished():
+        reader.move_on()
+        assert len(reader.data_df) <= 14
+    reader.close()
+
+    assert reader.get_watermarks().tolist() == [pd.Timestamp('2018-01-20')] * 2
+    assert reader.data_df.index.get_level_values(1).min() == pd.Timestamp('2018-01-14')
+    assert listener.changed == 4
+
+    with pytest.raises(ValueError, match='start_timestamp'):
+        ChunkedDataReader(data_schema=BenchStock1dKdata, entity_schema=BenchStock, provider='fake',
+                          entity_provider='fake', start_timestamp=None, end_timestamp='2018-01-20')
+
+
+def test_load_snapshot(bench_data):
+    bench_data(entity_count=2, bars=20)
+
+    reader = get_reader(snapshot=True)
+    assert len(reader.data_df) == 20
+
+    # fetch the rows after the snapshot only
+    queried = []
+    query_data = BenchStock1dKdata.query_data
+
+    def recording_query_data(*args, **kwargs):
+        queried.append(kwargs.get('filters'))
+        return query_data(*args, **kwargs)
+
+    BenchStock1dKdata.query_data = recording_query_data
+    try:
+        reader = get_reader(end_timestamp='2018-01-15', snapshot=True)
+    finally:
+        BenchStock1dKdata.query_data = query_data
+    assert len(queried) == 1
+    assert len(reader.data_df) == 30
+    pd.testing.assert_frame_equal(reader.data_df, get_reader(end_timestamp='2018-01-15').data_df)
+
+    # the history is rewritten
+    session = get_db_session(provider='fake', data_schema=BenchStock1dKdata)
+    session.query(BenchStock1dKdata).filter(BenchStock1dKdata.timestamp == pd.Timestamp('2018-01-03')).update(
+        {'close': 0.5}, synchronize_session=False)
+    session.commit()
+    mark_rewritten(provider='fake', data_schema=BenchStock1dKdata, min_timestamp='2018-01-03')
+
+    reader = get_reader(end_timestamp='2018-01-12', snapshot=True)
+    assert len(reader.data_df) == 24
+    assert reader.data_df.xs(pd.Timestamp('2018-01-03'), level=1)['close'].tolist() == [0.5, 0.5]
+
+
+def test_load_snapshot_with_lagging_entity(bench_data):
+    bench_data(entity_count=2, bars=20)
+
+    reader = get_reader(snapshot=True)
+    # the snapshot of bench_sz_000000 ends at 2018-01-03
+    key = reader.get_snapshot_key()
+    df, created_time = load_snapshot(key)
+    df = df[(df.index.get_level_values(0) != 'bench_sz_000000') | (df.index.get_level_values(1) <= '2018-01-03')]
+    save_snapshot(key, df, created_time=created_time)
+
+    queried = []
+    query_data = BenchStock1dKdata.query_data
+
+    def recording_query_data(*args, **kwargs):
+        result = query_data(*args, **kwargs)
+        queried.append(len(result))
+        return result
+
+    BenchStock1dKdata.query_data = recording_query_data
+    try:
+        reader = get_reader(end_timestamp='2018-01-15', snapshot=True)
+    finally:
+        BenchStock1dKdata.query_data = query_data
+    # from the watermark of every entity
+    assert queried == [13 + 6]
+    pd.testing.assert_frame_equal(reader.data_df, get_reader(end_timestamp='2018-01-15').data_df)
+
+
+def test_multi_level_data_reader(bench_data):
+    bench_data(entity_count=2, bars=20)
+
+    # the weekly bars in the same table
+    session = get_db_session(provider='fake', data_schema=BenchStock1dKdata)
+    for entity_id in ('bench_sz_000000', 'bench_sz_000001'):
+        for week in ('2018-01-01', '2018-01-08'):
+            session.add(BenchStock1dKdata(id=f'{entity_id}_{week}_1wk', entity_id=entity_id,
+                                          timestamp=pd.Timestamp(week), provider='fake', level='1wk', close=1.0))
+    session.commit()
+
+    reader = MultiLevelDataReader(level_map_schema={IntervalLevel.LEVEL_1WEEK: BenchStock1dKdata,
+                                                    IntervalLevel.LEVEL_1DAY: BenchStock1dKdata},
+                                  entity_schema=BenchStock, provider='fake', entity_provider='fake',
+                                  start_timestamp='2018-01-01', end_timestamp='2018-01-10')
+    assert reader.levels == [IntervalLevel.LEVEL_1DAY, IntervalLevel.LEVEL_1WEEK]
+    assert len(reader.get_data_df(IntervalLevel.LEVEL_1DAY)) == 20
+    assert len(reader.get_data_df(IntervalLevel.LEVEL_1WEEK)) == 4
+
+    index = reader.get_enclosing_index(IntervalLevel.LEVEL_1DAY, IntervalLevel.LEVEL_1WEEK)
+    assert index.tolist() == [0] * 7 + [1] * 3 + [2] * 7 + [3] * 3
+
+    reader.move_on(to_timestamp='2018-01-16', timeout=0)
+    index = reader.get_enclosing_index(IntervalLevel.LEVEL_1DAY, IntervalLevel.LEVEL_1WEEK)
+    # no weekly bar for 2018-01-15
+    assert index.tolist() == [0] * 7 + [1] * 7 + [-1] * 2 + [2] * 7 + [3] * 7 + [-1] * 2
+
+    # the coarser level without new bar is not waited
+    start_time = time.time()
+    reader.move_on(to_timestamp='2018-01-17', timeout=3, poll_interval=0.1)
+    assert time.time() - start_time < 1
+    assert len(reader.get_data_df(IntervalLevel.LEVEL_1DAY)) == 34
+
+
+def test_move_on_with_thread_dispatch(bench_data):
+    bench_data(entity_count=3, bars=20)
+
+    reader = get_reader(listener_dispatch='thread')
+    listener = RecordingListener()
+    reader.register_data_listener(listener)
+
+    reader.move_on(to_timestamp='2018-01-12', timeout=0)
+    assert reader.wait_listeners(5)
+    assert listener.loaded == 1
+    assert listener.changed == 1
+    assert listener.entity_changed == {'bench_sz_000000': 2, 'bench_sz_000001': 2, 'bench_sz_000002': 2}
+
+    stats = list(reader.listener_stats().values())[0]
+    assert stats['latency']['count'] == 5
+    assert stats['dropped'] == 0
+    reader.close()
+
+
+def test_data_df_cached_with_order(bench_data):
+    bench_data(entity_count=2, bars=20)
+
+    reader = get_reader()
+    df = reader.copy_data_df()
+    df['close'] = 0
+    assert (reader.data_df['close'] != 0).all()
+    # cached until moving on
+    assert reader.data_df is reader.data_df
+    df = reader.data_df
+    reader.move_on(to_timestamp='2018-01-11', timeout=0)
+    assert reader.data_df is not df
+    assert len(reader.data_df) == 22
+
+    reader = DataReader(data_schema=BenchStock1dKdata, entity_schema=BenchStock, provider='fake',
+                        entity_provider='fake', start_timestamp='2018-01-01', end_timestamp='2018-01-10',
+                        order=BenchStock1dKdata.timestamp.desc())
+    assert reader.data_df is reader.data_df
+    timestamps = reader.data_df.index.get_level_values(1)
+    assert timestamps.is_monotonic_decreasing
+    assert len(timestamps) == 20
+    # the rows of the same timestamp keep the entity order
+    assert reader.data_df.index.get_level_values(0)[:2].tolist() == ['bench_sz_000000', 'bench_sz_000001']
@@ -0,0 +1,264 @@
+# -*- coding: utf-8 -*-
+import json
+import os
+import time
+
+import pandas as pd
+import pytest
+from sqlalchemy import create_engine
+
+from tests.benchmark_recorder import BenchStock, BenchStock1dKdata, FakeKdataRecorder
+from tests.fake_provider import FakeKdataProvider
+from zvdata import IntervalLevel, recorder as recorder_module
+from zvdata.contract import get_db_session
+from zvdata.rate_control import TransientError
+from zvdata.recorder import RollupDataRecorder, TimestampsDataRecorder
+from zvdata.utils.pd_utils import pd_is_not_null
+
+
+def pandas_sql_supported() -> bool:
+    try:
+        pd.DataFrame({'a': [1]}).to_sql('t', create_engine('sqlite://'), index=False)
+        return True
+    except Exception:
+        return False
+
+
+# the rolled up bars are saved by df_to_db
+requires_pandas_sql = pytest.mark.skipif(not pandas_sql_supported(),
+                                         reason='pandas could not write with the installed sqlalchemy')
+
+
+class BenchRollupRecorder(RollupDataRecorder):
+    entity_provider = 'fake'
+    entity_schema = BenchStock
+
+    provider = 'fake'
+    data_schema = BenchStock1dKdata
+
+    # the 1m bars are in the same table
+    source_schema = BenchStock1dKdata
+    source_level = IntervalLevel.LEVEL_1MIN
+
+
+def add_minute_kdata(entity_id, start, periods):
+    session = get_db_session(provider='fake', data_schema=BenchStock1dKdata)
+    for timestamp in pd.date_range(start, periods=periods, freq='1min'):
+        value = float(timestamp.minute)
+        session.add(BenchStock1dKdata(id=f'{entity_id}_{timestamp.isoformat()}_1m', entity_id=entity_id,
+                                      timestamp=timestamp, provider='fake', level='1m', open=value, close=value,
+                                      high=value, low=value, volume=1.0, turnover=value))
+    session.commit()
+
+
+def query_rollup_df(level: IntervalLevel, entity_id='bench_sz_000000'):
+    return BenchStock1dKdata.query_data(provider='fake', entity_id=entity_id, level=level, index='timestamp')
+
+
+def run_rollup(level: IntervalLevel):
+    recorder = BenchRollupRecorder(entity_type='bench', exchanges=None, sleeping_time=0, level=level)
+    recorder.run()
+
+
+@requires_pandas_sql
+def test_rollup_to_5m(bench_data):
+    # the 1d bars from 2018-01-01 in the same table are not rolled up
+    bench_data(entity_count=2, bars=3)
+    add_minute_kdata('bench_sz_000000', '2017-12-29 09:31', 10)
+
+    run_rollup(IntervalLevel.LEVEL_5MIN)
+
+    df = query_rollup_df(IntervalLevel.LEVEL_5MIN)
+    assert df.index.tolist() == [pd.Timestamp('2017-12-29 09:35'), pd.Timestamp('2017-12-29 09:40')]
+    assert df['open'].tolist() == [31, 36]
+    assert df['close'].tolist() == [35, 40]
+    assert df['volume'].tolist() == [5, 5]
+    assert len(query_rollup_df(IntervalLevel.LEVEL_1DAY)) == 3
+    # no source data
+    assert not pd_is_not_null(query_rollup_df(IntervalLevel.LEVEL_5MIN, entity_id='bench_sz_000001'))
+
+    # the unfinished bar is rolled up again with the bars added
+    add_minute_kdata('bench_sz_000000', '2017-12-29 09:41', 2)
+    run_rollup(IntervalLevel.LEVEL_5MIN)
+    df = query_rollup_df(IntervalLevel.LEVEL_5MIN)
+    assert df.loc[pd.Timestamp('2017-12-29 09:45'), 'volume'] == 2
+
+    add_minute_kdata('bench_sz_000000', '2017-12-29 09:43', 1)
+    run_rollup(IntervalLevel.LEVEL_5MIN)
+    df = query_rollup_df(IntervalLevel.LEVEL_5MIN)
+    assert len(df) == 3
+    assert df.loc[pd.Timestamp('2017-12-29 09:45'), 'volume'] == 3
+    assert df.loc[pd.Timestamp('2017-12-29 09:45'), 'close'] == 43
+    assert df['volume'].tolist() == [5, 5, 3]
+
+
+@requires_pandas_sql
+def test_rollup_to_1d(bench_data):
+    bench_data(entity_count=1, bars=3)
+    # the 1d bars of the target level are rolled up from the 1m bars only
+    session = get_db_session(provider='fake', data_schema=BenchStock1dKdata)
+    session.query(BenchStock1dKdata).delete()
+    session.commit()
+
+    add_minute_kdata('bench_sz_000000', '2017-12-28 14:56', 4)
+    add_minute_kdata('bench_sz_000000', '2017-12-29 09:31', 3)
+
+    run_rollup(IntervalLevel.LEVEL_1DAY)
+    df = query_rollup_df(IntervalLevel.LEVEL_1DAY)
+    assert df.index.tolist() == [pd.Timestamp('2017-12-28'), pd.Timestamp('2017-12-29')]
+    assert df['close'].tolist() == [59, 33]
+    assert df['high'].tolist() == [59, 33]
+    assert df['low'].tolist() == [56, 31]
+    assert df['volume'].tolist() == [4, 3]
+
+    # the last day is not finished
+    add_minute_kdata('bench_sz_000000', '2017-12-29 09:34', 2)
+    run_rollup(IntervalLevel.LEVEL_1DAY)
+    df = query_rollup_df(IntervalLevel.LEVEL_1DAY)
+    assert df['close'].tolist() == [59, 35]
+    assert df['volume'].tolist() == [4, 5]
+
+
+class FakeClock(object):
+    """
+    the clock moved by sleeping only,it fails if sleeping past the deadline
+    """
+
+    def __init__(self, now, deadline) -> None:
+        self.now = pd.Timestamp(now)
+        self.deadline = pd.Timestamp(deadline)
+
+    def now_pd_timestamp(self) -> pd.Timestamp:
+        return self.now
+
+    def sleep(self, seconds: float):
+        self.now = self.now + pd.Timedelta(seconds=seconds)
+        assert self.now <= self.deadline, f'still running at {self.now}'
+
+
+def test_run_by_schedule_stops_after_last_bar_close(bench_data, monkeypatch):
+    bench_data(entity_count=2, bars=3)
+
+    clock = FakeClock('2018-01-04 10:00', deadline='2018-01-06')
+    monkeypatch.setattr(recorder_module, 'now_pd_timestamp', clock.now_pd_timestamp)
+    monkeypatch.setattr(recorder_module.time, 'sleep', clock.sleep)
+
+    # the bar of 2018-01-04 is published after its close
+    recorder = FakeKdataRecorder(entity_type='bench', exchanges=None, sleeping_time=0, real_time=True)
+    recorder.fake_provider = FakeKdataProvider(bars=4)
+    recorder.run()
+
+    # stopped after the only bar close of the day at 2018-01-05 00:00
+    assert clock.now == pd.Timestamp('2018-01-05') + pd.Timedelta(seconds=recorder.bar_close_delay)
+    df = BenchStock1dKdata.query_data(provider='fake', index=['entity_id', 'timestamp'])
+    assert df.index.get_level_values(1).max() == pd.Timestamp('2018-01-04')
+    assert len(df) == 8
+
+
+class BenchTimestampsRecorder(TimestampsDataRecorder):
+    entity_provider = 'fake'
+    entity_schema = BenchStock
+
+    provider = 'fake'
+    data_schema = BenchStock1dKdata
+
+    timestamps = ['2018-01-05', '2017-12-30', '2018-01-03 12:00', '2018-01-02', '2018-01-03', '2018-01-04']
+
+    def __init__(self) -> None:
+        super().__init__(entity_type='bench', exchanges=None, sleeping_time=0)
+        self.init_count = 0
+
+    def init_timestamps(self, entity_item):
+        self.init_count += 1
+        return self.timestamps
+
+
+def test_timestamps_cache(bench_data):
+    bench_data(entity_count=1, bars=3)
+
+    # no cache file
+    recorder = BenchTimestampsRecorder()
+    entity = recorder.entities[0]
+    timestamps = recorder.get_timestamps(entity)
+    assert recorder.init_count == 1
+    assert pd.DatetimeIndex(timestamps).tolist() == sorted(pd.Timestamp(t) for t in BenchTimestampsRecorder.timestamps)
+    recorder.get_timestamps(entity)
+    assert recorder.init_count == 1
+    recorder.on_finish()
+
+    # cache hit
+    recorder = BenchTimestampsRecorder()
+    assert (recorder.get_timestamps(entity) == timestamps).all()
+    assert recorder.init_count == 0
+
+    # expired
+    path = recorder.get_timestamps_cache_path()
+    with open(path) as f:
+        cache = json.load(f)
+    cache[entity.id]['updated_timestamp'] = time.time() - recorder.timestamps_cache_ttl - 1
+    with open(path, 'w') as f:
+        json.dump(cache, f)
+    recorder = BenchTimestampsRecorder()
+    assert (recorder.get_timestamps(entity) == timestamps).all()
+    assert recorder.init_count == 1
+    recorder.on_finish()
+    with open(path) as f:
+        assert json.load(f)[entity.id]['updated_timestamp'] > time.time() - 60
+
+    # corrupt
+    with open(path, 'w') as f:
+        f.write('{"bench_sz_000000": [')
+    recorder = BenchTimestampsRecorder()
+    assert (recorder.get_timestamps(entity) == timestamps).all()
+    assert recorder.init_count == 1
+    recorder.on_finish()
+    with open(path) as f:
+        assert entity.id in json.load(f)
+
+    # no caching
+    os.remove(path)
+    recorder = BenchTimestampsRecorder()
+    recorder.timestamps_cache_ttl = None
+    recorder.get_timestamps(entity)
+    recorder.on_finish()
+    assert not os.path.exists(path)
+
+
+def test_timestamps_after_latest_record(bench_data):
+    # the 1d bars saved from 2018-01-01 to 2018-01-03
+    bench_data(entity_count=1, bars=3)
+
+    recorder = BenchTimestampsRecorder()
+    entity = recorder.entities[0]
+    start, end, size, timestamps = recorder.evaluate_start_end_size_timestamps(entity)
+    assert timestamps == [pd.Timestamp('2018-01-03 12:00'), pd.Timestamp('2018-01-04'), pd.Timestamp('2018-01-05')]
+    assert (start, end, size) == (pd.Timestamp('2018-01-03 12:00'), pd.Timestamp('2018-01-05'), 3)
+
+    # all recorded
+    recorder = BenchTimestampsRecorder()
+    recorder.timestamps = ['2017-12-30', '2018-01-02', '2018-01-03']
+    assert recorder.evaluate_start_end_size_timestamps(entity) == (None, None, 0, None)
+
+
+def test_request_without_adaptive_rate(bench_data):
+    bench_data(entity_count=1, bars=3)
+
+    calls = []
+
+    def failing_request():
+        calls.append(1)
+        raise TransientError('fake transient error')
+
+    recorder = FakeKdataRecorder(entity_type='bench', exchanges=None, sleeping_time=0)
+    recorder.adaptive_rate = False
+    # called directly without retrying and the circuit breaker
+    with pytest.raises(TransientError):
+        recorder.request(failing_request)
+    assert len(calls) == 1
+    assert recorder.circuit_breaker.failures == 0
+
+    recorder.adaptive_rate = True
+    with pytest.raises(TransientError):
+        recorder.request(failing_request)
+    assert len(calls) == 2 + recorder.max_retries
+    recorder.circuit_breaker.on_success()
@@ -0,0 +1,63 @@
+# -*- coding: utf-8 -*-
+import numpy as np
+import pandas as pd
+
+from zvdata.ring_buffer import RingBuffer, EntityRingBuffers
+
+
+def make_df(entity_ids, start, periods):
+    dfs = []
+    for entity_id in entity_ids:
+        timestamps = pd.date_range(start, periods=periods)
+        dfs.append(pd.DataFrame({'entity_id': entity_id, 'timestamp': timestamps,
+                                 'close': np.arange(periods, dtype=float) + timestamps.day.values},
+                                index=pd.MultiIndex.from_arrays([[entity_id] * periods, timestamps],
+                                                                names=['entity_id', 'timestamp'])))
+    return pd.concat(dfs)
+
+
+def test_ring_buffer_wrap():
+    buffer = RingBuffer(capacity=5, initial_size=2)
+    for i in range(12):
+        buffer.append(np.array([np.datetime64('2019-01-01') + i]), {'close': np.array([float(i)])})
+        assert len(buffer) == min(i + 1, 5)
+        assert buffer.physical_size() <= 5
+
+    timestamps, columns = buffer.to_arrays()
+    assert columns['close'].tolist() == [7.0, 8.0, 9.0, 10.0, 11.0]
+    assert buffer.latest_timestamp() == np.datetime64('2019-01-12')
+
+
+def test_ring_buffer_unbounded_and_untrimmed():
+    buffer = RingBuffer(capacity=3, initial_size=1)
+    timestamps = np.arange('2019-01-01', '2019-01-11', dtype='datetime64[D]')
+    buffer.append(timestamps, {'close': np.arange(10)}, trim=False)
+    assert len(buffer) == 10
+
+    # int column is promoted to float
+    buffer.append(np.array([np.datetime64('2019-01-11')]), {'close': np.array([10.5])})
+    assert len(buffer) == 3
+    assert buffer.to_arrays()[1]['close'].tolist() == [8.0, 9.0, 10.5]
+
+
+def test_ring_buffer_out_of_order():
+    buffer = RingBuffer()
+    buffer.append(np.array(['2019-01-03', '2019-01-01'], dtype='datetime64[D]'), {'close': np.array([3, 1])})
+    buffer.append(np.array(['2019-01-02'], dtype='datetime64[D]'), {'close': np.array([2])})
+    assert buffer.to_arrays()[1]['close'].tolist() == [1, 2, 3]
+    assert buffer.latest_timestamp() == np.datetime64('2019-01-03')
+
+
+def test_entity_ring_buffers():
+    df = make_df(['a', 'b'], '2019-01-01', 10)
+    store = EntityRingBuffers(capacity=4)
+    store.append_df(df, trim=False)
+    pd.testing.assert_frame_equal(store.to_df(), df, check_freq=False)
+
+    store.trim()
+    added = make_df(['b', 'a'], '2019-01-11', 2)
+    store.append_df(added)
+
+    expected = pd.concat([df, added]).sort_index(level=[0, 1]).groupby(level=0).tail(4)
+    pd.testing.assert_frame_equal(store.to_df(), expected, check_freq=False)
+    assert store.watermarks().tolist() == [pd.Timestamp('2019-01-12')] * 2
@@ -0,0 +1,49 @@
+# -*- coding: utf-8 -*-
+import pandas as pd
+
+from zvdata import IntervalLevel
+from zvdata.scheduler import BarCloseScheduler
+
+CHINA_SESSIONS = [('09:30', '11:30'), ('13:00', '15:00')]
+
+
+def test_next_bar_close_with_sessions():
+    scheduler = BarCloseScheduler(level=IntervalLevel.LEVEL_30MIN, sessions=CHINA_SESSIONS)
+
+    assert scheduler.next_bar_close('2019-10-08 09:00') == pd.Timestamp('2019-10-08 10:00')
+    assert scheduler.next_bar_close('2019-10-08 10:00') == pd.Timestamp('2019-10-08 10:30')
+    # lunch break
+    assert scheduler.next_bar_close('2019-10-08 11:30') == pd.Timestamp('2019-10-08 13:30')
+    # next day
+    assert scheduler.next_bar_close('2019-10-08 15:00') == pd.Timestamp('2019-10-09 10:00')
+    assert scheduler.last_bar_close_of_day('2019-10-08 10:00') == pd.Timestamp('2019-10-08 15:00')
+
+    # the last bar of the session is shorter
+    scheduler = BarCloseScheduler(level=IntervalLevel.LEVEL_1HOUR, sessions=[('09:30', '11:00')])
+    assert scheduler.bar_closes_of_day(pd.Timestamp('2019-10-08')) == [pd.Timestamp('2019-10-08 10:30'),
+                                                                       pd.Timestamp('2019-10-08 11:00')]
+
+    scheduler = BarCloseScheduler(level=IntervalLevel.LEVEL_1DAY, sessions=CHINA_SESSIONS)
+    assert scheduler.next_bar_close('2019-10-08 09:00') == pd.Timestamp('2019-10-08 15:00')
+
+
+def test_next_bar_close_without_sessions():
+    scheduler = BarCloseScheduler(level=IntervalLevel.LEVEL_5MIN)
+    assert scheduler.next_bar_close('2019-10-08 09:31:20') == pd.Timestamp('2019-10-08 09:35')
+    assert scheduler.next_bar_close('2019-10-08 23:58') == pd.Timestamp('2019-10-09 00:00')
+
+    scheduler = BarCloseScheduler(level=IntervalLevel.LEVEL_1DAY)
+    assert scheduler.next_bar_close('2019-10-08 09:31:20') == pd.Timestamp('2019-10-09 00:00')
+
+
+def test_pop_due():
+    scheduler = BarCloseScheduler(level=IntervalLevel.LEVEL_5MIN, delay=3)
+    scheduler.schedule('b', pd.Timestamp('2019-10-08 09:35:03'))
+    scheduler.schedule('a', pd.Timestamp('2019-10-08 09:30:03'))
+    scheduler.schedule('c', pd.Timestamp('2019-10-08 09:35:03'))
+
+    assert scheduler.next_due_time() == pd.Timestamp('2019-10-08 09:30:03')
+    assert scheduler.pop_due(pd.Timestamp('2019-10-08 09:30:00')) == []
+    assert scheduler.pop_due(pd.Timestamp('2019-10-08 09:31:00')) == ['a']
+    assert scheduler.pop_due(pd.Timestamp('2019-10-08 09:40:00')) == ['b', 'c']
+    assert len(scheduler) == 0
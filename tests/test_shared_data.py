@@ -0,0 +1,122 @@
+# -*- coding: utf-8 -*-
+import pandas as pd
+
+from tests.benchmark_recorder import BenchStock, BenchStock1dKdata
+from zvdata.reader import DataReader
+from zvdata.shared_data import SharedDataPublisher, SharedDataReader
+
+
+def test_shared_data(bench_data):
+    bench_data(entity_count=2, bars=20)
+
+    reader = DataReader(data_schema=BenchStock1dKdata, entity_schema=BenchStock, provider='fake',
+                        entity_provider='fake', start_timestamp='2018-01-01', end_timestamp='2018-01-10')
+    publisher = SharedDataPublisher(name='test_shared_data', initial_capacity=16)
+    reader.register_data_listener(publisher)
+
+    try:
+        shared_reader = SharedDataReader(name='test_shared_data')
+        assert shared_reader.version == 1
+        df = shared_reader.to_df()
+        assert len(df) == 20
+        pd.testing.assert_series_equal(df['close'], reader.data_df['close'])
+
+        # the views are read only
+        arrays = shared_reader.get_arrays()
+        assert not arrays['close'].flags.writeable
+
+        reader.move_on(to_timestamp='2018-01-15', timeout=0)
+        assert shared_reader.refresh()
+        # one version for the rows of one move_on
+        assert shared_reader.version == 2
+        assert shared_reader.rows == 30
+        pd.testing.assert_series_equal(shared_reader.to_df()['close'], reader.data_df['close'])
+        assert shared_reader.to_df()['entity_id'].tolist() == reader.data_df['entity_id'].tolist()
+    finally:
+        publisher.destroy()
+
+
+def make_df(entity_ids, start, periods):
+    timestamps = pd.date_range(start, periods=periods)
+    df = pd.DataFrame({'entity_id': [entity_id for entity_id in entity_ids for _ in timestamps],
+                       'timestamp': list(timestamps) * len(entity_ids)})
+    df['close'] = range(len(df))
+    df['close'] = df['close'].astype(float)
+    return df.set_index(['entity_id', 'timestamp'], drop=False)
+
+
+def test_append_added_data():
+    publisher = SharedDataPublisher(name='test_added_data', initial_capacity=4)
+    try:
+        publisher.on_data_loaded(make_df(['a'], '2018-01-01', 2))
+        shared_reader = SharedDataReader(name='test_added_data')
+
+        # the rows published before are skipped,the new entity is appended
+        data = pd.concat([make_df(['a'], '2018-01-01', 3), make_df(['b'], '2018-01-02', 1)])
+        publisher.on_data_changed(data)
+        assert shared_reader.refresh()
+        assert shared_reader.version == 2
+        assert shared_reader.to_df()['timestamp'].tolist() == [pd.Timestamp(t) for t in
+                                                               ['2018-01-01', '2018-01-02', '2018-01-03',
+                                                                '2018-01-02']]
+
+        publisher.on_data_changed(data)
+        assert not shared_reader.refresh()
+    finally:
+        publisher.destroy()
+
+
+def test_republish():
+    publisher = SharedDataPublisher(name='test_republish', initial_capacity=4)
+    try:
+        publisher.publish(make_df(['a'], '2018-01-01', 2))
+        shared_reader = SharedDataReader(name='test_republish')
+        version = shared_reader.version
+
+        publisher.publish(make_df(['b'], '2018-01-01', 3))
+        assert shared_reader.refresh()
+        assert shared_reader.version > version
+        assert shared_reader.entities() == ['b']
+        assert shared_reader.to_df()['close'].tolist() == [0.0, 1.0, 2.0]
+
+        # the version goes on in the new publisher
+        version = shared_reader.version
+        SharedDataPublisher(name='test_republish').publish(make_df(['c'], '2018-01-01', 1))
+        assert shared_reader.refresh()
+        assert shared_reader.version > version
+        assert shared_reader.entities() == ['c']
+    finally:
+        publisher.destroy()
+
+
+def test_refresh_with_reallocating_append():
+    publisher = SharedDataPublisher(name='test_reallocating', initial_capacity=2)
+    try:
+        publisher.publish(make_df(['a'], '2018-01-01', 2))
+        shared_reader = SharedDataReader(name='test_reallocating')
+        read_header = shared_reader.read_header
+
+        def interleaved_read_header(appends):
+            def the_read_header():
+                header = read_header()
+                # the publisher reallocates after the header read
+                for _ in range(appends.pop(0) if appends else 0):
+                    publisher.append(make_df(['a'], '2018-02-01', publisher.capacity))
+                return header
+
+            return the_read_header
+
+        # the files of the previous generation are kept
+        publisher.append(make_df(['b'], '2018-01-01', 1))
+        shared_reader.read_header = interleaved_read_header([1])
+        assert shared_reader.refresh()
+        assert shared_reader.rows == 3
+        assert shared_reader.to_df()['close'].tolist() == [0.0, 1.0, 0.0]
+
+        # the generation read is removed,refresh to the latest one
+        shared_reader.read_header = interleaved_read_header([2])
+        assert shared_reader.refresh()
+        assert shared_reader.version == publisher.version
+        assert shared_reader.rows == publisher.rows
+    finally:
+        publisher.destroy()
@@ -0,0 +1,43 @@
+# -*- coding: utf-8 -*-
+import os
+
+import pandas as pd
+
+from tests.benchmark_recorder import BenchStock1dKdata
+from zvdata import snapshot
+from zvdata.snapshot import mark_rewritten, get_rewritten_timestamp, enable_rewrite_tracking, \
+    get_rewrite_state_path
+
+
+def test_mark_rewritten_only_if_enabled(bench_env):
+    mark_rewritten(provider='fake', data_schema=BenchStock1dKdata, min_timestamp='2018-01-03')
+    assert not os.path.exists(get_rewrite_state_path('fake', BenchStock1dKdata))
+    assert get_rewritten_timestamp('fake', BenchStock1dKdata, since=0) is None
+
+    enable_rewrite_tracking('fake', BenchStock1dKdata)
+    assert get_rewritten_timestamp('fake', BenchStock1dKdata, since=0) is None
+
+    mark_rewritten(provider='fake', data_schema=BenchStock1dKdata, min_timestamp='2018-01-03')
+    assert get_rewritten_timestamp('fake', BenchStock1dKdata, since=0) == pd.Timestamp('2018-01-03')
+
+
+def test_compact_rewrites(bench_env, monkeypatch):
+    monkeypatch.setattr(snapshot, 'MAX_REWRITE_ENTRIES', 4)
+    enable_rewrite_tracking('fake', BenchStock1dKdata)
+
+    times = []
+    for timestamp in pd.date_range('2018-01-01', periods=10):
+        mark_rewritten(provider='fake', data_schema=BenchStock1dKdata, min_timestamp=timestamp)
+        times.append(snapshot._load_rewrites(get_rewrite_state_path('fake', BenchStock1dKdata))[-1][0])
+
+    rewrites = snapshot._load_rewrites(get_rewrite_state_path('fake', BenchStock1dKdata))
+    assert len(rewrites) == 4
+    # the merged entries never invalidate less
+    for the_time, timestamp in zip(times, pd.date_range('2018-01-01', periods=10)):
+        assert get_rewritten_timestamp('fake', BenchStock1dKdata, since=the_time) <= timestamp
+    assert get_rewritten_timestamp('fake', BenchStock1dKdata, since=times[-1]) == pd.Timestamp('2018-01-10')
+
+    # the earlier entries are covered by the smaller timestamp
+    mark_rewritten(provider='fake', data_schema=BenchStock1dKdata, min_timestamp='2017-12-31')
+    rewrites = snapshot._load_rewrites(get_rewrite_state_path('fake', BenchStock1dKdata))
+    assert [timestamp for _, timestamp in rewrites] == [pd.Timestamp('2017-12-31')]
@@ -0,0 +1,87 @@
+# -*- coding: utf-8 -*-
+import numpy as np
+import pandas as pd
+
+from tests.benchmark_time_utils import make_timestamps, run_benchmark
+from zvdata import IntervalLevel
+from zvdata.utils.time_utils import to_pd_timestamp, to_pd_timestamps, to_time_str, to_time_strs, \
+    TIME_FORMAT_DAY, TIME_FORMAT_DAY1, TIME_FORMAT_ISO8601, TIME_FORMAT_MINUTE, TIME_FORMAT_MINUTE1, \
+    TIME_FORMAT_MINUTE2, next_timestamp, next_timestamps, floor_timestamps, is_in_same_interval, \
+    same_interval_mask, is_finished_kdata_timestamp, is_finished_kdata_timestamps, to_bar_timestamps, _iso_weeks
+
+INTRADAY_LEVELS = [IntervalLevel.LEVEL_1MIN, IntervalLevel.LEVEL_5MIN, IntervalLevel.LEVEL_15MIN,
+                   IntervalLevel.LEVEL_30MIN, IntervalLevel.LEVEL_1HOUR, IntervalLevel.LEVEL_4HOUR]
+
+
+def get_timestamps():
+    # with ms
+    return make_timestamps(500) + pd.to_timedelta(np.arange(500) * 7, unit='ms')
+
+
+def test_to_pd_timestamps():
+    timestamps = get_timestamps()
+
+    ms = (timestamps.asi8 // 1000000).tolist()
+    assert to_pd_timestamps(np.array(ms)).to_list() == [to_pd_timestamp(t) for t in ms]
+
+    seconds = [t / 1000 for t in ms[:10]]
+    assert to_pd_timestamps(np.array(seconds)).to_list() == [to_pd_timestamp(t) for t in seconds]
+
+    strs = ['2019-10-01', '2019-10-01 10:00:00', '20191001']
+    assert to_pd_timestamps(strs).to_list() == [to_pd_timestamp(t) for t in strs]
+
+
+def test_to_time_strs():
+    timestamps = get_timestamps()
+    for fmt in (TIME_FORMAT_DAY, TIME_FORMAT_DAY1, TIME_FORMAT_ISO8601, TIME_FORMAT_MINUTE, TIME_FORMAT_MINUTE1,
+                TIME_FORMAT_MINUTE2):
+        assert to_time_strs(timestamps, fmt=fmt).tolist() == [to_time_str(t, fmt=fmt) for t in timestamps]
+
+    assert to_time_strs(pd.DatetimeIndex(['2019-10-01', None])).tolist() == ['2019-10-01', None]
+
+
+def test_floor_timestamps():
+    timestamps = get_timestamps()
+    for level in IntervalLevel:
+        # None of the scalar is NaT
+        assert floor_timestamps(timestamps, level).to_list() == [
+            pd.NaT if level.floor_timestamp(t) is None else level.floor_timestamp(t) for t in timestamps]
+
+    for level in INTRADAY_LEVELS + [IntervalLevel.LEVEL_1DAY]:
+        assert next_timestamps(timestamps, level).to_list() == [next_timestamp(t, level) for t in timestamps]
+
+    for level in INTRADAY_LEVELS + [IntervalLevel.LEVEL_1DAY, IntervalLevel.LEVEL_1WEEK, IntervalLevel.LEVEL_TICK]:
+        assert is_finished_kdata_timestamps(timestamps, level).tolist() == [is_finished_kdata_timestamp(t, level)
+                                                                            for t in timestamps]
+
+    assert to_bar_timestamps(['2019-10-08 09:31', '2019-10-08 09:35'], IntervalLevel.LEVEL_5MIN).to_list() == [
+        pd.Timestamp('2019-10-08 09:35'), pd.Timestamp('2019-10-08 09:35')]
+    assert to_bar_timestamps(['2019-10-10'], IntervalLevel.LEVEL_1WEEK).to_list() == [pd.Timestamp('2019-10-07')]
+    assert to_bar_timestamps(['2019-10-10'], IntervalLevel.LEVEL_1MON).to_list() == [pd.Timestamp('2019-10-01')]
+
+
+def test_same_interval_mask():
+    timestamps = get_timestamps()
+    others = timestamps + pd.Timedelta(minutes=17)
+    for level in INTRADAY_LEVELS + [IntervalLevel.LEVEL_1DAY, IntervalLevel.LEVEL_1WEEK, IntervalLevel.LEVEL_1MON]:
+        assert same_interval_mask(timestamps, others, level).tolist() == [is_in_same_interval(t1, t2, level) for
+                                                                          t1, t2 in zip(timestamps, others)]
+
+    # across the weeks and years
+    timestamps = pd.date_range('2018-12-20', '2019-01-20')
+    others = timestamps + pd.Timedelta(days=3)
+    assert same_interval_mask(timestamps, others, IntervalLevel.LEVEL_1WEEK).tolist() == [
+        is_in_same_interval(t1, t2, IntervalLevel.LEVEL_1WEEK) for t1, t2 in zip(timestamps, others)]
+
+
+def test_iso_weeks_without_isocalendar():
+    class OldDatetimeIndex(object):
+        # pandas < 1.1
+        week = pd.Index([1, 52])
+
+    assert _iso_weeks(OldDatetimeIndex()).tolist() == [1, 52]
+
+
+def test_benchmark_time_utils():
+    result = run_benchmark(size=1000)
+    assert result['to_time_str_day']['speedup'] > 1
@@ -0,0 +1,88 @@
+# -*- coding: utf-8 -*-
+import json
+
+import numpy as np
+import pandas as pd
+
+from zvdata import IntervalLevel
+from zvdata.normal_data import NormalData
+from zvdata.scheduler import BarCloseScheduler
+from zvdata.trading_calendar import TradingCalendar
+from zvdata.utils.time_utils import evaluate_size_from_timestamp
+
+CHINA_SESSIONS = [('09:30', '11:30'), ('13:00', '15:00')]
+HOLIDAYS = ['2019-10-01', '2019-10-02', '2019-10-03', '2019-10-04', '2019-10-07']
+
+
+def get_calendar():
+    return TradingCalendar(sessions=CHINA_SESSIONS, holidays=HOLIDAYS)
+
+
+def test_trading_days():
+    calendar = get_calendar()
+    assert calendar.trading_days('2019-09-28', '2019-10-08').to_list() == [pd.Timestamp('2019-09-30'),
+                                                                          pd.Timestamp('2019-10-08')]
+    assert not calendar.is_trading_day('2019-10-01')
+    assert calendar.is_trading_time('2019-09-30 10:00')
+    assert not calendar.is_trading_time('2019-09-30 12:00')
+
+
+def test_bar_timestamps():
+    calendar = get_calendar()
+
+    timestamps = calendar.bar_timestamps('2019-09-30 11:00', '2019-10-08 10:10', IntervalLevel.LEVEL_30MIN)
+    assert timestamps.to_list() == [pd.Timestamp(t) for t in
+                                    ['2019-09-30 11:00', '2019-09-30 11:30', '2019-09-30 13:30', '2019-09-30 14:00',
+                                     '2019-09-30 14:30', '2019-09-30 15:00', '2019-10-08 10:00',
+                                     '2019-10-08 10:30']]
+
+    timestamps = calendar.bar_timestamps('2019-09-30 11:00', '2019-09-30 13:10', IntervalLevel.LEVEL_1HOUR,
+                                         kdata_use_begin_time=True)
+    assert timestamps.to_list() == [pd.Timestamp('2019-09-30 10:30'), pd.Timestamp('2019-09-30 13:00')]
+
+    timestamps = calendar.bar_timestamps('2019-09-01', '2019-10-08', IntervalLevel.LEVEL_1MON)
+    assert timestamps.to_list() == [pd.Timestamp('2019-09-01'), pd.Timestamp('2019-10-01')]
+
+
+def test_count_bars():
+    calendar = get_calendar()
+
+    # 4 hours a day
+    assert calendar.count_bars('2019-09-30 09:30', '2019-09-30 15:00', IntervalLevel.LEVEL_1MIN) == 240
+    # the lunch break
+    assert calendar.count_bars('2019-09-30 11:30', '2019-09-30 12:30', IntervalLevel.LEVEL_5MIN) == 1
+    assert calendar.count_bars('2019-09-30 11:30', '2019-09-30 13:01', IntervalLevel.LEVEL_5MIN) == 2
+    # the holidays
+    assert calendar.count_bars('2019-09-30 15:00', '2019-10-08 09:31', IntervalLevel.LEVEL_5MIN) == 2
+    assert calendar.count_bars('2019-09-30', '2019-10-08', IntervalLevel.LEVEL_1DAY) == 2
+    assert calendar.count_bars('2019-09-23', '2019-10-08', IntervalLevel.LEVEL_1WEEK) == 3
+
+    counts = calendar.count_bars(['2019-09-02', '2019-09-30', '2019-10-08'], '2019-10-08', IntervalLevel.LEVEL_1DAY)
+    assert np.array_equal(counts, [22, 2, 1])
+
+    assert evaluate_size_from_timestamp('2019-09-30', level=IntervalLevel.LEVEL_1DAY, one_day_trading_minutes=240,
+                                        end_timestamp='2019-10-08', trading_calendar=calendar) == 2
+
+
+def test_calendar_from_file(tmp_path):
+    path = tmp_path / 'cn.json'
+    path.write_text(json.dumps({'sessions': CHINA_SESSIONS, 'holidays': HOLIDAYS}))
+
+    calendar = TradingCalendar.from_file(str(path))
+    assert calendar.name == 'cn'
+    assert calendar.count_bars('2019-09-30', '2019-10-08', IntervalLevel.LEVEL_1DAY) == 2
+
+
+def test_scheduler_with_calendar():
+    scheduler = BarCloseScheduler(level=IntervalLevel.LEVEL_30MIN, trading_calendar=get_calendar())
+    assert scheduler.next_bar_close('2019-09-30 15:00') == pd.Timestamp('2019-10-08 10:00')
+    assert scheduler.bar_closes_of_day(pd.Timestamp('2019-10-01')) == []
+
+
+def test_normal_data_target_index():
+    df = pd.DataFrame({'entity_id': ['a', 'a'], 'timestamp': pd.to_datetime(['2019-09-27', '2019-10-08']),
+                       'close': [1., 2.]})
+    target_index = get_calendar().bar_timestamps('2019-09-27', '2019-10-08', IntervalLevel.LEVEL_1DAY)
+    normal_data = NormalData(df, fill_index=True, target_index=target_index)
+    assert normal_data.df_list[0].index.to_list() == [pd.Timestamp('2019-09-27'), pd.Timestamp('2019-09-30'),
+                                                      pd.Timestamp('2019-10-08')]
@@ -0,0 +1,52 @@
+# -*- coding: utf-8 -*-
+from zvdata.utils.utils import compile_field_mapper, fill_domain_from_dict, to_float, first_item_to_float
+
+
+class Domain(object):
+    pass
+
+
+def test_compile_field_mapper():
+    the_map = {
+        'close': ('收盘', to_float),
+        'volume': ('成交量', to_float),
+        'name': '名称',
+        'first': ('items', first_item_to_float)
+    }
+    mapper = compile_field_mapper(the_map)
+
+    domain = Domain()
+    mapper(domain, {'收盘': '1.5万', '成交量': '--', '名称': 'abc', 'items': ['2', '3']})
+    assert domain.close == 15000
+    assert domain.volume is None
+    assert domain.name == 'abc'
+    assert domain.first == 2
+
+    # the missing fields are not touched
+    domain = Domain()
+    mapper(domain, {'收盘': '1'})
+    assert domain.close == 1
+    assert not hasattr(domain, 'name')
+
+    domain1 = Domain()
+    fill_domain_from_dict(domain1, {'收盘': '1'}, the_map)
+    assert domain1.__dict__ == domain.__dict__
+
+
+def test_compile_field_mapper_without_map():
+    domain = Domain()
+    compile_field_mapper({})(domain, {'a': 1, 'b': '-', 'c': None})
+    assert domain.__dict__ == {'a': 1, 'b': None}
+
+
+def test_compile_field_mapper_with_keyword():
+    # the keyword and the invalid identifier are set by setattr
+    the_map = {'class': '类别', 'from': '来源', 'a-b': 'ab'}
+    the_dict = {'类别': 'A', '来源': '-', 'ab': 1}
+    domain = Domain()
+    compile_field_mapper(the_map)(domain, the_dict)
+    assert domain.__dict__ == {'class': 'A', 'from': None, 'a-b': 1}
+
+    domain1 = Domain()
+    fill_domain_from_dict(domain1, the_dict, the_map)
+    assert domain1.__dict__ == domain.__dict__
@@ -37,10 +37,14 @@ class IntervalLevel(enum.Enum):
         if self >= IntervalLevel.LEVEL_1DAY:
             return '1D'
 
-    def count_from_timestamp(self, pd_timestamp, one_day_trading_minutes):
+    def count_from_timestamp(self, pd_timestamp, one_day_trading_minutes, trading_calendar=None):
         current_time = pd.Timestamp.now()
         time_delta = current_time - pd_timestamp
 
+        # the exact count in the trading sessions
+        if trading_calendar:
+            return None, trading_calendar.count_bars(pd_timestamp, current_time, level=self)
+
         one_day_trading_seconds = one_day_trading_minutes * 60
 
         if self == IntervalLevel.LEVEL_1DAY:
@@ -199,6 +203,29 @@ class Mixin(object):
                         start_timestamp=start_timestamp, end_timestamp=end_timestamp, filters=filters, session=session,
                         order=order, limit=limit, index=index, time_field=time_field)
 
+    @classmethod
+    def query_window_data(cls,
+                          window: int,
+                          provider_index: int = 0,
+                          entity_ids: List[str] = None,
+                          level: Union[IntervalLevel, str] = None,
+                          provider: str = None,
+                          columns: List = None,
+                          start_timestamp: Union[pd.Timestamp, str] = None,
+                          end_timestamp: Union[pd.Timestamp, str] = None,
+                          filters: List = None,
+                          session: Session = None,
+                          index: Union[str, list] = None,
+                          category_field: str = 'entity_id',
+                          time_field: str = 'timestamp'):
+        from .api import get_window_data
+        if not provider:
+            provider = cls.providers[provider_index]
+        return get_window_data(data_schema=cls, window=window, entity_ids=entity_ids, level=level, provider=provider,
+                               columns=columns, start_timestamp=start_timestamp, end_timestamp=end_timestamp,
+                               filters=filters, session=session, index=index, category_field=category_field,
+                               time_field=time_field)
+
     @classmethod
     def record_data(cls,
                     provider_index: int = 0,
@@ -2,13 +2,15 @@
 from typing import List, Union
 
 import pandas as pd
-from sqlalchemy import func, exists, and_
+from sqlalchemy import func, exists, and_, select
 from sqlalchemy.ext.declarative import DeclarativeMeta
 from sqlalchemy.orm import Query, Session
 
 from zvdata import IntervalLevel, EntityMixin
 from zvdata.contract import get_db_session, get_db_engine, global_entity_schema, global_providers, \
     get_schema_columns
+from zvdata.notify import publish_df_changed
+from zvdata.snapshot import mark_rewritten
 from zvdata.utils.pd_utils import pd_is_not_null, index_df
 from zvdata.utils.time_utils import to_pd_timestamp
 
@@ -44,7 +46,10 @@ def common_filter(query: Query,
     if filters:
         for filter in filters:
             query = query.filter(filter)
-    if order is not None:
+    # support multiple columns
+    if type(order) == list:
+        query = query.order_by(*order)
+    elif order is not None:
         query = query.order_by(order)
     else:
         query = query.order_by(time_col.asc())
@@ -120,6 +125,14 @@ def get_data(data_schema,
         except Exception as e:
             pass
 
+    # order by the index,so the df needn't be sorted again
+    presorted = False
+    if return_type == 'df' and index and order is None and not limit:
+        index_cols = [index] if type(index) == str else index
+        if all(hasattr(data_schema, col) for col in index_cols):
+            order = [getattr(data_schema, col).asc() for col in index_cols]
+            presorted = True
+
     query = common_filter(query, data_schema=data_schema, start_timestamp=start_timestamp,
                           end_timestamp=end_timestamp, filters=filters, order=order, limit=limit,
                           time_field=time_field)
@@ -128,7 +141,7 @@ def get_data(data_schema,
         df = pd.read_sql(query.statement, query.session.bind)
         if pd_is_not_null(df):
             if index:
-                df = index_df(df, index=index, time_field=time_field)
+                df = index_df(df, index=index, time_field=time_field, presorted=presorted)
         return df
     elif return_type == 'domain':
         return query.all()
@@ -136,6 +149,172 @@ def get_data(data_schema,
         return [item.__dict__ for item in query.all()]
 
 
+def get_window_data(data_schema,
+                    window: int,
+                    entity_ids: List[str] = None,
+                    level: Union[IntervalLevel, str] = None,
+                    provider: str = None,
+                    columns: List = None,
+                    start_timestamp: Union[pd.Timestamp, str] = None,
+                    end_timestamp: Union[pd.Timestamp, str] = None,
+                    filters: List = None,
+                    session: Session = None,
+                    index: Union[str, list] = None,
+                    category_field: str = 'entity_id',
+                    time_field: str = 'timestamp'):
+    """
+    get the latest window rows of every entity in one query,
+    ROW_NUMBER() OVER (PARTITION BY category ORDER BY time DESC) <= window
+
+    the result is ordered by (category,time)
+    """
+    assert data_schema is not None
+    assert provider is not None
+    assert provider in global_providers
+
+    if not session:
+        session = get_db_session(provider=provider, data_schema=data_schema)
+
+    category_col = eval('data_schema.{}'.format(category_field))
+    time_col = eval('data_schema.{}'.format(time_field))
+
+    if columns:
+        # support str
+        if type(columns[0]) == str:
+            columns = [getattr(data_schema, col) for col in columns]
+        columns = list(columns)
+        for col in (category_col, time_col):
+            if col not in columns:
+                columns.append(col)
+    else:
+        columns = [data_schema]
+
+    row_number = func.row_number().over(partition_by=category_col, order_by=time_col.desc()).label('row_number')
+    query = session.query(*columns, row_number)
+
+    if entity_ids:
+        query = query.filter(category_col.in_(entity_ids))
+
+    if level:
+        try:
+            # some schema has no level,just ignore it
+            data_schema.level
+            if type(level) == IntervalLevel:
+                level = level.value
+            query = query.filter(data_schema.level == level)
+        except Exception as e:
+            pass
+
+    if start_timestamp:
+        query = query.filter(time_col >= to_pd_timestamp(start_timestamp))
+    if end_timestamp:
+        query = query.filter(time_col <= to_pd_timestamp(end_timestamp))
+    if filters:
+        for filter in filters:
+            query = query.filter(filter)
+
+    sub_query = query.subquery()
+    statement = select([col for col in sub_query.c if col.name != 'row_number']) \
+        .where(sub_query.c.row_number <= window) \
+        .order_by(sub_query.c[category_col.name], sub_query.c[time_col.name])
+
+    df = pd.read_sql(statement, session.bind)
+    if pd_is_not_null(df):
+        if index:
+            df = index_df(df, index=index, time_field=time_field, presorted=index == [category_field, time_field])
+    return df
+
+
+def get_data_asof(data_schema,
+                  timestamp: Union[pd.Timestamp, str],
+                  entity_ids: List[str] = None,
+                  provider: str = None,
+                  columns: List = None,
+                  filters: List = None,
+                  level: Union[IntervalLevel, str] = None,
+                  session: Session = None,
+                  index: Union[str, list] = None,
+                  category_field: str = 'entity_id',
+                  time_field: str = 'timestamp'):
+    """
+    the latest row of every entity at timestamp(time <= timestamp) in one query
+
+    """
+    return get_window_data(data_schema=data_schema, window=1, entity_ids=entity_ids, level=level, provider=provider,
+                           columns=columns, end_timestamp=timestamp, filters=filters, session=session, index=index,
+                           category_field=category_field, time_field=time_field)
+
+
+def get_data_asof_panel(data_schema,
+                        timestamps: List[Union[pd.Timestamp, str]],
+                        entity_ids: List[str] = None,
+                        provider: str = None,
+                        columns: List = None,
+                        filters: List = None,
+                        level: Union[IntervalLevel, str] = None,
+                        session: Session = None,
+                        category_field: str = 'entity_id',
+                        time_field: str = 'timestamp'):
+    """
+    the latest row of every entity at every timestamp,it's queried by the as of query at the first timestamp and
+    the range query of the rest,then aligned to the timestamps by merge_asof
+
+    the result is indexed by (entity_id,timestamp) with the timestamps asked,the time column keeps the time of the row
+    """
+    assert provider is not None
+
+    timestamps = pd.DatetimeIndex([to_pd_timestamp(timestamp) for timestamp in timestamps]).sort_values().unique()
+    if timestamps.empty:
+        return None
+
+    if columns:
+        # support str
+        if type(columns[0]) == str:
+            columns = [getattr(data_schema, col) for col in columns]
+        columns = list(columns)
+        for col in (getattr(data_schema, category_field), getattr(data_schema, time_field)):
+            if col not in columns:
+                columns.append(col)
+
+    first_df = get_data_asof(data_schema=data_schema, timestamp=timestamps[0], entity_ids=entity_ids,
+                             provider=provider, columns=columns, filters=filters, level=level, session=session,
+                             category_field=category_field, time_field=time_field)
+
+    range_df = None
+    if len(timestamps) > 1:
+        time_col = getattr(data_schema, time_field)
+        range_filters = [time_col > timestamps[0]]
+        # get_data filters the entity_ids by entity_id
+        if entity_ids:
+            range_filters.append(getattr(data_schema, category_field).in_(entity_ids))
+        if filters:
+            range_filters = filters + range_filters
+        range_df = get_data(data_schema=data_schema, provider=provider, columns=columns,
+                            end_timestamp=timestamps[-1], filters=range_filters, level=level, session=session,
+                            time_field=time_field)
+
+    dfs = [df for df in (first_df, range_df) if pd_is_not_null(df)]
+    if not dfs:
+        return None
+    df = pd.concat(dfs, sort=False).reset_index(drop=True)
+    df[time_field] = pd.to_datetime(df[time_field])
+    df = df.sort_values(time_field, kind='mergesort')
+
+    if not entity_ids:
+        entity_ids = df[category_field].unique().tolist()
+
+    left = pd.DataFrame({category_field: pd.Index(entity_ids).repeat(len(timestamps)),
+                         '__asof__': list(timestamps) * len(entity_ids)}).sort_values('__asof__', kind='mergesort')
+    panel = pd.merge_asof(left, df, left_on='__asof__', right_on=time_field, by=category_field,
+                          direction='backward')
+    panel = panel[panel[time_field].notnull()]
+
+    panel.index = pd.MultiIndex.from_arrays([panel[category_field], panel['__asof__']],
+                                            names=[category_field, time_field])
+    panel = panel.drop(columns='__asof__')
+    return panel.sort_index(level=[0, 1])
+
+
 def data_exist(session, schema, id):
     return session.query(exists().where(and_(schema.id == id))).scalar()
 
@@ -238,9 +417,14 @@ def df_to_db(df: pd.DataFrame,
             else:
                 sql = f'delete from {data_schema.__tablename__} where id in {tuple(ids)}'
 
-            session.execute(sql)
+            result = session.execute(sql)
             session.commit()
 
+            # the rows saved before are rewritten
+            if result.rowcount and 'timestamp' in df_current.columns:
+                mark_rewritten(provider=provider, data_schema=data_schema,
+                               min_timestamp=df_current['timestamp'].min())
+
         else:
             current = get_data(data_schema=data_schema, columns=[data_schema.id], provider=provider,
                                ids=df_current['id'].tolist())
@@ -249,6 +433,8 @@ def df_to_db(df: pd.DataFrame,
 
         df_current.to_sql(data_schema.__tablename__, db_engine, index=False, if_exists='append')
 
+        publish_df_changed(provider=provider, data_schema=data_schema, df=df_current)
+
 
 def get_entities(
         entity_schema: EntityMixin = None,
@@ -0,0 +1,229 @@
+# -*- coding: utf-8 -*-
+import logging
+import threading
+import time
+from collections import OrderedDict
+
+import pandas as pd
+
+from zvdata.metrics import Histogram
+
+logger = logging.getLogger(__name__)
+
+# the backpressure policies when the queue of the listener is full
+BLOCK = 'block'
+DROP_OLDEST = 'drop_oldest'
+# keep only the latest data_df and merge the added data of the same entity,the queue never grows beyond the
+# entities count.the pending call of the same method(and entity) takes the latest arguments but keeps its position,
+# so the calls are in the order of their first pending submission,the added data of an entity are merged in order
+# and never lost,but a coalesced call may run before the calls of other keys submitted after its first one
+COALESCE = 'coalesce'
+
+
+def get_listener_name(listener) -> str:
+    return f'{listener.__class__.__name__}_{id(listener)}'
+
+
+class ListenerWorker(object):
+    """
+    the thread calling one listener with the calls in its own bounded queue,so a slow listener never stalls others
+    """
+
+    def __init__(self, listener, policy: str = BLOCK, queue_size: int = 100) -> None:
+        assert policy in (BLOCK, DROP_OLDEST, COALESCE)
+
+        self.listener = listener
+        self.policy = policy
+        self.queue_size = queue_size
+
+        # key -> (method,args,kwargs),the key is unique except for coalescing
+        self.pending = OrderedDict()
+        self.sequence = 0
+        self.condition = threading.Condition()
+        self.busy = False
+        self.stopped = False
+
+        self.latency = Histogram()
+        self.dropped = 0
+        self.coalesced = 0
+
+        self.thread = threading.Thread(target=self.run, name=f'listener_{get_listener_name(listener)}', daemon=True)
+        self.thread.start()
+
+    def _key(self, method: str, kwargs: dict):
+        if self.policy == COALESCE:
+            if method == 'on_entity_data_changed':
+                return method, kwargs.get('entity')
+            return method
+        self.sequence += 1
+        return self.sequence
+
+    def submit(self, method: str, *args, **kwargs):
+        with self.condition:
+            key = self._key(method, kwargs)
+            if self.policy == COALESCE and key in self.pending:
+                _, _, pending_kwargs = self.pending[key]
+                if method == 'on_entity_data_changed':
+                    # the added data should not be lost
+                    kwargs['added_data'] = pd.concat([pending_kwargs['added_data'], kwargs['added_data']])
+                self.pending[key] = (method, args, kwargs)
+                self.coalesced += 1
+                return
+
+            if self.policy == BLOCK:
+                while len(self.pending) >= self.queue_size and not self.stopped:
+                    self.condition.wait()
+            elif self.policy == DROP_OLDEST:
+                while len(self.pending) >= self.queue_size:
+                    self.pending.popitem(last=False)
+                    self.dropped += 1
+
+            self.pending[key] = (method, args, kwargs)
+            self.condition.notify_all()
+
+    def run(self):
+        while True:
+            with self.condition:
+                while not self.pending and not self.stopped:
+                    self.condition.wait()
+                if not self.pending and self.stopped:
+                    return
+                _, (method, args, kwargs) = self.pending.popitem(last=False)
+                self.busy = True
+                self.condition.notify_all()
+
+            start = time.time()
+            try:
+                getattr(self.listener, method)(*args, **kwargs)
+            except Exception as e:
+                logger.exception(f'{get_listener_name(self.listener)} {method} failed:{e}')
+            finally:
+                self.latency.observe(time.time() - start)
+                with self.condition:
+                    self.busy = False
+                    self.condition.notify_all()
+
+    def join(self, timeout: float = None) -> bool:
+        """
+        wait until all the calls submitted are finished
+
+        """
+        end = time.time() + timeout if timeout is not None else None
+        with self.condition:
+            while self.pending or self.busy:
+                remaining = end - time.time() if end is not None else None
+                if remaining is not None and remaining <= 0:
+                    return False
+                self.condition.wait(remaining)
+        return True
+
+    def stop(self):
+        with self.condition:
+            self.stopped = True
+            self.condition.notify_all()
+        self.thread.join()
+
+
+class ListenerDispatcher(object):
+    """
+    call the listeners synchronously(sync) or by the thread of every listener(thread)
+
+    the latency of every listener is recorded in a Histogram
+    """
+
+    def __init__(self, mode: str = 'sync', policy: str = BLOCK, queue_size: int = 100) -> None:
+        """
+
+        :param mode: sync or thread
+        :type mode: str
+        :param policy: the backpressure policy in thread mode,block,drop_oldest or coalesce
+        :type policy: str
+        :param queue_size: the max calls waiting for every listener
+        :type queue_size: int
+        """
+        assert mode in ('sync', 'thread')
+        self.mode = mode
+        self.policy = policy
+        self.queue_size = queue_size
+
+        self.listeners = []
+        # listener name -> ListenerWorker
+        self.workers = {}
+        # listener name -> Histogram,for sync mode
+        self.latencies = {}
+
+    def add(self, listener):
+        if listener in self.listeners:
+            return
+        self.listeners.append(listener)
+        if self.mode == 'thread':
+            self.get_worker(listener)
+        else:
+            self.get_latency(listener)
+
+    def get_worker(self, listener) -> ListenerWorker:
+        """
+        the worker of the listener,it's created on first use for the listener appended to listeners directly
+
+        """
+        name = get_listener_name(listener)
+        worker = self.workers.get(name)
+        if worker is None:
+            worker = ListenerWorker(listener, policy=self.policy, queue_size=self.queue_size)
+            self.workers[name] = worker
+        return worker
+
+    def get_latency(self, listener) -> Histogram:
+        name = get_listener_name(listener)
+        histogram = self.latencies.get(name)
+        if histogram is None:
+            histogram = Histogram()
+            self.latencies[name] = histogram
+        return histogram
+
+    def remove(self, listener):
+        if listener not in self.listeners:
+            return
+        self.listeners.remove(listener)
+        name = get_listener_name(listener)
+        worker = self.workers.pop(name, None)
+        if worker:
+            worker.stop()
+        self.latencies.pop(name, None)
+
+    def dispatch_to(self, listener, method: str, *args, **kwargs):
+        if self.mode == 'thread':
+            self.get_worker(listener).submit(method, *args, **kwargs)
+            return
+
+        histogram = self.get_latency(listener)
+        start = time.time()
+        try:
+            getattr(listener, method)(*args, **kwargs)
+        finally:
+            histogram.observe(time.time() - start)
+
+    def dispatch(self, method: str, *args, **kwargs):
+        for listener in list(self.listeners):
+            self.dispatch_to(listener, method, *args, **kwargs)
+
+    def join(self, timeout: float = None) -> bool:
+        """
+        wait until the listeners finish the calls dispatched
+
+        """
+        return all([worker.join(timeout) for worker in self.workers.values()])
+
+    def stats(self) -> dict:
+        result = {}
+        for name, histogram in self.latencies.items():
+            result[name] = {'latency': histogram.to_dict()}
+        for name, worker in self.workers.items():
+            result[name] = {'latency': worker.latency.to_dict(), 'dropped': worker.dropped,
+                            'coalesced': worker.coalesced, 'pending': len(worker.pending)}
+        return result
+
+    def close(self):
+        for worker in self.workers.values():
+            worker.stop()
+        self.workers = {}
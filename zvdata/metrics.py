@@ -0,0 +1,216 @@
+# -*- coding: utf-8 -*-
+import bisect
+import json
+import logging
+import os
+import time
+from collections import defaultdict
+from contextlib import contextmanager
+
+logger = logging.getLogger(__name__)
+
+# upper bounds(seconds) of the latency histogram buckets
+DEFAULT_LATENCY_BUCKETS = (0.01, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60)
+
+
+class Histogram(object):
+    def __init__(self, buckets=DEFAULT_LATENCY_BUCKETS) -> None:
+        self.buckets = tuple(sorted(buckets))
+        # the last one is for +Inf
+        self.bucket_counts = [0] * (len(self.buckets) + 1)
+        self.count = 0
+        self.sum = 0.0
+        self.max = 0.0
+
+    def observe(self, value):
+        self.bucket_counts[bisect.bisect_left(self.buckets, value)] += 1
+        self.count += 1
+        self.sum += value
+        self.max = max(self.max, value)
+
+    def cumulative_counts(self):
+        """
+        (upper_bound,count) pairs in prometheus style,the count is the number of observations <= upper_bound
+
+        """
+        result = []
+        total = 0
+        for bound, count in zip(self.buckets + (float('inf'),), self.bucket_counts):
+            total += count
+            result.append((bound, total))
+        return result
+
+    def to_dict(self):
+        return {
+            'count': self.count,
+            'sum': round(self.sum, 6),
+            'avg': round(self.sum / self.count, 6) if self.count else 0,
+            'max': round(self.max, 6),
+            'buckets': {str(bound): count for bound, count in self.cumulative_counts()}
+        }
+
+
+class RecorderMetrics(object):
+    """
+    stage timers,counters and histograms of one recorder run
+
+    stages used by the recorders:evaluate,sleep,record,backoff,generate_domain,persist
+    counters used by the recorders:entities,entities_failed,retries,rows_fetched,rows_new,rows_duplicated
+    histograms used by the recorders:entity_seconds,persist_seconds
+    """
+
+    def __init__(self, recorder: str, provider: str = None, data_schema: str = None) -> None:
+        self.labels = {'recorder': recorder, 'provider': provider, 'schema': data_schema}
+
+        self.stage_seconds = defaultdict(float)
+        self.stage_calls = defaultdict(int)
+        self.counters = defaultdict(int)
+        self.histograms = {}
+
+        self.start_time = None
+        self.end_time = None
+
+    def reset(self):
+        self.stage_seconds.clear()
+        self.stage_calls.clear()
+        self.counters.clear()
+        self.histograms.clear()
+        self.start_time = time.time()
+        self.end_time = None
+
+    @contextmanager
+    def timer(self, stage):
+        start = time.time()
+        try:
+            yield
+        finally:
+            self.add_time(stage, time.time() - start)
+
+    def add_time(self, stage, seconds):
+        self.stage_seconds[stage] += seconds
+        self.stage_calls[stage] += 1
+
+    def incr(self, name, value=1):
+        self.counters[name] += value
+
+    def observe(self, name, value):
+        histogram = self.histograms.get(name)
+        if not histogram:
+            histogram = Histogram()
+            self.histograms[name] = histogram
+        histogram.observe(value)
+
+    def elapsed(self):
+        if not self.start_time:
+            return 0
+        return (self.end_time or time.time()) - self.start_time
+
+    def summary(self) -> dict:
+        """
+        the structured summary of the run
+
+        """
+        return {
+            **self.labels,
+            'elapsed': round(self.elapsed(), 6),
+            'stages': {stage: {'seconds': round(seconds, 6), 'calls': self.stage_calls[stage]} for stage, seconds in
+                       self.stage_seconds.items()},
+            'counters': dict(self.counters),
+            'histograms': {name: histogram.to_dict() for name, histogram in self.histograms.items()}
+        }
+
+
+class MetricsSink(object):
+    def on_entity_finished(self, metrics: RecorderMetrics, entity_id: str, seconds: float) -> object:
+        """
+
+        Parameters
+        ----------
+        metrics : the metrics of the running recorder
+        entity_id : the entity just finished in this cycle
+        seconds : the cost time of the entity
+        """
+        pass
+
+    def on_run_finished(self, metrics: RecorderMetrics) -> object:
+        """
+
+        Parameters
+        ----------
+        metrics : the metrics of the finished run
+        """
+        pass
+
+
+class LoggingMetricsSink(MetricsSink):
+    def __init__(self, level=logging.INFO) -> None:
+        self.level = level
+
+    def on_run_finished(self, metrics: RecorderMetrics) -> object:
+        logger.log(self.level, 'recorder summary:{}'.format(json.dumps(metrics.summary(), ensure_ascii=False)))
+
+
+def _format_labels(labels: dict):
+    items = ['{}="{}"'.format(k, str(v).replace('\\', '\\\\').replace('"', '\\"')) for k, v in labels.items() if
+             v is not None]
+    return '{' + ','.join(items) + '}'
+
+
+def to_prometheus_text(metrics: RecorderMetrics, prefix='zvdata_recorder') -> str:
+    """
+    format the metrics in prometheus text exposition format
+
+    :param metrics:
+    :type metrics: RecorderMetrics
+    :param prefix: the prefix of metric names
+    :type prefix: str
+    :return:
+    :rtype: str
+    """
+    lines = []
+
+    lines.append(f'# TYPE {prefix}_stage_seconds_total counter')
+    for stage, seconds in metrics.stage_seconds.items():
+        lines.append(f'{prefix}_stage_seconds_total{_format_labels({**metrics.labels, "stage": stage})} {seconds}')
+
+    lines.append(f'# TYPE {prefix}_stage_calls_total counter')
+    for stage, calls in metrics.stage_calls.items():
+        lines.append(f'{prefix}_stage_calls_total{_format_labels({**metrics.labels, "stage": stage})} {calls}')
+
+    for name, value in metrics.counters.items():
+        lines.append(f'# TYPE {prefix}_{name}_total counter')
+        lines.append(f'{prefix}_{name}_total{_format_labels(metrics.labels)} {value}')
+
+    for name, histogram in metrics.histograms.items():
+        lines.append(f'# TYPE {prefix}_{name} histogram')
+        for bound, count in histogram.cumulative_counts():
+            le = '+Inf' if bound == float('inf') else str(bound)
+            lines.append(f'{prefix}_{name}_bucket{_format_labels({**metrics.labels, "le": le})} {count}')
+        lines.append(f'{prefix}_{name}_sum{_format_labels(metrics.labels)} {histogram.sum}')
+        lines.append(f'{prefix}_{name}_count{_format_labels(metrics.labels)} {histogram.count}')
+
+    lines.append(f'# TYPE {prefix}_elapsed_seconds gauge')
+    lines.append(f'{prefix}_elapsed_seconds{_format_labels(metrics.labels)} {metrics.elapsed()}')
+
+    return '\n'.join(lines) + '\n'
+
+
+class PrometheusTextFileSink(MetricsSink):
+    """
+    write the metrics to a text file which could be collected by the textfile collector of node_exporter
+    """
+
+    def __init__(self, path: str, prefix='zvdata_recorder') -> None:
+        self.path = path
+        self.prefix = prefix
+
+    def on_run_finished(self, metrics: RecorderMetrics) -> object:
+        dir_name = os.path.dirname(self.path)
+        if dir_name and not os.path.exists(dir_name):
+            os.makedirs(dir_name)
+
+        # write to tmp file and rename,so the collector never reads a half written file
+        tmp_path = f'{self.path}.{os.getpid()}.tmp'
+        with open(tmp_path, 'w') as f:
+            f.write(to_prometheus_text(metrics, prefix=self.prefix))
+        os.replace(tmp_path, self.path)
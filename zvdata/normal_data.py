@@ -1,8 +1,90 @@
 # -*- coding: utf-8 -*-
+import bisect
+from collections.abc import Mapping
+
+import numpy as np
+import pandas as pd
 
 from zvdata.utils.pd_utils import pd_is_not_null, fill_with_same_index, normal_index_df, is_normal_df
 
 
+class EntityDfMap(Mapping):
+    """
+    entity_id -> the data of the entity,created on the first access
+
+    the rows appended at the tail are kept in pending and concatenated to the entity only when it's accessed
+    """
+
+    def __init__(self, normal_data) -> None:
+        self.normal_data = normal_data
+        self.cache = {}
+        # entity_id -> the dfs appended after the rows of the entity
+        self.pending = {}
+
+    def __getitem__(self, entity_id):
+        df = self.cache.get(entity_id)
+        if df is None and entity_id in self.normal_data.entity_map_range:
+            df = self.normal_data.slice_entity_df(entity_id)
+        tail_dfs = self.pending.pop(entity_id, None)
+        if tail_dfs:
+            df = pd.concat(tail_dfs if df is None else [df] + tail_dfs, sort=False)
+        if df is None:
+            raise KeyError(entity_id)
+        self.cache[entity_id] = df
+        return df
+
+    def last_timestamp(self, entity_id):
+        """
+        the latest time of the entity without concatenating the pending rows,None if no rows
+
+        """
+        tail_dfs = self.pending.get(entity_id)
+        if tail_dfs:
+            return tail_dfs[-1].index[-1]
+        df = self.cache.get(entity_id)
+        if df is not None:
+            return df.index[-1] if len(df) else None
+        if entity_id in self.normal_data.entity_map_range:
+            start, end = self.normal_data.entity_map_range[entity_id]
+            return self.normal_data._data_df.index[end - 1][1]
+        return None
+
+    def append_tail(self, entity_id, df):
+        """
+        append the rows after the last timestamp of the entity
+
+        """
+        self.pending.setdefault(entity_id, []).append(df)
+
+    def __iter__(self):
+        return iter(self.normal_data.entity_ids)
+
+    def __len__(self):
+        return len(self.normal_data.entity_ids)
+
+    def __setitem__(self, entity_id, df):
+        self.cache[entity_id] = df
+
+    def clear(self):
+        self.cache = {}
+        self.pending = {}
+
+    def __contains__(self, entity_id):
+        return entity_id in self.cache or entity_id in self.pending or entity_id in self.normal_data.entity_map_range
+
+
+def get_entity_ranges(df: pd.DataFrame):
+    """
+    the entities and their (start,end) rows in the normal df sorted by index
+
+    """
+    codes = df.index.codes[0]
+    starts = np.concatenate([[0], np.flatnonzero(codes[1:] != codes[:-1]) + 1])
+    ends = np.concatenate([starts[1:], [len(codes)]])
+    entity_ids = df.index.levels[0].take(codes[starts]).to_list()
+    return entity_ids, starts, ends
+
+
 class NormalData(object):
     table_type_sample = None
 
@@ -10,38 +92,215 @@ class NormalData(object):
                  df,
                  category_field='entity_id',
                  time_field='timestamp',
-                 fill_index: bool = False) -> None:
+                 fill_index: bool = False,
+                 target_index: pd.Index = None) -> None:
+        """
+
+        :param fill_index: whether fill the entities of df_list to the same index
+        :type fill_index: bool
+        :param target_index: the index filled to,e.g. DataReader.get_target_index() from the trading calendar,the
+        union of the entities if not set
+        :type target_index: pd.Index
+        """
         self.data_df = df
         self.category_field = category_field
         self.time_field = time_field
         self.fill_index = fill_index
+        self.target_index = target_index
+
+        # entity_id -> (start,end) rows in data_df
+        self.entity_map_range = {}
 
-        self.entity_ids = []
-        self.df_list = []
-        self.entity_map_df = {}
+        # built only if accessed
+        self._entity_ids = None
+        self._df_list = None
+        self._entity_map_df = None
+        # the index of df_list and entity_id -> the frame aligned to it if fill_index
+        self._aligned_index = None
+        self._aligned_map_df = None
 
         self.normalize()
 
+    @property
+    def data_df(self):
+        # rebuild it from the entities after appending
+        if self._dirty:
+            entity_map_df = self.entity_map_df
+            dfs = [entity_map_df[entity_id] for entity_id in self.entity_ids]
+            self._data_df = pd.concat(dfs, keys=self.entity_ids, names=[self.category_field], sort=False)
+
+            ends = np.cumsum([len(df) for df in dfs])
+            starts = ends - [len(df) for df in dfs]
+            self.entity_map_range = {entity_id: (start, end) for entity_id, start, end in
+                                     zip(self.entity_ids, starts, ends)}
+            # the entities are sliced from the new data_df again,so the old frames could be released
+            entity_map_df.clear()
+            self._dirty = False
+        return self._data_df
+
+    @data_df.setter
+    def data_df(self, df):
+        self._data_df = df
+        self._dirty = False
+
     def normalize(self):
         """
         normalize data_df to
                                     col1    col2    col3
         entity_id    index_field
 
+        the rows of every entity are located once from the sorted index,the frames of the entities are created as
+        slices of data_df on demand
         """
+        self.entity_map_range = {}
+        self._entity_ids = []
+        self._df_list = None
+        self._entity_map_df = None
+        self._aligned_index = None
+        self._aligned_map_df = None
+
         if pd_is_not_null(self.data_df):
             if not is_normal_df(self.data_df):
                 self.data_df = normal_index_df(self.data_df, self.category_field, self.time_field)
 
-            self.entity_ids = self.data_df.index.levels[0].to_list()
+            if not self.data_df.index.is_monotonic_increasing:
+                self.data_df = self.data_df.sort_index(level=[0, 1])
+
+            entity_ids, starts, ends = get_entity_ranges(self.data_df)
+
+            self._entity_ids = entity_ids
+            self.entity_map_range = {entity_id: (start, end) for entity_id, start, end in
+                                     zip(entity_ids, starts, ends)}
+
+    def append(self, new_df: pd.DataFrame):
+        """
+        merge the new rows to the entities in it,the rows with the same time are replaced,other entities are not
+        touched and data_df is rebuilt only if accessed
+
+        the rows after the last timestamp of the entity are appended at the tail without concatenating its history,
+        the history is concatenated only if the rows are inserted or replaced
+
+        :param new_df: the normal data or the df with category_field and time_field columns
+        :type new_df: pd.DataFrame
+        """
+        if not pd_is_not_null(new_df):
+            return
+
+        if not is_normal_df(new_df, self.category_field, self.time_field):
+            new_df = normal_index_df(new_df, self.category_field, self.time_field)
+        if not new_df.index.is_monotonic_increasing:
+            new_df = new_df.sort_index(level=[0, 1])
+
+        entity_map_df = self.entity_map_df
+        changed_entity_ids = set()
+        for entity_id, start, end in zip(*get_entity_ranges(new_df)):
+            added_df = new_df.iloc[start:end]
+            added_df.index = added_df.index.droplevel(0)
+
+            if entity_id not in entity_map_df:
+                bisect.insort(self._entity_ids, entity_id)
+
+            last_timestamp = entity_map_df.last_timestamp(entity_id)
+            if added_df.index.is_unique and (last_timestamp is None or added_df.index[0] > last_timestamp):
+                entity_map_df.append_tail(entity_id, added_df)
+            else:
+                df = pd.concat([entity_map_df[entity_id], added_df], sort=False)
+                if not df.index.is_monotonic_increasing or not df.index.is_unique:
+                    df = df[~df.index.duplicated(keep='last')].sort_index()
+                entity_map_df[entity_id] = df
+            changed_entity_ids.add(entity_id)
+
+        self._dirty = True
+
+        if self._df_list is not None or self._aligned_index is not None:
+            self.update_df_list(changed_entity_ids, new_df.index.get_level_values(1))
+
+    def update_df_list(self, changed_entity_ids, new_timestamps):
+        """
+        extend the aligned index with the new timestamps and drop the aligned frames of the changed entities,the
+        frames are aligned again only when df_list is accessed
+
+        """
+        if self._aligned_index is None:
+            self._df_list = None
+            return
+
+        aligned_index = self._aligned_index.append(pd.Index(new_timestamps)).unique().sort_values()
+        aligned_index.name = self._aligned_index.name
+        self._aligned_index = aligned_index
+
+        for entity_id in changed_entity_ids:
+            self._aligned_map_df.pop(entity_id, None)
+        self._df_list = None
+
+    def get_aligned_df(self, entity_id):
+        """
+        the frame of the entity aligned to the aligned index,the frame aligned before is extended at the tail if the
+        index grows only after it,so the history is not reindexed again
+
+        """
+        aligned_index = self._aligned_index
+        df = self._aligned_map_df.get(entity_id)
+        if df is not None and len(df) != len(aligned_index):
+            if len(df) and len(df) < len(aligned_index) and aligned_index[len(df) - 1] == df.index[-1]:
+                df = pd.concat([df, df.iloc[:0].reindex(aligned_index[len(df):])], sort=False)
+            else:
+                df = None
+        if df is None:
+            df = fill_with_same_index([self.entity_map_df[entity_id]], target_index=aligned_index)[0]
+        self._aligned_map_df[entity_id] = df
+        return df
+
+    def slice_entity_df(self, entity_id):
+        """
+        the data of the entity indexed by time_field,it's a slice of data_df without copying,so don't change it
+
+        """
+        start, end = self.entity_map_range[entity_id]
+        # the entities not cached are not changed since data_df built
+        df = self._data_df.iloc[start:end]
+        df.index = df.index.droplevel(0)
+        return df
+
+    def get_entity_df(self, entity_id):
+        return self.entity_map_df[entity_id]
+
+    @property
+    def entity_ids(self):
+        return self._entity_ids
+
+    @entity_ids.setter
+    def entity_ids(self, entity_ids):
+        self._entity_ids = entity_ids
+
+    @property
+    def entity_map_df(self):
+        if self._entity_map_df is None:
+            self._entity_map_df = EntityDfMap(self)
+        return self._entity_map_df
+
+    @entity_map_df.setter
+    def entity_map_df(self, entity_map_df):
+        self._entity_map_df = entity_map_df
+
+    @property
+    def df_list(self):
+        if self._df_list is None:
+            if self._aligned_index is not None:
+                self._df_list = [self.get_aligned_df(entity_id) for entity_id in self.entity_ids]
+                return self._df_list
 
-            for entity_id in self.entity_ids:
-                df = self.data_df.loc[(entity_id,)]
-                self.df_list.append(df)
-                self.entity_map_df[entity_id] = df
+            df_list = [self.entity_map_df[entity_id] for entity_id in self.entity_ids]
+            if self.fill_index and (len(df_list) > 1 or (df_list and self.target_index is not None)):
+                df_list = fill_with_same_index(df_list=df_list, target_index=self.target_index)
+                self._aligned_index = df_list[0].index
+                self._aligned_map_df = dict(zip(self.entity_ids, df_list))
+            self._df_list = df_list
+        return self._df_list
 
-            if len(self.df_list) > 1 and self.fill_index:
-                self.df_list = fill_with_same_index(df_list=self.df_list)
+    @df_list.setter
+    def df_list(self, df_list):
+        self._df_list = df_list
 
     def empty(self):
         return not pd_is_not_null(self.data_df)
@@ -0,0 +1,161 @@
+# -*- coding: utf-8 -*-
+import logging
+import sqlite3
+import threading
+from typing import List, Callable
+
+import pandas as pd
+
+from zvdata.contract import get_db_engine
+
+logger = logging.getLogger(__name__)
+
+
+class DataChangedEvent(object):
+    """
+    rows written to the table of the provider
+    """
+
+    def __init__(self, provider: str, table: str, entity_ids: List[str] = None, timestamp: pd.Timestamp = None) -> None:
+        """
+
+        :param provider:
+        :type provider: str
+        :param table: the table name of the data schema
+        :type table: str
+        :param entity_ids: the entities changed,None means unknown
+        :type entity_ids: List[str]
+        :param timestamp: the max timestamp of the rows written,None means unknown
+        :type timestamp: pd.Timestamp
+        """
+        self.provider = provider
+        self.table = table
+        self.entity_ids = entity_ids
+        self.timestamp = timestamp
+
+    def __repr__(self) -> str:
+        return f'DataChangedEvent(provider={self.provider},table={self.table},entity_ids={self.entity_ids},' \
+               f'timestamp={self.timestamp})'
+
+
+class ChangeNotifier(object):
+    """
+    in process pub/sub of the data changes,the subscribers are called in the thread of the publisher
+    """
+
+    def __init__(self) -> None:
+        # (provider,table) -> subscribers
+        self.subscribers = {}
+        self.lock = threading.Lock()
+
+    def subscribe(self, provider: str, data_schema, callback: Callable[[DataChangedEvent], object]):
+        key = (provider, data_schema.__tablename__)
+        with self.lock:
+            callbacks = self.subscribers.setdefault(key, [])
+            if callback not in callbacks:
+                callbacks.append(callback)
+
+    def unsubscribe(self, provider: str, data_schema, callback: Callable[[DataChangedEvent], object]):
+        key = (provider, data_schema.__tablename__)
+        with self.lock:
+            callbacks = self.subscribers.get(key)
+            if callbacks and callback in callbacks:
+                callbacks.remove(callback)
+
+    def publish(self, event: DataChangedEvent):
+        with self.lock:
+            callbacks = list(self.subscribers.get((event.provider, event.table), []))
+
+        for callback in callbacks:
+            try:
+                callback(event)
+            except Exception as e:
+                logger.exception(f'notify {event} to {callback} failed:{e}')
+
+
+_notifier = ChangeNotifier()
+
+
+def get_change_notifier() -> ChangeNotifier:
+    return _notifier
+
+
+def publish_data_changed(provider: str, data_schema, entity_ids: List[str] = None, timestamp=None):
+    """
+    publish the change of the table in this process
+
+    """
+    if timestamp is not None:
+        timestamp = pd.Timestamp(timestamp)
+    _notifier.publish(DataChangedEvent(provider=provider, table=data_schema.__tablename__, entity_ids=entity_ids,
+                                       timestamp=timestamp))
+
+
+def publish_df_changed(provider: str, data_schema, df: pd.DataFrame):
+    """
+    publish the change of the rows in df
+
+    """
+    if df is None or df.empty:
+        return
+    entity_ids = df['entity_id'].unique().tolist() if 'entity_id' in df.columns else None
+    timestamp = df['timestamp'].max() if 'timestamp' in df.columns else None
+    publish_data_changed(provider=provider, data_schema=data_schema, entity_ids=entity_ids, timestamp=timestamp)
+
+
+class SqliteChangeWatcher(object):
+    """
+    watch the commits from other processes by polling PRAGMA data_version of the sqlite db,the events have no
+    entity_ids and timestamp because sqlite doesn't tell what's changed
+    """
+
+    def __init__(self, provider: str, data_schema, callback: Callable[[DataChangedEvent], object],
+                 interval: float = 0.2) -> None:
+        """
+
+        :param provider:
+        :type provider: str
+        :param data_schema:
+        :param callback: called in the watching thread
+        :type callback: Callable[[DataChangedEvent], object]
+        :param interval: seconds between two polls
+        :type interval: float
+        """
+        self.provider = provider
+        self.data_schema = data_schema
+        self.callback = callback
+        self.interval = interval
+
+        self.db_path = get_db_engine(provider, data_schema=data_schema).url.database
+
+        self.stopped = threading.Event()
+        self.thread = None
+
+    def start(self):
+        if self.thread:
+            return self
+        self.stopped.clear()
+        self.thread = threading.Thread(target=self.run, name=f'sqlite_watcher_{self.provider}', daemon=True)
+        self.thread.start()
+        return self
+
+    def stop(self):
+        self.stopped.set()
+        if self.thread:
+            self.thread.join()
+            self.thread = None
+
+    def run(self):
+        # data_version only changes on the commits of other connections,so keep using the same connection
+        conn = sqlite3.connect(self.db_path)
+        try:
+            version = conn.execute('PRAGMA data_version').fetchone()[0]
+            while not self.stopped.wait(self.interval):
+                current = conn.execute('PRAGMA data_version').fetchone()[0]
+                if current != version:
+                    version = current
+                    self.callback(DataChangedEvent(provider=self.provider, table=self.data_schema.__tablename__))
+        except Exception as e:
+            logger.exception(f'watch {self.db_path} failed:{e}')
+        finally:
+            conn.close()
@@ -0,0 +1,161 @@
+# -*- coding: utf-8 -*-
+import os
+from typing import List
+
+import numpy as np
+import pandas as pd
+
+from zvdata.normal_data import NormalData
+from zvdata.utils.pd_utils import pd_is_not_null, normal_index_df, is_normal_df
+
+
+class Panel(object):
+    """
+    dense float array of shape (fields,times,entities) for the cross sectional computing,the missing values are NaN
+
+    the entities and times are coded by their positions in entity_ids and timestamps,the array could be memory mapped
+    on disk and grows along the time axis
+    """
+
+    def __init__(self,
+                 fields: List[str],
+                 entity_ids: List[str],
+                 time_capacity: int = 256,
+                 dtype=np.float64,
+                 path: str = None) -> None:
+        """
+
+        :param fields: the columns in the panel
+        :type fields: List[str]
+        :param entity_ids:
+        :type entity_ids: List[str]
+        :param time_capacity: the initial size of the time axis
+        :type time_capacity: int
+        :param dtype: float type of the values
+        :param path: the file for memory mapping the values,in memory if not set
+        :type path: str
+        """
+        self.fields = list(fields)
+        self.field_map_code = {field: i for i, field in enumerate(self.fields)}
+        self.entity_ids = list(entity_ids)
+        self.entity_map_code = {entity_id: i for i, entity_id in enumerate(self.entity_ids)}
+        self.dtype = np.dtype(dtype)
+        self.path = path
+
+        self.times = 0
+        self.timestamps = np.empty(time_capacity, dtype='datetime64[ns]')
+        self.values = self._allocate((len(self.fields), time_capacity, len(self.entity_ids)))
+
+    def _allocate(self, shape) -> np.ndarray:
+        if not self.path:
+            return np.full(shape, np.nan, dtype=self.dtype)
+
+        dir_name = os.path.dirname(self.path)
+        if dir_name and not os.path.exists(dir_name):
+            os.makedirs(dir_name)
+        # create in tmp file and rename,the old mapping is still valid before released
+        tmp_path = f'{self.path}.{os.getpid()}.tmp'
+        values = np.memmap(tmp_path, dtype=self.dtype, mode='w+', shape=shape)
+        values[:] = np.nan
+        os.replace(tmp_path, self.path)
+        return values
+
+    def _resize(self, time_capacity: int, entity_count: int):
+        values = self._allocate((len(self.fields), time_capacity, entity_count))
+        values[:, :self.times, :self.values.shape[2]] = self.values[:, :self.times, :]
+        self.values = values
+
+        timestamps = np.empty(time_capacity, dtype='datetime64[ns]')
+        timestamps[:self.times] = self.timestamps[:self.times]
+        self.timestamps = timestamps
+
+    @classmethod
+    def from_df(cls, df: pd.DataFrame, fields: List[str] = None, category_field: str = 'entity_id',
+                time_field: str = 'timestamp', dtype=np.float64, path: str = None):
+        """
+        create the panel from the normal data(entity_id,timestamp)
+
+        :param df:
+        :type df: pd.DataFrame
+        :param fields: the numeric columns of df if not set
+        :type fields: List[str]
+        """
+        if not is_normal_df(df, category_field, time_field):
+            df = normal_index_df(df, category_field, time_field)
+        if not fields:
+            fields = [col for col, col_dtype in df.dtypes.items() if col_dtype.kind in 'biuf']
+
+        entity_ids = df.index.get_level_values(0).unique().sort_values().to_list()
+        timestamps = np.unique(df.index.get_level_values(1).values)
+
+        panel = cls(fields=fields, entity_ids=entity_ids, time_capacity=max(len(timestamps), 1), dtype=dtype,
+                    path=path)
+        panel.append(df)
+        return panel
+
+    @classmethod
+    def from_normal_data(cls, normal_data: NormalData, fields: List[str] = None, dtype=np.float64,
+                         path: str = None):
+        return cls.from_df(normal_data.data_df, fields=fields, category_field=normal_data.category_field,
+                           time_field=normal_data.time_field, dtype=dtype, path=path)
+
+    def append(self, df: pd.DataFrame):
+        """
+        write the rows of the normal data,the new timestamps should be after the timestamps in the panel,the new
+        entities are added to the entity axis
+
+        """
+        if not pd_is_not_null(df):
+            return
+
+        entity_ids = df.index.get_level_values(0)
+        timestamps = df.index.get_level_values(1).values.astype('datetime64[ns]')
+
+        # validate and convert all before changing the panel,so it's kept consistent if failed
+        current = self.timestamps[:self.times]
+        new_timestamps = np.setdiff1d(np.unique(timestamps), current)
+        if len(new_timestamps) and self.times and new_timestamps[0] < current[-1]:
+            raise ValueError(f'the timestamps should be appended in order,{new_timestamps[0]} < {current[-1]}')
+        field_values = {code: df[field].values.astype(self.values.dtype) for field, code in
+                        self.field_map_code.items() if field in df.columns}
+
+        new_entity_ids = [entity_id for entity_id in entity_ids.unique() if entity_id not in self.entity_map_code]
+        for entity_id in new_entity_ids:
+            self.entity_map_code[entity_id] = len(self.entity_ids)
+            self.entity_ids.append(entity_id)
+
+        times = self.times + len(new_timestamps)
+        time_capacity = self.values.shape[1]
+        if times > time_capacity or new_entity_ids:
+            if times > time_capacity:
+                time_capacity = max(times, 2 * time_capacity)
+            self._resize(time_capacity, len(self.entity_ids))
+
+        self.timestamps[self.times:times] = new_timestamps
+        self.times = times
+
+        time_codes = np.searchsorted(self.timestamps[:self.times], timestamps)
+        entity_codes = entity_ids.map(self.entity_map_code).values.astype(np.int64)
+        for code, values in field_values.items():
+            self.values[code, time_codes, entity_codes] = values
+
+    def field(self, field: str) -> np.ndarray:
+        """
+        the (times,entities) view of the field without copying
+
+        """
+        return self.values[self.field_map_code[field], :self.times, :]
+
+    def time_index(self) -> pd.DatetimeIndex:
+        return pd.DatetimeIndex(self.timestamps[:self.times])
+
+    def field_df(self, field: str) -> pd.DataFrame:
+        """
+        the (times,entities) DataFrame of the field
+
+        """
+        return pd.DataFrame(self.field(field), index=self.time_index(), columns=self.entity_ids)
+
+    def flush(self):
+        if isinstance(self.values, np.memmap):
+            self.values.flush()
@@ -0,0 +1,284 @@
+# -*- coding: utf-8 -*-
+import json
+import logging
+import os
+import random
+import threading
+import time
+
+from zvdata.contract import zvdata_env
+
+logger = logging.getLogger(__name__)
+
+try:
+    import requests
+
+    _transient_errors = (ConnectionError, TimeoutError, requests.exceptions.ConnectionError,
+                         requests.exceptions.Timeout)
+except ImportError:
+    _transient_errors = (ConnectionError, TimeoutError)
+
+
+class TransientError(Exception):
+    """
+    the error could be recovered by retrying later
+    """
+    pass
+
+
+class ThrottledError(TransientError):
+    """
+    the provider rejects the request because of rate limit
+    """
+    pass
+
+
+class CircuitOpenError(Exception):
+    """
+    the requests to the provider are rejected locally because of too many failures
+    """
+    pass
+
+
+def is_transient_error(e: Exception) -> bool:
+    return isinstance(e, TransientError) or isinstance(e, _transient_errors)
+
+
+def backoff_with_jitter(attempt: int, base: float = 1, cap: float = 60) -> float:
+    """
+    exponential backoff with full jitter,the result is in [0,min(cap,base*2^attempt)]
+
+    :param attempt: the retry times,starting from 0
+    :type attempt: int
+    :param base: the base seconds
+    :type base: float
+    :param cap: the max seconds
+    :type cap: float
+    :return:
+    :rtype: float
+    """
+    return random.uniform(0, min(cap, base * (2 ** attempt)))
+
+
+class CircuitBreaker(object):
+    CLOSED = 'closed'
+    OPEN = 'open'
+    HALF_OPEN = 'half_open'
+
+    def __init__(self, failure_threshold: int = 5, reset_timeout: float = 60) -> None:
+        """
+
+        :param failure_threshold: open the circuit after continuous failures
+        :type failure_threshold: int
+        :param reset_timeout: seconds to wait before trying the provider again
+        :type reset_timeout: float
+        """
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+
+        self.state = CircuitBreaker.CLOSED
+        self.failures = 0
+        self.opened_at = None
+        self.lock = threading.Lock()
+
+    def allow_request(self) -> bool:
+        with self.lock:
+            if self.state == CircuitBreaker.CLOSED:
+                return True
+            # the trial request in half open is not finished in reset_timeout,e.g. failed by other errors,try again
+            if time.time() - self.opened_at >= self.reset_timeout:
+                # let one request go to test the provider
+                self.state = CircuitBreaker.HALF_OPEN
+                self.opened_at = time.time()
+                return True
+            return False
+
+    def remaining(self) -> float:
+        if self.state == CircuitBreaker.CLOSED:
+            return 0
+        return max(0, self.reset_timeout - (time.time() - self.opened_at))
+
+    def on_success(self):
+        with self.lock:
+            self.state = CircuitBreaker.CLOSED
+            self.failures = 0
+            self.opened_at = None
+
+    def on_failure(self):
+        with self.lock:
+            self.failures += 1
+            if self.state == CircuitBreaker.HALF_OPEN or self.failures >= self.failure_threshold:
+                self.state = CircuitBreaker.OPEN
+                self.opened_at = time.time()
+
+
+class AdaptiveRateController(object):
+    """
+    AIMD(additive increase,multiplicative decrease) controller for the request rate of a provider
+
+    the rate grows slowly on success and is cut down quickly on throttling,errors or high latency,the requests of the
+    recorder are sequential so the concurrency is not controlled
+    """
+
+    def __init__(self,
+                 provider: str,
+                 rate: float = 1,
+                 min_rate: float = 0.05,
+                 max_rate: float = 50,
+                 rate_increase: float = 0.1,
+                 decrease_factor: float = 0.5,
+                 target_latency: float = None,
+                 latency_alpha: float = 0.2) -> None:
+        """
+
+        :param provider: the provider controlled
+        :type provider: str
+        :param rate: initial requests per second
+        :type rate: float
+        :param min_rate:
+        :type min_rate: float
+        :param max_rate:
+        :type max_rate: float
+        :param rate_increase: requests per second added on success
+        :type rate_increase: float
+        :param decrease_factor: the rate multiplied by it on throttling or error
+        :type decrease_factor: float
+        :param target_latency: seconds,if the smoothed latency is bigger than it,treat it as congestion
+        :type target_latency: float
+        :param latency_alpha: smoothing factor of the latency
+        :type latency_alpha: float
+        """
+        self.provider = provider
+        self.rate = rate
+        self.min_rate = min_rate
+        self.max_rate = max_rate
+        self.rate_increase = rate_increase
+        self.decrease_factor = decrease_factor
+        self.target_latency = target_latency
+        self.latency_alpha = latency_alpha
+
+        self.latency = None
+        self.last_request_time = None
+
+    def interval(self) -> float:
+        """
+        seconds between two requests
+
+        """
+        return 1.0 / self.rate
+
+    def wait(self) -> float:
+        """
+        sleep to keep the request rate,return the seconds slept
+
+        """
+        now = time.time()
+        seconds = 0
+        if self.last_request_time is not None:
+            seconds = max(0, self.last_request_time + self.interval() - now)
+            if seconds > 0:
+                time.sleep(seconds)
+        self.last_request_time = now + seconds
+        return seconds
+
+    def _decrease(self):
+        self.rate = max(self.min_rate, self.rate * self.decrease_factor)
+
+    def on_success(self, latency: float = None):
+        if latency is not None:
+            if self.latency is None:
+                self.latency = latency
+            else:
+                self.latency = self.latency_alpha * latency + (1 - self.latency_alpha) * self.latency
+
+            if self.target_latency and self.latency > self.target_latency:
+                self._decrease()
+                return
+
+        self.rate = min(self.max_rate, self.rate + self.rate_increase)
+
+    def on_throttled(self):
+        self._decrease()
+
+    def on_error(self):
+        self._decrease()
+
+    def to_json(self):
+        return {
+            'provider': self.provider,
+            'rate': self.rate,
+            'latency': self.latency,
+            'updated_timestamp': time.time()
+        }
+
+    def save(self, path: str = None):
+        if not path:
+            path = get_rate_state_path(self.provider)
+        dir_name = os.path.dirname(path)
+        if not os.path.exists(dir_name):
+            os.makedirs(dir_name)
+
+        tmp_path = f'{path}.{os.getpid()}.tmp'
+        with open(tmp_path, 'w') as f:
+            json.dump(self.to_json(), f)
+        os.replace(tmp_path, path)
+
+    def restore(self, path: str = None):
+        """
+        restore the state saved by last run
+
+        """
+        if not path:
+            path = get_rate_state_path(self.provider)
+        if os.path.exists(path):
+            try:
+                with open(path) as f:
+                    state = json.load(f)
+                self.rate = min(self.max_rate, max(self.min_rate, state['rate']))
+                self.latency = state.get('latency')
+            except Exception as e:
+                logger.warning(f'restore rate state from {path} failed:{e}')
+        return self
+
+
+def get_rate_state_path(provider: str) -> str:
+    return os.path.join(zvdata_env['data_path'], 'rate_control', f'{provider}.json')
+
+
+# provider -> CircuitBreaker
+_provider_map_breaker = {}
+
+# provider -> AdaptiveRateController
+_provider_map_controller = {}
+
+
+def get_circuit_breaker(provider: str) -> CircuitBreaker:
+    breaker = _provider_map_breaker.get(provider)
+    if not breaker:
+        breaker = CircuitBreaker()
+        _provider_map_breaker[provider] = breaker
+    return breaker
+
+
+def register_rate_controller(controller: AdaptiveRateController):
+    """
+    use the controller for the provider instead of the one restored from the state of last run
+
+    """
+    _provider_map_controller[controller.provider] = controller
+
+
+def get_rate_controller(provider: str) -> AdaptiveRateController:
+    """
+    get the controller shared by the recorders of the provider,the state of last run is restored at first
+
+    :param provider:
+    :type provider: str
+    :return:
+    :rtype: AdaptiveRateController
+    """
+    controller = _provider_map_controller.get(provider)
+    if not controller:
+        controller = AdaptiveRateController(provider=provider).restore()
+        _provider_map_controller[provider] = controller
+    return controller
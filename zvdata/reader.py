@@ -1,15 +1,57 @@
 # -*- coding: utf-8 -*-
 import json
 import logging
+import threading
 import time
-from typing import List, Union
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from typing import List, Union, Dict
 
+import numpy as np
 import pandas as pd
+from sqlalchemy import and_, or_
+from sqlalchemy.exc import OperationalError
+from sqlalchemy.sql import operators
 
 from zvdata import IntervalLevel, Mixin, EntityMixin
 from zvdata.api import get_entities
+from zvdata.contract import get_db_session, get_db_name
+from zvdata.dispatcher import ListenerDispatcher
+from zvdata.notify import get_change_notifier, SqliteChangeWatcher, DataChangedEvent
+from zvdata.ring_buffer import EntityRingBuffers
+from zvdata.snapshot import get_snapshot_key, load_snapshot, save_snapshot, get_rewritten_timestamp, \
+    enable_rewrite_tracking
+from zvdata.trading_calendar import to_trading_calendar
 from zvdata.utils.pd_utils import pd_is_not_null
-from zvdata.utils.time_utils import to_pd_timestamp, now_pd_timestamp
+from zvdata.utils.time_utils import to_pd_timestamp, now_pd_timestamp, to_bar_timestamps
+
+# the entities are grouped by their watermarks in at most the predicates for querying the rows after the watermarks
+MAX_WATERMARK_GROUPS = 32
+
+
+def sort_by_order(df: pd.DataFrame, order) -> pd.DataFrame:
+    """
+    sort the df by the sqlalchemy order of the query,e.g. Kdata.timestamp.desc(),the column or the index level with
+    the same name is used
+
+    """
+    orders = order if isinstance(order, (list, tuple)) else [order]
+    keys = {}
+    ascending = []
+    for i, the_order in enumerate(orders):
+        if isinstance(the_order, str):
+            name = the_order
+            ascending.append(True)
+        else:
+            name = getattr(the_order, 'element', the_order).key
+            ascending.append(getattr(the_order, 'modifier', None) is not operators.desc_op)
+        if name in df.columns:
+            keys[i] = df[name].values
+        else:
+            keys[i] = df.index.get_level_values(name).values
+
+    positions = pd.DataFrame(keys).sort_values(by=list(keys), ascending=ascending, kind='mergesort').index
+    return df.iloc[positions]
 
 
 class DataListener(object):
@@ -63,7 +105,31 @@ class DataReader(object):
                  level: IntervalLevel = IntervalLevel.LEVEL_1DAY,
                  category_field: str = 'entity_id',
                  time_field: str = 'timestamp',
-                 computing_window: int = None) -> None:
+                 computing_window: int = None,
+                 change_notification: str = None,
+                 snapshot: bool = False,
+                 listener_dispatch: str = 'sync',
+                 backpressure: str = 'block',
+                 listener_queue_size: int = 100,
+                 trading_calendar=None) -> None:
+        """
+
+        :param change_notification: None for polling the db in move_on,'local' for waiting the changes published in
+        this process,'sqlite' for also watching the commits of other processes to the sqlite db
+        :type change_notification: str
+        :param snapshot: whether load the data from the snapshot saved last time and only fetch the rows after it
+        :type snapshot: bool
+        :param listener_dispatch: 'sync' for calling the listeners one by one,'thread' for calling every listener in
+        its own thread
+        :type listener_dispatch: str
+        :param backpressure: the policy if the queue of the listener is full in thread mode,block,drop_oldest or
+        coalesce
+        :type backpressure: str
+        :param listener_queue_size: the max calls waiting for every listener
+        :type listener_queue_size: int
+        :param trading_calendar: the TradingCalendar or its name for building the gap-free index of the level
+        :type trading_calendar: Union[TradingCalendar, str]
+        """
         self.logger = logging.getLogger(self.__class__.__name__)
 
         self.data_schema = data_schema
@@ -111,6 +177,7 @@ class DataReader(object):
             self.level = IntervalLevel(level)
         else:
             self.level = level
+        self.trading_calendar = to_trading_calendar(trading_calendar)
 
         self.category_field = category_field
         self.time_field = time_field
@@ -132,13 +199,80 @@ class DataReader(object):
             # always add category_column and time_field for normalizing
             self.columns = list(set(self.columns) | {self.category_col, self.time_col})
 
-        self.data_listeners: List[DataListener] = []
-
-        self.data_df: pd.DataFrame = None
+        self.dispatcher = ListenerDispatcher(mode=listener_dispatch, policy=backpressure,
+                                             queue_size=listener_queue_size)
+        # the listeners appended to it directly are dispatched too
+        self.data_listeners: List[DataListener] = self.dispatcher.listeners
+
+        # the rows of every entity are kept in its own ring buffer with capacity computing_window
+        self.data_store = EntityRingBuffers(capacity=self.computing_window, category_field=self.category_field,
+                                            time_field=self.time_field)
+        # (the df of data_store,the df sorted by order) for sorting it once
+        self._ordered_df = (None, None)
+
+        # the entities changed since last checking,None means all of them
+        self.changed_entity_ids = set()
+        self.changed_lock = threading.Lock()
+        self.changed_event = threading.Event()
+
+        self.snapshot = snapshot
+        if self.snapshot and (self.order is not None or self.limit):
+            self.logger.warning('snapshot is not supported with order or limit')
+            self.snapshot = False
+
+        self.change_notification = change_notification
+        self.change_watcher = None
+        if self.change_notification:
+            get_change_notifier().subscribe(self.provider, self.data_schema, self.on_data_changed_event)
+            if self.change_notification == 'sqlite':
+                self.change_watcher = SqliteChangeWatcher(self.provider, self.data_schema,
+                                                          self.on_data_changed_event).start()
 
         self.load_data()
 
+    @property
+    def data_df(self) -> pd.DataFrame:
+        """
+        the multiple index(category_column,timestamp) DataFrame materialized from the ring buffers,sorted by order if
+        set.it's cached until the data changed by move_on,so the listeners share it and shouldn't change it,use
+        copy_data_df for changing
+
+        """
+        df = self.data_store.to_df()
+        if df is None or self.order is None:
+            return df
+        source_df, ordered_df = self._ordered_df
+        if source_df is not df:
+            ordered_df = sort_by_order(df, self.order)
+            self._ordered_df = (df, ordered_df)
+        return ordered_df
+
+    @data_df.setter
+    def data_df(self, df: pd.DataFrame):
+        self.data_store.clear()
+        # keep all the data set directly,it's cut by computing_window in move_on
+        self.data_store.append_df(df, trim=False)
+
+    def copy_data_df(self) -> pd.DataFrame:
+        """
+        the copy of data_df,changing it doesn't change the data of the reader
+
+        """
+        df = self.data_df
+        return None if df is None else df.copy()
+
     def load_window_df(self, provider, data_schema, window):
+        try:
+            window_df = data_schema.query_window_data(window=window, provider=provider, entity_ids=self.entity_ids,
+                                                      index=[self.category_field, self.time_field],
+                                                      category_field=self.category_field, time_field=self.time_field)
+            if pd_is_not_null(window_df):
+                return window_df
+            return None
+        except OperationalError as e:
+            # the db not supporting window function,e.g. sqlite < 3.25
+            self.logger.warning(f'load window df with window function failed:{e},query entity by entity')
+
         window_df = None
 
         dfs = []
@@ -155,28 +289,219 @@ class DataReader(object):
             window_df = window_df.sort_index(level=[0, 1])
         return window_df
 
+    def get_snapshot_key(self) -> str:
+        return get_snapshot_key(data_schema=self.data_schema, provider=self.provider, columns=self.columns,
+                                filters=self.filters, level=self.level, entity_ids=self.entity_ids,
+                                start_timestamp=self.start_timestamp, category_field=self.category_field,
+                                time_field=self.time_field)
+
+    def load_snapshot_df(self) -> pd.DataFrame:
+        """
+        load the snapshot and fetch the rows from the watermark of every entity,the last bar saved is fetched again
+        because it may be not finished when saved
+
+        """
+        key = self.get_snapshot_key()
+        # the rows rewritten from now are recorded for the snapshot
+        enable_rewrite_tracking(self.provider, self.data_schema)
+        # the rows rewritten during the query would be found next time
+        created_time = time.time()
+
+        df, snapshot_time = load_snapshot(key)
+        if pd_is_not_null(df):
+            rewritten_timestamp = get_rewritten_timestamp(self.provider, self.data_schema, since=snapshot_time)
+            if rewritten_timestamp is not None:
+                self.logger.info(f'snapshot {key} is rewritten from {rewritten_timestamp}')
+                df = df[df.index.get_level_values(1) < rewritten_timestamp]
+
+        if not pd_is_not_null(df):
+            df = self.data_schema.query_data(entity_ids=self.entity_ids, provider=self.provider,
+                                             columns=self.columns, start_timestamp=self.start_timestamp,
+                                             end_timestamp=self.end_timestamp, filters=self.filters,
+                                             level=self.level, index=[self.category_field, self.time_field],
+                                             time_field=self.time_field)
+        else:
+            watermarks = pd.Series(df.index.get_level_values(1), index=df.index.get_level_values(0)).groupby(
+                level=0).max()
+
+            dfs = [df[df.index.get_level_values(1).values < watermarks.reindex(df.index.get_level_values(0)).values]]
+
+            filters = [self.get_watermark_filter(watermarks, inclusive=True)]
+            if self.filters:
+                filters = self.filters + filters
+            added_df = self.data_schema.query_data(provider=self.provider,
+                                                   columns=self.columns, end_timestamp=self.end_timestamp,
+                                                   filters=filters, level=self.level,
+                                                   index=[self.category_field, self.time_field],
+                                                   time_field=self.time_field)
+            if pd_is_not_null(added_df):
+                entity_watermarks = watermarks.reindex(added_df.index.get_level_values(0)).values
+                dfs.append(added_df[pd.isnull(entity_watermarks) | (
+                        added_df.index.get_level_values(1).values >= entity_watermarks)])
+
+            # the entities not in the snapshot
+            new_entity_ids = None
+            new_filters = self.filters
+            if self.entity_ids:
+                new_entity_ids = list(set(self.entity_ids) - set(watermarks.index))
+            else:
+                new_filters = (self.filters or []) + [self.category_col.notin_(watermarks.index.tolist())]
+            if new_entity_ids is None or new_entity_ids:
+                new_df = self.data_schema.query_data(entity_ids=new_entity_ids, provider=self.provider,
+                                                     columns=self.columns, start_timestamp=self.start_timestamp,
+                                                     end_timestamp=self.end_timestamp, filters=new_filters,
+                                                     level=self.level,
+                                                     index=[self.category_field, self.time_field],
+                                                     time_field=self.time_field)
+                if pd_is_not_null(new_df):
+                    dfs.append(new_df)
+
+            df = pd.concat(dfs, sort=False)
+            df = df.sort_index(level=[0, 1])
+
+        if pd_is_not_null(df):
+            save_snapshot(key, df, created_time=created_time)
+            # the snapshot may be saved with a later end_timestamp
+            if self.end_timestamp:
+                df = df[df.index.get_level_values(1) <= self.end_timestamp]
+        return df
+
     def load_data(self):
         self.logger.info('load_data start')
         start_time = time.time()
 
-        self.data_df = self.data_schema.query_data(entity_ids=self.entity_ids,
-                                                   provider=self.provider, columns=self.columns,
-                                                   start_timestamp=self.start_timestamp,
-                                                   end_timestamp=self.end_timestamp, filters=self.filters,
-                                                   order=self.order,
-                                                   limit=self.limit,
-                                                   level=self.level,
-                                                   index=[self.category_field, self.time_field],
-                                                   time_field=self.time_field)
+        if self.snapshot:
+            self.data_df = self.load_snapshot_df()
+        else:
+            self.data_df = self.data_schema.query_data(entity_ids=self.entity_ids,
+                                                       provider=self.provider, columns=self.columns,
+                                                       start_timestamp=self.start_timestamp,
+                                                       end_timestamp=self.end_timestamp, filters=self.filters,
+                                                       order=self.order,
+                                                       limit=self.limit,
+                                                       level=self.level,
+                                                       index=[self.category_field, self.time_field],
+                                                       time_field=self.time_field)
 
         cost_time = time.time() - start_time
         self.logger.info('load_data finished, cost_time:{}'.format(cost_time))
 
-        for listener in self.data_listeners:
-            listener.on_data_loaded(self.data_df)
+        self.dispatcher.dispatch('on_data_loaded', self.data_df)
+
+    def get_target_index(self, start_timestamp=None, end_timestamp=None,
+                         kdata_use_begin_time: bool = False) -> pd.DatetimeIndex:
+        """
+        the timestamps of all the bars of the level in the trading sessions,for filling the data of the entities to
+        the same index without gaps,None if no trading_calendar
+
+        """
+        if not self.trading_calendar or not self.level or self.level == IntervalLevel.LEVEL_TICK:
+            return None
+
+        df = self.data_store.to_df()
+        if start_timestamp is None:
+            start_timestamp = self.start_timestamp
+            if start_timestamp is None and pd_is_not_null(df):
+                start_timestamp = df.index.get_level_values(1).min()
+        if end_timestamp is None:
+            end_timestamp = self.end_timestamp
+            if end_timestamp is None and pd_is_not_null(df):
+                end_timestamp = df.index.get_level_values(1).max()
+        if start_timestamp is None or end_timestamp is None:
+            return None
+
+        return self.trading_calendar.bar_timestamps(start_timestamp, end_timestamp, level=self.level,
+                                                    kdata_use_begin_time=kdata_use_begin_time)
+
+    def get_watermarks(self) -> pd.Series:
+        """
+        the latest timestamp of every entity in data_df
+
+        """
+        return self.data_store.watermarks()
+
+    def get_watermark_filter(self, watermarks: pd.Series, inclusive: bool = False):
+        """
+        the filter of the rows after the watermark of every entity,the entities with the same watermark are in one
+        predicate,the watermarks are bucketed to MAX_WATERMARK_GROUPS predicates at most and the smallest one of the
+        bucket is used,so the rows got should be filtered by the watermarks again
+
+        :param watermarks: entity_id -> the watermark
+        :type watermarks: pd.Series
+        :param inclusive: the rows at the watermark are included if True
+        :type inclusive: bool
+        """
+        watermarks = watermarks.sort_values()
+        distinct = watermarks.unique()
+        buckets = np.searchsorted(distinct, watermarks.values) * min(len(distinct), MAX_WATERMARK_GROUPS) // len(
+            distinct)
+
+        predicates = []
+        for _, group in watermarks.groupby(buckets):
+            watermark = group.iloc[0]
+            time_filter = self.time_col >= watermark if inclusive else self.time_col > watermark
+            predicates.append(and_(self.category_col.in_(group.index.tolist()), time_filter))
+        return or_(*predicates)
+
+    def load_added_df(self, watermarks: pd.Series, to_timestamp=None) -> pd.DataFrame:
+        """
+        load the data newer than the watermark of every entity in one query
+
+        :param watermarks: entity_id -> latest timestamp got
+        :type watermarks: pd.Series
+        :param to_timestamp:
+        :type to_timestamp:
+        :return:
+        :rtype: pd.DataFrame
+        """
+        added_filter = [self.get_watermark_filter(watermarks)]
+        if self.filters:
+            filters = self.filters + added_filter
+        else:
+            filters = added_filter
+
+        added_df = self.data_schema.query_data(provider=self.provider,
+                                               columns=self.columns,
+                                               end_timestamp=to_timestamp, filters=filters, level=self.level,
+                                               index=[self.category_field, self.time_field],
+                                               time_field=self.time_field)
+
+        if pd_is_not_null(added_df):
+            # the bucket uses its min watermark,drop the rows got before for other entities
+            entity_watermarks = watermarks.reindex(added_df.index.get_level_values(0)).values
+            added_df = added_df[added_df.index.get_level_values(1).values > entity_watermarks]
+        return added_df
+
+    def on_data_changed_event(self, event: DataChangedEvent):
+        with self.changed_lock:
+            if event.entity_ids is None or self.changed_entity_ids is None:
+                self.changed_entity_ids = None
+            else:
+                self.changed_entity_ids.update(event.entity_ids)
+        self.changed_event.set()
+
+    def pop_changed_entity_ids(self):
+        """
+        the entities changed since last calling,None means all of them
+
+        """
+        with self.changed_lock:
+            changed_entity_ids = self.changed_entity_ids
+            self.changed_entity_ids = set()
+            self.changed_event.clear()
+        return changed_entity_ids
+
+    def close(self):
+        self.dispatcher.close()
+        if self.change_notification:
+            get_change_notifier().unsubscribe(self.provider, self.data_schema, self.on_data_changed_event)
+        if self.change_watcher:
+            self.change_watcher.stop()
+            self.change_watcher = None
 
     def move_on(self, to_timestamp: Union[str, pd.Timestamp] = None,
-                timeout: int = 20) -> object:
+                timeout: int = 20,
+                poll_interval: float = 1) -> object:
         """
         using continual fetching data in realtime
         1)get the data happened before to_timestamp,if not set,get all the data which means to now
@@ -185,92 +510,427 @@ class DataReader(object):
 
         :param to_timestamp:
         :type to_timestamp:
-        :param timeout:
+        :param timeout: seconds to wait for every entity getting new data
         :type timeout: int
+        :param poll_interval: seconds to wait between two queries,not used if change_notification set
+        :type poll_interval: float
         :return:
         :rtype:
         """
-        if not pd_is_not_null(self.data_df):
+        if not len(self.data_store):
             self.load_data()
             return
 
         start_time = time.time()
 
         # FIXME:we suppose history data should be there at first
-        has_got = []
+        watermarks = self.get_watermarks()
+        waiting_watermarks = watermarks
         dfs = []
-        changed = False
+        first = True
         while True:
-            for entity_id, df in self.data_df.groupby(level=0):
-                if entity_id in has_got:
-                    continue
+            query_watermarks = waiting_watermarks
+            if self.change_notification:
+                changed_entity_ids = self.pop_changed_entity_ids()
+                # only query the changed entities after the first query
+                if not first and changed_entity_ids is not None:
+                    query_watermarks = waiting_watermarks[waiting_watermarks.index.isin(changed_entity_ids)]
+            first = False
+
+            added_df = None
+            if not query_watermarks.empty:
+                added_df = self.load_added_df(query_watermarks, to_timestamp=to_timestamp)
+
+            if pd_is_not_null(added_df):
+                self.logger.info(f'got new data:{added_df.to_json(orient="records", force_ascii=False)}')
+
+                for entity_id, df in added_df.groupby(level=0):
+                    self.dispatcher.dispatch('on_entity_data_changed', entity=entity_id, added_data=df)
+
+                dfs.append(added_df)
+                # if got data,just move to another entity_id
+                got_entity_ids = added_df.index.get_level_values(0).unique()
+                waiting_watermarks = waiting_watermarks.drop(got_entity_ids)
+
+            if waiting_watermarks.empty:
+                break
 
-                recorded_timestamp = df.index.levels[1].max()
+            cost_time = time.time() - start_time
+            if cost_time > timeout:
+                self.logger.warning(
+                    'category:{} level:{} getting data timeout,to_timestamp:{},now:{}'.format(
+                        waiting_watermarks.index.tolist(), self.level, to_timestamp, now_pd_timestamp()))
+                break
 
-                # move_on读取数据，表明之前的数据已经处理完毕，只需要保留computing_window的数据
-                if self.computing_window:
-                    df = df.iloc[-self.computing_window:]
+            if self.change_notification:
+                self.changed_event.wait(timeout - cost_time)
+            else:
+                time.sleep(poll_interval)
 
-                added_filter = [self.category_col == entity_id, self.time_col > recorded_timestamp]
-                if self.filters:
-                    filters = self.filters + added_filter
-                else:
-                    filters = added_filter
-
-                added_df = self.data_schema.query_data(provider=self.provider,
-                                                       columns=self.columns,
-                                                       end_timestamp=to_timestamp, filters=filters, level=self.level,
-                                                       index=[self.category_field, self.time_field])
-
-                if pd_is_not_null(added_df):
-                    self.logger.info(f'got new data:{df.to_json(orient="records", force_ascii=False)}')
-
-                    for listener in self.data_listeners:
-                        listener.on_entity_data_changed(entity=entity_id, added_data=added_df)
-                    # if got data,just move to another entity_id
-                    changed = True
-                    has_got.append(entity_id)
-                    df = df.append(added_df, sort=False)
-                    dfs.append(df)
-                else:
-                    cost_time = time.time() - start_time
-                    if cost_time > timeout:
-                        # if timeout,just add the old data
-                        has_got.append(entity_id)
-                        dfs.append(df)
-                        self.logger.warning(
-                            'category:{} level:{} getting data timeout,to_timestamp:{},now:{}'.format(entity_id,
-                                                                                                      self.level,
-                                                                                                      to_timestamp,
-                                                                                                      now_pd_timestamp()))
-                        continue
-
-            if len(has_got) == len(self.data_df.index.levels[0]):
+        if dfs:
+            # move_on读取数据，表明之前的数据已经处理完毕，只需要保留computing_window的数据
+            self.data_store.trim()
+            for df in dfs:
+                self.data_store.append_df(df)
+
+            self.dispatcher.dispatch('on_data_changed', self.data_df)
+
+    def register_data_listener(self, listener):
+        self.dispatcher.add(listener)
+
+        # notify it once after registered
+        if len(self.data_store):
+            self.dispatcher.dispatch_to(listener, 'on_data_loaded', self.data_df)
+
+    def deregister_data_listener(self, listener):
+        self.dispatcher.remove(listener)
+
+    def wait_listeners(self, timeout: float = None) -> bool:
+        """
+        wait until the listeners finish the data dispatched in thread mode
+
+        """
+        return self.dispatcher.join(timeout)
+
+    def listener_stats(self) -> dict:
+        """
+        the latency histogram of every listener,and the dropped,coalesced,pending calls in thread mode
+
+        """
+        return self.dispatcher.stats()
+
+    def empty(self):
+        return not len(self.data_store)
+
+
+class ChunkedDataReader(DataReader):
+    """
+    load the data of [start_timestamp,end_timestamp] chunk by chunk for the long backtests,the next chunks are
+    prefetched in the background thread and the data older than computing_window is dropped,so the memory is bounded
+    whatever the total range is
+    """
+
+    def __init__(self, *args, chunk_size: Union[str, pd.Timedelta] = '30D', prefetch_chunks: int = 1,
+                 **kwargs) -> None:
+        """
+
+        :param chunk_size: the time range of one chunk
+        :type chunk_size: Union[str, pd.Timedelta]
+        :param prefetch_chunks: the chunks loaded ahead in the background
+        :type prefetch_chunks: int
+        """
+        self.chunk_size = pd.Timedelta(chunk_size)
+        self.prefetch_chunks = max(1, prefetch_chunks)
+
+        self.executor = ThreadPoolExecutor(max_workers=1)
+        self.futures = deque()
+        self.next_chunk_start = None
+        # the rows of the chunk after to_timestamp of last move_on
+        self.pending_df = None
+
+        super().__init__(*args, **kwargs)
+
+        if not self.computing_window:
+            self.logger.warning('computing_window not set,all the chunks would be kept in memory')
+
+    def load_chunk(self, start: pd.Timestamp, end: pd.Timestamp) -> pd.DataFrame:
+        """
+        load the data in [start,end),it's called in the prefetch thread with its own session
+
+        """
+        session = get_db_session(provider=self.provider, data_schema=self.data_schema, force_new=True)
+        try:
+            filters = [self.time_col < end]
+            if self.filters:
+                filters = self.filters + filters
+            return self.data_schema.query_data(entity_ids=self.entity_ids, provider=self.provider,
+                                               columns=self.columns, start_timestamp=start,
+                                               end_timestamp=self.end_timestamp, filters=filters,
+                                               order=self.order, level=self.level, session=session,
+                                               index=[self.category_field, self.time_field],
+                                               time_field=self.time_field)
+        finally:
+            session.close()
+
+    def prefetch(self):
+        while len(self.futures) < self.prefetch_chunks and self.next_chunk_start <= self.end_timestamp:
+            start = self.next_chunk_start
+            self.next_chunk_start = start + self.chunk_size
+            self.futures.append(self.executor.submit(self.load_chunk, start, self.next_chunk_start))
+
+    def has_more_chunks(self) -> bool:
+        return bool(self.futures) or self.next_chunk_start <= self.end_timestamp
+
+    def take_chunk(self) -> pd.DataFrame:
+        self.prefetch()
+        if not self.futures:
+            return None
+        df = self.futures.popleft().result()
+        # keep loading the next chunks while the data is being computed
+        self.prefetch()
+        return df
+
+    def finished(self) -> bool:
+        return self.pending_df is None and not self.has_more_chunks()
+
+    def load_data(self):
+        # it's called in __init__ before any chunk loaded
+        if self.start_timestamp is None or self.end_timestamp is None:
+            raise ValueError(f'{self.__class__.__name__} needs both start_timestamp and end_timestamp to split the '
+                             f'chunks,got start_timestamp:{self.start_timestamp},end_timestamp:{self.end_timestamp}')
+
+        self.logger.info('load_data start')
+        start_time = time.time()
+
+        for future in self.futures:
+            future.cancel()
+        self.futures.clear()
+        self.next_chunk_start = self.start_timestamp
+        self.pending_df = None
+
+        self.data_df = self.take_chunk()
+
+        cost_time = time.time() - start_time
+        self.logger.info('load_data finished, cost_time:{}'.format(cost_time))
+
+        self.dispatcher.dispatch('on_data_loaded', self.data_df)
+
+    def move_on(self, to_timestamp: Union[str, pd.Timestamp] = None,
+                timeout: int = 20,
+                poll_interval: float = 1) -> object:
+        """
+        move to the data before to_timestamp,if not set,move to the next chunk with data
+
+        :param to_timestamp:
+        :type to_timestamp:
+        :param timeout: not used
+        :param poll_interval: not used
+        """
+        if to_timestamp is not None:
+            to_timestamp = to_pd_timestamp(to_timestamp)
+
+        dfs = []
+        while True:
+            if self.pending_df is None:
+                if not self.has_more_chunks():
+                    break
+                df = self.take_chunk()
+                if pd_is_not_null(df):
+                    self.pending_df = df
+                continue
+
+            if to_timestamp is None:
+                dfs.append(self.pending_df)
+                self.pending_df = None
+                break
+
+            mask = self.pending_df.index.get_level_values(1) <= to_timestamp
+            if mask.any():
+                dfs.append(self.pending_df[mask])
+            if mask.all():
+                self.pending_df = None
+            else:
+                self.pending_df = self.pending_df[~mask]
                 break
 
         if dfs:
-            self.data_df = pd.concat(dfs, sort=False)
-            self.data_df.sort_index(level=[0, 1])
+            added_df = pd.concat(dfs)
+            for entity_id, df in added_df.groupby(level=0):
+                self.dispatcher.dispatch('on_entity_data_changed', entity=entity_id, added_data=df)
 
-            if changed:
-                for listener in self.data_listeners:
-                    listener.on_data_changed(self.data_df)
+            self.data_store.trim()
+            self.data_store.append_df(added_df)
 
-    def register_data_listener(self, listener):
+            self.dispatcher.dispatch('on_data_changed', self.data_df)
+
+    def close(self):
+        for future in self.futures:
+            future.cancel()
+        self.futures.clear()
+        self.executor.shutdown(wait=False)
+        super().close()
+
+
+class MultiLevelDataListener(object):
+    def on_data_loaded(self, data: Dict[IntervalLevel, pd.DataFrame]) -> object:
+        """
+
+        Parameters
+        ----------
+        data : level -> the data loaded at first time
+        """
+        raise NotImplementedError
+
+    def on_data_changed(self, data: Dict[IntervalLevel, pd.DataFrame]) -> object:
+        """
+
+        Parameters
+        ----------
+        data : level -> the data after move_on
+        """
+        raise NotImplementedError
+
+
+class MultiLevelDataReader(object):
+    """
+    the readers of several levels for the same entities,they're loaded in parallel and moved on together
+
+    every finer bar knows the position of its enclosing coarser bar in the data_df of the coarser level,the positions
+    are computed after loading and moving on instead of being looked up per tick
+    """
+    logger = logging.getLogger(__name__)
+
+    def __init__(self,
+                 level_map_schema: Dict[IntervalLevel, Mixin],
+                 entity_schema: EntityMixin,
+                 provider: str = None,
+                 entity_provider: str = None,
+                 entity_ids: List[str] = None,
+                 exchanges: List[str] = None,
+                 codes: List[str] = None,
+                 start_timestamp: Union[str, pd.Timestamp] = None,
+                 end_timestamp: Union[str, pd.Timestamp] = None,
+                 columns: List = None,
+                 filters: List = None,
+                 computing_window: int = None,
+                 kdata_use_begin_time: bool = False) -> None:
+        """
+
+        :param level_map_schema: level -> data_schema
+        :type level_map_schema: Dict[IntervalLevel, Mixin]
+        :param kdata_use_begin_time: whether the timestamp of the intraday bar is its begin time
+        :type kdata_use_begin_time: bool
+        """
+        self.logger = logging.getLogger(self.__class__.__name__)
+
+        self.level_map_schema = {IntervalLevel(level): schema for level, schema in level_map_schema.items()}
+        # from the finest to the coarsest
+        self.levels = sorted(self.level_map_schema.keys())
+        self.kdata_use_begin_time = kdata_use_begin_time
+
+        # 只获取一次entity_ids
+        if entity_schema and not entity_ids:
+            df = get_entities(entity_schema=entity_schema, provider=entity_provider, exchanges=exchanges,
+                              codes=codes)
+            if pd_is_not_null(df):
+                entity_ids = df['entity_id'].to_list()
+        self.entity_ids = entity_ids
+
+        self.data_listeners: List[MultiLevelDataListener] = []
+
+        # (finer level,coarser level) -> the positions of the enclosing bars
+        self.enclosing_index: Dict[tuple, np.ndarray] = {}
+
+        def create_reader(level):
+            return DataReader(data_schema=self.level_map_schema[level], entity_schema=None, provider=provider,
+                              entity_ids=self.entity_ids, start_timestamp=start_timestamp,
+                              end_timestamp=end_timestamp, columns=columns, filters=filters, level=level,
+                              computing_window=computing_window)
+
+        start_time = time.time()
+        readers = self.run_by_db(create_reader)
+        self.readers: Dict[IntervalLevel, DataReader] = {level: readers[level] for level in self.levels}
+        self.logger.info('load_data finished, cost_time:{}'.format(time.time() - start_time))
+
+        self.update_enclosing_index()
+
+    def run_by_db(self, func, levels: List[IntervalLevel] = None) -> dict:
+        """
+        call func(level) in parallel,the levels in the same db are called in one thread for sharing the session
+
+        :param levels: all the levels if not set
+        :type levels: List[IntervalLevel]
+        """
+        db_map_levels = {}
+        for level in (self.levels if levels is None else levels):
+            db_map_levels.setdefault(get_db_name(data_schema=self.level_map_schema[level]), []).append(level)
+
+        def run_levels(levels):
+            return {level: func(level) for level in levels}
+
+        result = {}
+        with ThreadPoolExecutor(max_workers=len(db_map_levels)) as executor:
+            for level_map_result in executor.map(run_levels, db_map_levels.values()):
+                result.update(level_map_result)
+        return result
+
+    def floor_timestamps(self, timestamps: pd.DatetimeIndex, level: IntervalLevel) -> pd.DatetimeIndex:
+        """
+        the timestamp of the bar of the level which the finer bar belongs to
+
+        """
+        return to_bar_timestamps(timestamps, level, kdata_use_begin_time=self.kdata_use_begin_time)
+
+    def update_enclosing_index(self):
+        self.enclosing_index = {}
+        for i, level in enumerate(self.levels):
+            df = self.readers[level].data_df
+            for coarse_level in self.levels[i + 1:]:
+                coarse_df = self.readers[coarse_level].data_df
+                if not pd_is_not_null(df) or not pd_is_not_null(coarse_df):
+                    self.enclosing_index[(level, coarse_level)] = np.full(
+                        len(df) if pd_is_not_null(df) else 0, -1, dtype=np.int64)
+                    continue
+
+                keys = pd.MultiIndex.from_arrays(
+                    [df.index.get_level_values(0),
+                     self.floor_timestamps(pd.DatetimeIndex(df.index.get_level_values(1)), coarse_level)])
+                self.enclosing_index[(level, coarse_level)] = coarse_df.index.get_indexer(keys)
+
+    def get_enclosing_index(self, level: IntervalLevel, coarse_level: IntervalLevel) -> np.ndarray:
+        """
+        the positions in the data_df of coarse_level for the rows in the data_df of level,-1 if not found
+
+        """
+        return self.enclosing_index[(IntervalLevel(level), IntervalLevel(coarse_level))]
+
+    def get_data_df(self, level: IntervalLevel) -> pd.DataFrame:
+        return self.readers[IntervalLevel(level)].data_df
+
+    def get_data(self) -> Dict[IntervalLevel, pd.DataFrame]:
+        return {level: reader.data_df for level, reader in self.readers.items()}
+
+    def move_on(self, to_timestamp: Union[str, pd.Timestamp] = None,
+                timeout: int = 20,
+                poll_interval: float = 1) -> object:
+        """
+        move on all the levels and notify the listeners once,only the finest level waits for its new bars in timeout
+
+        """
+        watermarks = {level: reader.get_watermarks() if not reader.empty() else None for level, reader in
+                      self.readers.items()}
+
+        self.readers[self.levels[0]].move_on(to_timestamp=to_timestamp, timeout=timeout, poll_interval=poll_interval)
+        # the coarser bar not closed yet is not waited,it's got in the later move_on after closed
+        if len(self.levels) > 1:
+            self.run_by_db(lambda level: self.readers[level].move_on(to_timestamp=to_timestamp, timeout=0,
+                                                                     poll_interval=poll_interval),
+                           levels=self.levels[1:])
+
+        changed = False
+        for level, reader in self.readers.items():
+            current = reader.get_watermarks() if not reader.empty() else None
+            if current is None or watermarks[level] is None:
+                changed = changed or (current is not None)
+            elif not current.equals(watermarks[level]):
+                changed = True
+
+        if changed:
+            self.update_enclosing_index()
+            for listener in self.data_listeners:
+                listener.on_data_changed(self.get_data())
+
+    def register_data_listener(self, listener: MultiLevelDataListener):
         if listener not in self.data_listeners:
             self.data_listeners.append(listener)
 
         # notify it once after registered
-        if pd_is_not_null(self.data_df):
-            listener.on_data_loaded(self.data_df)
+        listener.on_data_loaded(self.get_data())
 
-    def deregister_data_listener(self, listener):
+    def deregister_data_listener(self, listener: MultiLevelDataListener):
         if listener in self.data_listeners:
             self.data_listeners.remove(listener)
 
-    def empty(self):
-        return not pd_is_not_null(self.data_df)
-
 
 if __name__ == '__main__':
     from zvt.domain import Stock1dKdata, Stock
@@ -1,18 +1,30 @@
 # -*- coding: utf-8 -*-
+import json
 import logging
+import os
 import time
 import uuid
 from typing import List
 
+import numpy as np
 import pandas as pd
 from sqlalchemy.orm import Session
 
 from zvdata import IntervalLevel, Mixin, EntityMixin
-from zvdata.api import get_entities, get_data
-from zvdata.contract import get_db_session, get_schema_columns
+from zvdata.api import get_entities, get_data, df_to_db
+from zvdata.contract import get_db_session, get_schema_columns, zvdata_env
+from zvdata.metrics import RecorderMetrics, MetricsSink
+from zvdata.notify import publish_data_changed
+from zvdata.rate_control import get_rate_controller, get_circuit_breaker, is_transient_error, backoff_with_jitter, \
+    ThrottledError, CircuitOpenError
+from zvdata.scheduler import BarCloseScheduler
+from zvdata.snapshot import mark_rewritten
+from zvdata.trading_calendar import to_trading_calendar
+from zvdata.utils.pd_utils import pd_is_not_null
 from zvdata.utils.time_utils import to_pd_timestamp, TIME_FORMAT_DAY, to_time_str, \
-    evaluate_size_from_timestamp, is_in_same_interval
-from zvdata.utils.utils import fill_domain_from_dict
+    evaluate_size_from_timestamp, is_in_same_interval, to_bar_timestamps, to_time_strs, TIME_FORMAT_ISO8601, \
+    now_pd_timestamp
+from zvdata.utils.utils import compile_field_mapper
 
 
 class Meta(type):
@@ -35,6 +47,13 @@ class Recorder(metaclass=Meta):
 
     url = None
 
+    # set it to True to tune the request rate by AdaptiveRateController instead of the fixed sleeping_time
+    adaptive_rate: bool = False
+    # retry times for the transient errors of the provider
+    max_retries: int = 3
+    # base seconds of the exponential backoff between the retries
+    backoff_base: float = 1
+
     def __init__(self,
                  batch_size: int = 10,
                  force_update: bool = False,
@@ -63,13 +82,111 @@ class Recorder(metaclass=Meta):
         self.session = get_db_session(provider=self.provider,
                                       data_schema=self.data_schema)
 
+        # stage timers and counters of the run
+        self.metrics = RecorderMetrics(recorder=self.__class__.__name__, provider=self.provider,
+                                       data_schema=self.data_schema.__name__)
+        self.metrics_sinks: List[MetricsSink] = []
+
+        # shared by the recorders of the same provider
+        self.circuit_breaker = get_circuit_breaker(self.provider)
+        self.rate_controller = get_rate_controller(self.provider) if self.adaptive_rate else None
+
     def run(self):
         raise NotImplementedError
 
+    def is_transient_error(self, e: Exception) -> bool:
+        """
+        whether the error could be recovered by retrying,overwrite it for the provider specific errors
+
+        """
+        return is_transient_error(e)
+
+    def request(self, func, *args, **kwargs):
+        """
+        call the provider with exponential backoff on transient errors,the result is used to tune the request rate,
+        it's called directly if adaptive_rate not set
+
+        :param func: the function requesting the provider
+        :type func: function
+        """
+        if not self.adaptive_rate:
+            return func(*args, **kwargs)
+
+        attempt = 0
+        while True:
+            if not self.circuit_breaker.allow_request():
+                raise CircuitOpenError(
+                    f'circuit of {self.provider} is open,retry after {self.circuit_breaker.remaining():.1f} seconds')
+
+            start = time.time()
+            try:
+                result = func(*args, **kwargs)
+            except Exception as e:
+                if not self.is_transient_error(e):
+                    raise
+
+                self.circuit_breaker.on_failure()
+                if self.rate_controller:
+                    if isinstance(e, ThrottledError):
+                        self.rate_controller.on_throttled()
+                    else:
+                        self.rate_controller.on_error()
+
+                if attempt >= self.max_retries:
+                    raise
+
+                seconds = backoff_with_jitter(attempt, base=self.backoff_base)
+                self.logger.warning(f'request {self.provider} failed:{e},retry after {seconds:.2f} seconds')
+                self.metrics.incr('retries')
+                with self.metrics.timer('backoff'):
+                    time.sleep(seconds)
+                attempt += 1
+                continue
+
+            self.circuit_breaker.on_success()
+            if self.rate_controller:
+                self.rate_controller.on_success(latency=time.time() - start)
+            return result
+
     def sleep(self):
+        if self.rate_controller:
+            with self.metrics.timer('sleep'):
+                seconds = self.rate_controller.wait()
+            self.logger.debug(f'sleeping {seconds} seconds,current rate:{self.rate_controller.rate}')
+            return
+
         if self.sleeping_time > 0:
             self.logger.info(f'sleeping {self.sleeping_time} seconds')
-            time.sleep(self.sleeping_time)
+            with self.metrics.timer('sleep'):
+                time.sleep(self.sleeping_time)
+
+    def register_metrics_sink(self, sink: MetricsSink):
+        if sink not in self.metrics_sinks:
+            self.metrics_sinks.append(sink)
+
+    def deregister_metrics_sink(self, sink: MetricsSink):
+        if sink in self.metrics_sinks:
+            self.metrics_sinks.remove(sink)
+
+    def on_entity_metrics(self, entity_id, seconds):
+        self.metrics.observe('entity_seconds', seconds)
+        for sink in self.metrics_sinks:
+            try:
+                sink.on_entity_finished(self.metrics, entity_id, seconds)
+            except Exception as e:
+                self.logger.exception(e)
+
+    def on_run_metrics(self):
+        self.metrics.end_time = time.time()
+        summary = self.metrics.summary()
+        self.logger.info('run summary:{}'.format(summary))
+
+        for sink in self.metrics_sinks:
+            try:
+                sink.on_run_finished(self.metrics)
+            except Exception as e:
+                self.logger.exception(e)
+        return summary
 
 
 class RecorderForEntities(Recorder):
@@ -167,6 +284,12 @@ class TimeSeriesDataRecorder(RecorderForEntities):
         self.start_timestamp = to_pd_timestamp(start_timestamp)
         self.end_timestamp = to_pd_timestamp(end_timestamp)
 
+        # the min timestamp of the saved rows updated by force_update,the snapshots should be refreshed from it
+        self.rewritten_timestamp = None
+
+        # compiled from get_data_map on first use
+        self.field_mapper = None
+
         super().__init__(entity_type, exchanges, entity_ids, codes, batch_size, force_update, sleeping_time)
 
     def get_latest_saved_record(self, entity):
@@ -211,6 +334,16 @@ class TimeSeriesDataRecorder(RecorderForEntities):
         """
         return {}
 
+    def get_field_mapper(self):
+        """
+        the function filling the domain from the original data compiled from get_data_map once,reset field_mapper to
+        None if the map changed
+
+        """
+        if self.field_mapper is None:
+            self.field_mapper = compile_field_mapper(self.get_data_map())
+        return self.field_mapper
+
     def record(self, entity, start, end, size, timestamps):
         """
         implement the recording logic in this method, should return json or domain list
@@ -254,12 +387,58 @@ class TimeSeriesDataRecorder(RecorderForEntities):
         timestamp = to_time_str(original_data[self.get_original_time_field()], fmt=time_fmt)
         return "{}_{}".format(entity.id, timestamp)
 
-    def generate_domain(self, entity, original_data):
+    def generate_domain_ids(self, entity, timestamps, time_fmt=TIME_FORMAT_DAY) -> np.ndarray:
+        """
+        the vectorized generate_domain_id for the timestamps of the entity,the ids are the same as generate_domain_id
+
+        :param entity:
+        :type entity:
+        :param timestamps: the original times or the timestamps
+        :type timestamps:
+        :param time_fmt:
+        :type time_fmt:
+        :return:
+        :rtype: np.ndarray
+        """
+        time_strs = to_time_strs(timestamps, fmt=time_fmt)
+        ids = np.full(len(time_strs), None, dtype=object)
+        # None for the time could not be formatted
+        mask = np.not_equal(time_strs, None)
+        ids[mask] = np.char.add(f'{entity.id}_', time_strs[mask].astype(str))
+        return ids
+
+    def generate_original_domain_ids(self, entity, original_list) -> np.ndarray:
+        """
+        the ids of the original list,None if it has the domains or the times could not be parsed in one pass
+
+        """
+        time_field = self.get_original_time_field()
+        try:
+            timestamps = [original_data[time_field] for original_data in original_list]
+            ids = self.generate_domain_ids(entity, timestamps)
+        except Exception:
+            return None
+        # to_time_str keeps the value could not be parsed
+        if any(the_id is None for the_id in ids):
+            return None
+        return ids
+
+    def is_default_domain_id(self) -> bool:
+        """
+        whether the ids are generated by the default generate_domain_id,so generate_domain_ids could be used
+
+        """
+        cls = type(self)
+        return cls.generate_domain_id is TimeSeriesDataRecorder.generate_domain_id and \
+               cls.generate_domain is TimeSeriesDataRecorder.generate_domain
+
+    def generate_domain(self, entity, original_data, the_id=None):
         """
         generate the data_schema instance using entity and original_data,the original_data is from record result
 
         :param entity:
         :param original_data:
+        :param the_id: the id generated already,e.g. by generate_domain_ids
         """
 
         got_new_data = False
@@ -269,7 +448,8 @@ class TimeSeriesDataRecorder(RecorderForEntities):
             got_new_data = True
             return got_new_data, original_data
 
-        the_id = self.generate_domain_id(entity, original_data)
+        if the_id is None:
+            the_id = self.generate_domain_id(entity, original_data)
 
         # optional way
         # item = self.session.query(self.data_schema).get(the_id)
@@ -303,8 +483,11 @@ class TimeSeriesDataRecorder(RecorderForEntities):
             got_new_data = True
         else:
             domain_item = items[0]
+            if domain_item.timestamp and (
+                    self.rewritten_timestamp is None or domain_item.timestamp < self.rewritten_timestamp):
+                self.rewritten_timestamp = domain_item.timestamp
 
-        fill_domain_from_dict(domain_item, original_data, self.get_data_map())
+        self.get_field_mapper()(domain_item, original_data)
         return got_new_data, domain_item
 
     def persist(self, entity, domain_list):
@@ -330,11 +513,25 @@ class TimeSeriesDataRecorder(RecorderForEntities):
                 "persist {} for entity_id:{},time interval:[{},{}]".format(
                     self.data_schema, entity.id, first_timestamp, last_timestamp))
 
-            self.session.add_all(domain_list)
-            self.session.commit()
+            start = time.time()
+            with self.metrics.timer('persist'):
+                self.session.add_all(domain_list)
+                self.session.commit()
+            self.metrics.observe('persist_seconds', time.time() - start)
+
+            publish_data_changed(provider=self.provider, data_schema=self.data_schema, entity_ids=[entity.id],
+                                 timestamp=last_timestamp)
+
+            if self.rewritten_timestamp is not None:
+                mark_rewritten(provider=self.provider, data_schema=self.data_schema,
+                               min_timestamp=self.rewritten_timestamp)
+                self.rewritten_timestamp = None
 
     def on_finish(self):
         try:
+            if self.rate_controller:
+                self.rate_controller.save()
+
             if self.session:
                 self.session.close()
 
@@ -346,18 +543,91 @@ class TimeSeriesDataRecorder(RecorderForEntities):
     def on_finish_entity(self, entity):
         pass
 
+    def record_and_persist(self, entity_item, start_timestamp, end_timestamp, size, timestamps):
+        """
+        record the data of the entity from the provider and persist the new ones
+
+        :return: the original list from record method and whether all of them are duplicated
+        :rtype: (list,bool)
+        """
+        self.metrics.incr('entities')
+        with self.metrics.timer('record'):
+            original_list = self.request(self.record, entity_item, start=start_timestamp,
+                                         end=end_timestamp, size=size, timestamps=timestamps)
+
+        all_duplicated = True
+
+        if original_list:
+            self.metrics.incr('rows_fetched', len(original_list))
+
+            # generate the ids in one pass
+            generated_ids = None
+            if self.is_default_domain_id():
+                with self.metrics.timer('generate_domain'):
+                    generated_ids = self.generate_original_domain_ids(entity_item, original_list)
+
+            domain_list = []
+            domain_ids = set()
+            for i, original_item in enumerate(original_list):
+                with self.metrics.timer('generate_domain'):
+                    if generated_ids is not None:
+                        got_new_data, domain_item = self.generate_domain(entity_item, original_item,
+                                                                         the_id=generated_ids[i])
+                    else:
+                        got_new_data, domain_item = self.generate_domain(entity_item, original_item)
+
+                if got_new_data:
+                    all_duplicated = False
+                    self.metrics.incr('rows_new')
+                else:
+                    self.metrics.incr('rows_duplicated')
+
+                # handle the case  generate_domain_id generate duplicate id
+                if domain_item:
+                    if domain_item.id in domain_ids:
+                        # regenerate the id
+                        if self.fix_duplicate_way == 'add':
+                            domain_item.id = "{}_{}".format(domain_item.id, uuid.uuid1())
+                        # ignore
+                        else:
+                            self.logger.info(f'ignore original duplicate item:{domain_item.id}')
+                            continue
+
+                    domain_ids.add(domain_item.id)
+                    domain_list.append(domain_item)
+
+            if domain_list:
+                self.persist(entity_item, domain_list)
+            else:
+                self.logger.info('just got {} duplicated data in this cycle'.format(len(original_list)))
+
+        return original_list, all_duplicated
+
+    def is_after_close_time(self, timestamp: pd.Timestamp) -> bool:
+        """
+        whether it's 5 minutes after the close time(close_hour:close_minute) of the day
+
+        """
+        if (self.close_hour is None) or (self.close_minute is None):
+            return False
+        close_time = timestamp.normalize() + pd.Timedelta(hours=self.close_hour, minutes=self.close_minute)
+        return timestamp - close_time >= pd.Timedelta(minutes=5)
+
     def run(self):
         finished_items = []
         unfinished_items = self.entities
         raising_exception = None
+        self.metrics.reset()
         while True:
             count = len(unfinished_items)
             for index, entity_item in enumerate(unfinished_items):
+                entity_start = time.time()
                 try:
                     self.logger.info(f'run to {index + 1}/{count}')
 
-                    start_timestamp, end_timestamp, size, timestamps = self.evaluate_start_end_size_timestamps(
-                        entity_item)
+                    with self.metrics.timer('evaluate'):
+                        start_timestamp, end_timestamp, size, timestamps = self.evaluate_start_end_size_timestamps(
+                            entity_item)
                     size = int(size)
 
                     if timestamps:
@@ -391,37 +661,8 @@ class TimeSeriesDataRecorder(RecorderForEntities):
                     if index != 0:
                         self.sleep()
 
-                    original_list = self.record(entity_item, start=start_timestamp, end=end_timestamp, size=size,
-                                                timestamps=timestamps)
-
-                    all_duplicated = True
-
-                    if original_list:
-                        domain_list = []
-                        for original_item in original_list:
-                            got_new_data, domain_item = self.generate_domain(entity_item, original_item)
-
-                            if got_new_data:
-                                all_duplicated = False
-
-                            # handle the case  generate_domain_id generate duplicate id
-                            if domain_item:
-                                duplicate = [item for item in domain_list if item.id == domain_item.id]
-                                if duplicate:
-                                    # regenerate the id
-                                    if self.fix_duplicate_way == 'add':
-                                        domain_item.id = "{}_{}".format(domain_item.id, uuid.uuid1())
-                                    # ignore
-                                    else:
-                                        self.logger.info(f'ignore original duplicate item:{domain_item.id}')
-                                        continue
-
-                                domain_list.append(domain_item)
-
-                        if domain_list:
-                            self.persist(entity_item, domain_list)
-                        else:
-                            self.logger.info('just got {} duplicated data in this cycle'.format(len(original_list)))
+                    original_list, all_duplicated = self.record_and_persist(entity_item, start_timestamp,
+                                                                            end_timestamp, size, timestamps)
 
                     # could not get more data
                     entity_finished = False
@@ -431,16 +672,15 @@ class TimeSeriesDataRecorder(RecorderForEntities):
                             entity_finished = True
 
                         # realtime and to the close time
-                        if self.real_time and \
-                                (self.close_hour is not None) and \
-                                (self.close_minute is not None):
+                        if self.real_time:
                             current_timestamp = pd.Timestamp.now()
-                            if current_timestamp.hour >= self.close_hour:
-                                if current_timestamp.minute - self.close_minute >= 5:
-                                    self.logger.info(
-                                        '{} now is the close time:{}'.format(entity_item.id, current_timestamp))
+                            if self.is_after_close_time(current_timestamp):
+                                self.logger.info(
+                                    '{} now is the close time:{}'.format(entity_item.id, current_timestamp))
 
-                                    entity_finished = True
+                                entity_finished = True
+
+                    self.on_entity_metrics(entity_item.id, time.time() - entity_start)
 
                     # add finished entity to finished_items
                     if entity_finished:
@@ -459,6 +699,7 @@ class TimeSeriesDataRecorder(RecorderForEntities):
                         continue
 
                 except Exception as e:
+                    self.metrics.incr('entities_failed')
                     self.logger.exception(
                         "recording data for entity_id:{},{},error:{}".format(entity_item.id, self.data_schema, e))
                     raising_exception = e
@@ -471,6 +712,7 @@ class TimeSeriesDataRecorder(RecorderForEntities):
                 break
 
         self.on_finish()
+        self.on_run_metrics()
 
         if raising_exception:
             raise raising_exception
@@ -495,7 +737,20 @@ class FixedCycleDataRecorder(TimeSeriesDataRecorder):
                  # child add
                  level=IntervalLevel.LEVEL_1DAY,
                  kdata_use_begin_time=False,
-                 one_day_trading_minutes=24 * 60) -> None:
+                 one_day_trading_minutes=24 * 60,
+                 trading_sessions=None,
+                 bar_close_delay=5,
+                 trading_calendar=None) -> None:
+        """
+
+        :param trading_sessions: trading sessions of a day for real time mode,e.g. [('09:30','11:30'),('13:00','15:00')]
+        :type trading_sessions: list
+        :param trading_calendar: the TradingCalendar or its name,the size to fetch is counted exactly in its sessions
+        and the real time mode skips the days closed
+        :type trading_calendar: Union[TradingCalendar, str]
+        :param bar_close_delay: seconds to wait after the bar close for the provider in real time mode
+        :type bar_close_delay: float
+        """
         super().__init__(entity_type, exchanges, entity_ids, codes, batch_size, force_update, sleeping_time,
                          default_size, real_time, fix_duplicate_way, start_timestamp, end_timestamp, close_hour,
                          close_minute)
@@ -503,6 +758,9 @@ class FixedCycleDataRecorder(TimeSeriesDataRecorder):
         self.level = IntervalLevel(level)
         self.kdata_use_begin_time = kdata_use_begin_time
         self.one_day_trading_minutes = one_day_trading_minutes
+        self.trading_sessions = trading_sessions
+        self.bar_close_delay = bar_close_delay
+        self.trading_calendar = to_trading_calendar(trading_calendar)
 
     def get_latest_saved_record(self, entity):
         order = eval('self.data_schema.{}.desc()'.format(self.get_evaluated_time_field()))
@@ -541,12 +799,126 @@ class FixedCycleDataRecorder(TimeSeriesDataRecorder):
             return None, None, self.default_size, None
 
         size = evaluate_size_from_timestamp(start_timestamp=latest_saved_timestamp, level=self.level,
-                                            one_day_trading_minutes=self.one_day_trading_minutes)
+                                            one_day_trading_minutes=self.one_day_trading_minutes,
+                                            trading_calendar=self.trading_calendar,
+                                            kdata_use_begin_time=self.kdata_use_begin_time)
 
         return latest_saved_timestamp, None, size, None
 
+    def get_latest_saved_timestamp(self, entity) -> pd.Timestamp:
+        records = get_data(entity_id=entity.id,
+                           provider=self.provider,
+                           data_schema=self.data_schema,
+                           columns=[self.data_schema.timestamp],
+                           order=self.data_schema.timestamp.desc(),
+                           limit=1,
+                           return_type='domain',
+                           session=self.session,
+                           level=self.level)
+        if records:
+            return to_pd_timestamp(records[0].timestamp)
+        return None
+
+    def expected_bar_timestamp(self, bar_close: pd.Timestamp) -> pd.Timestamp:
+        """
+        the timestamp of the kdata closed at bar_close
+
+        """
+        if self.level >= IntervalLevel.LEVEL_1DAY:
+            return (bar_close - pd.Timedelta(nanoseconds=1)).normalize()
+        if self.kdata_use_begin_time:
+            return bar_close - pd.Timedelta(seconds=self.level.to_second())
+        return bar_close
+
+    def get_stop_time(self, scheduler: BarCloseScheduler, now: pd.Timestamp) -> pd.Timestamp:
+        """
+        the real time mode stops after it,it's the last bar close of the trading day if the close time not set
+
+        """
+        if self.end_timestamp:
+            return self.end_timestamp
+        if (self.close_hour or self.close_minute) and not (self.trading_sessions or self.trading_calendar):
+            return now.normalize() + pd.Timedelta(hours=self.close_hour, minutes=self.close_minute)
+        return scheduler.last_bar_close_of_day(now)
+
+    def run(self):
+        if self.real_time:
+            self.run_by_schedule()
+        else:
+            super().run()
+
+    def run_by_schedule(self):
+        """
+        the real time mode,every entity is recorded just after its bar closed instead of polling all the time
+
+        """
+        self.metrics.reset()
+        scheduler = BarCloseScheduler(level=self.level, sessions=self.trading_sessions, delay=self.bar_close_delay,
+                                      trading_calendar=self.trading_calendar)
+
+        now = now_pd_timestamp()
+        stop_time = self.get_stop_time(scheduler, now)
+
+        # entity_id -> the bar close waiting for,None means catching up the history data
+        waiting_closes = {}
+        for entity_item in self.entities:
+            waiting_closes[entity_item.id] = None
+            scheduler.schedule(entity_item, now)
+
+        while len(scheduler):
+            seconds = (scheduler.next_due_time() - now_pd_timestamp()).total_seconds()
+            if seconds > 0:
+                with self.metrics.timer('sleep'):
+                    time.sleep(seconds)
+
+            for index, entity_item in enumerate(scheduler.pop_due(now_pd_timestamp())):
+                entity_start = time.time()
+                try:
+                    if index != 0 and self.rate_controller:
+                        self.sleep()
+
+                    with self.metrics.timer('evaluate'):
+                        start_timestamp, end_timestamp, size, timestamps = self.evaluate_start_end_size_timestamps(
+                            entity_item)
+
+                    self.record_and_persist(entity_item, start_timestamp, end_timestamp, int(size), timestamps)
+                except Exception as e:
+                    self.metrics.incr('entities_failed')
+                    self.logger.exception(
+                        "recording data for entity_id:{},{},error:{}".format(entity_item.id, self.data_schema, e))
+                self.on_entity_metrics(entity_item.id, time.time() - entity_start)
+
+                now = now_pd_timestamp()
+
+                # the provider may publish the bar later,retry until the next bar close
+                waiting_close = waiting_closes[entity_item.id]
+                if waiting_close is not None:
+                    latest_timestamp = self.get_latest_saved_timestamp(entity_item)
+                    if latest_timestamp is None or latest_timestamp < self.expected_bar_timestamp(waiting_close):
+                        retry_time = now + pd.Timedelta(seconds=max(1, self.sleeping_time))
+                        if retry_time < scheduler.next_bar_close(waiting_close):
+                            scheduler.schedule(entity_item, retry_time)
+                            continue
+                        self.logger.warning(f'{entity_item.id} missed the bar closed at {waiting_close}')
+
+                bar_close = scheduler.next_bar_close(now)
+                if stop_time and bar_close > stop_time:
+                    self.logger.info(
+                        "finish recording {} for entity_id:{},next bar close:{},stop time:{}".format(
+                            self.data_schema, entity_item.id, bar_close, stop_time))
+                    self.on_finish_entity(entity_item)
+                    continue
+
+                waiting_closes[entity_item.id] = bar_close
+                scheduler.schedule(entity_item, bar_close + scheduler.delay)
+
+        self.on_finish()
+        self.on_run_metrics()
+
 
 class TimestampsDataRecorder(TimeSeriesDataRecorder):
+    # seconds to keep the result of init_timestamps in the disk cache,None means no caching
+    timestamps_cache_ttl: int = 24 * 60 * 60
 
     def __init__(self,
                  entity_type='stock',
@@ -566,18 +938,82 @@ class TimestampsDataRecorder(TimeSeriesDataRecorder):
         super().__init__(entity_type, exchanges, entity_ids, codes, batch_size, force_update, sleeping_time,
                          default_size, real_time, fix_duplicate_way, start_timestamp, end_timestamp,
                          close_hour=close_hour, close_minute=close_minute)
+        # entity_id -> sorted datetime64 array
         self.security_timestamps_map = {}
 
+        # entity_id -> {'updated_timestamp':seconds,'timestamps':[int64 ns]}
+        self.timestamps_cache: dict = None
+        self.timestamps_cache_changed = False
+
     def init_timestamps(self, entity_item) -> List[pd.Timestamp]:
         raise NotImplementedError
 
-    def evaluate_start_end_size_timestamps(self, entity):
+    def get_timestamps_cache_path(self) -> str:
+        return os.path.join(zvdata_env['data_path'], 'timestamps_cache',
+                            f'{self.provider}_{self.__class__.__name__}.json')
+
+    def load_timestamps_cache(self) -> dict:
+        if self.timestamps_cache is None:
+            self.timestamps_cache = {}
+            path = self.get_timestamps_cache_path()
+            if self.timestamps_cache_ttl and os.path.exists(path):
+                try:
+                    with open(path) as f:
+                        self.timestamps_cache = json.load(f)
+                except Exception as e:
+                    self.logger.warning(f'load timestamps cache from {path} failed:{e}')
+        return self.timestamps_cache
+
+    def save_timestamps_cache(self):
+        if not self.timestamps_cache_ttl or not self.timestamps_cache_changed:
+            return
+
+        path = self.get_timestamps_cache_path()
+        dir_name = os.path.dirname(path)
+        if not os.path.exists(dir_name):
+            os.makedirs(dir_name)
+
+        now = time.time()
+        cache = {entity_id: item for entity_id, item in self.timestamps_cache.items() if
+                 now - item['updated_timestamp'] < self.timestamps_cache_ttl}
+
+        tmp_path = f'{path}.{os.getpid()}.tmp'
+        with open(tmp_path, 'w') as f:
+            json.dump(cache, f)
+        os.replace(tmp_path, path)
+        self.timestamps_cache_changed = False
+
+    def get_timestamps(self, entity) -> np.ndarray:
+        """
+        the sorted timestamps of the entity,from memory,disk cache or init_timestamps
+
+        """
         timestamps = self.security_timestamps_map.get(entity.id)
-        if not timestamps:
-            timestamps = self.init_timestamps(entity)
-            self.security_timestamps_map[entity.id] = timestamps
+        if timestamps is not None:
+            return timestamps
+
+        if self.timestamps_cache_ttl:
+            item = self.load_timestamps_cache().get(entity.id)
+            if item and time.time() - item['updated_timestamp'] < self.timestamps_cache_ttl:
+                timestamps = np.array(item['timestamps'], dtype='datetime64[ns]')
+
+        if timestamps is None:
+            timestamps = pd.to_datetime(self.init_timestamps(entity)).values
+            timestamps = np.sort(timestamps.astype('datetime64[ns]'))
+
+            if self.timestamps_cache_ttl:
+                self.load_timestamps_cache()[entity.id] = {'updated_timestamp': time.time(),
+                                                           'timestamps': timestamps.astype('int64').tolist()}
+                self.timestamps_cache_changed = True
 
-        timestamps.sort()
+        self.security_timestamps_map[entity.id] = timestamps
+        return timestamps
+
+    def evaluate_start_end_size_timestamps(self, entity):
+        timestamps = self.get_timestamps(entity)
+
+        if len(timestamps) == 0:
+            return None, None, 0, None
 
         self.logger.info(
             'entity_id:{},timestamps start:{},end:{}'.format(entity.id, timestamps[0], timestamps[-1]))
@@ -586,10 +1022,189 @@ class TimestampsDataRecorder(TimeSeriesDataRecorder):
 
         if latest_record:
             self.logger.info('latest record timestamp:{}'.format(latest_record.timestamp))
-            timestamps = [t for t in timestamps if t > latest_record.timestamp]
+            timestamps = timestamps[
+                         np.searchsorted(timestamps, np.datetime64(latest_record.timestamp, 'ns'), side='right'):]
 
-            if timestamps:
-                return timestamps[0], timestamps[-1], len(timestamps), timestamps
-            return None, None, 0, None
+            if len(timestamps) == 0:
+                return None, None, 0, None
 
+        timestamps = pd.DatetimeIndex(timestamps).tolist()
         return timestamps[0], timestamps[-1], len(timestamps), timestamps
+
+    def on_finish(self):
+        try:
+            self.save_timestamps_cache()
+        except Exception as e:
+            self.logger.error(e)
+        super().on_finish()
+
+
+class RollupDataRecorder(FixedCycleDataRecorder):
+    """
+    build the coarser level data from the finer level data saved before,e.g. 5m,15m,1h,1d kdata from 1m kdata,
+    no request to the provider is needed
+    """
+
+    # overwrite them to setup the finer level data to roll up from
+    source_schema: Mixin = None
+    # default to the provider of the recorder
+    source_provider: str = None
+    # the level of the finer data,set it if the source table has the rows of many levels
+    source_level: IntervalLevel = None
+
+    def __init__(self,
+                 entity_type='stock',
+                 exchanges=['sh', 'sz'],
+                 entity_ids=None,
+                 codes=None,
+                 batch_size=10,
+                 force_update=True,
+                 sleeping_time=0,
+                 default_size=2000,
+                 real_time=False,
+                 fix_duplicate_way='ignore',
+                 start_timestamp=None,
+                 end_timestamp=None,
+                 close_hour=0,
+                 close_minute=0,
+                 level=IntervalLevel.LEVEL_1DAY,
+                 kdata_use_begin_time=False,
+                 one_day_trading_minutes=24 * 60,
+                 trading_calendar=None) -> None:
+        super().__init__(entity_type, exchanges, entity_ids, codes, batch_size, force_update, sleeping_time,
+                         default_size, real_time, fix_duplicate_way, start_timestamp, end_timestamp, close_hour,
+                         close_minute, level, kdata_use_begin_time, one_day_trading_minutes,
+                         trading_calendar=trading_calendar)
+
+        assert self.source_schema is not None
+        if not self.source_provider:
+            self.source_provider = self.provider
+
+    def get_rollup_map(self):
+        """
+        {'column':aggregation},the aggregation could be any one supported by pandas agg
+
+        """
+        return {'open': 'first',
+                'close': 'last',
+                'high': 'max',
+                'low': 'min',
+                'volume': 'sum',
+                'turnover': 'sum'}
+
+    def get_rollup_watermark(self, entity):
+        """
+        the timestamp of the latest rolled up bar,it's rolled up again because it may be unfinished
+
+        """
+        records = get_data(entity_id=entity.id,
+                           provider=self.provider,
+                           data_schema=self.data_schema,
+                           columns=[self.data_schema.timestamp],
+                           level=self.level,
+                           order=self.data_schema.timestamp.desc(),
+                           limit=1,
+                           return_type='domain',
+                           session=self.session)
+        if records:
+            return to_pd_timestamp(records[0].timestamp)
+        return self.start_timestamp
+
+    def floor_timestamps(self, timestamps: pd.Series) -> pd.Series:
+        """
+        the timestamp of the rolled up bar which the finer bar belongs to
+
+        """
+        return pd.Series(to_bar_timestamps(timestamps, self.level, kdata_use_begin_time=self.kdata_use_begin_time),
+                         index=timestamps.index, name=timestamps.name)
+
+    def load_source_df(self, entity, watermark: pd.Timestamp) -> pd.DataFrame:
+        rollup_map = self.get_rollup_map()
+        columns = [col for col in rollup_map if col in get_schema_columns(self.source_schema)]
+
+        filters = None
+        start_timestamp = watermark
+        # the bar of watermark starts from (watermark - interval) if using end time
+        if watermark is not None and self.level < IntervalLevel.LEVEL_1DAY and not self.kdata_use_begin_time:
+            start_timestamp = None
+            filters = [self.source_schema.timestamp > watermark - pd.Timedelta(seconds=self.level.to_second())]
+
+        return self.source_schema.query_data(provider=self.source_provider,
+                                             entity_id=entity.id,
+                                             level=self.source_level,
+                                             columns=columns,
+                                             start_timestamp=start_timestamp,
+                                             end_timestamp=self.end_timestamp,
+                                             filters=filters)
+
+    def generate_domain_ids(self, entity, timestamps, time_fmt=None) -> np.ndarray:
+        if time_fmt is None:
+            time_fmt = TIME_FORMAT_DAY if self.level >= IntervalLevel.LEVEL_1DAY else TIME_FORMAT_ISO8601
+        return super().generate_domain_ids(entity, timestamps, time_fmt=time_fmt)
+
+    def rollup(self, entity, source_df: pd.DataFrame) -> pd.DataFrame:
+        source_df = source_df.sort_values('timestamp')
+        source_df['timestamp'] = self.floor_timestamps(pd.to_datetime(source_df['timestamp']))
+
+        rollup_map = {col: agg for col, agg in self.get_rollup_map().items() if col in source_df.columns}
+        df = source_df.groupby('timestamp', sort=True).agg(rollup_map).reset_index()
+
+        df['id'] = self.generate_domain_ids(entity, df['timestamp'])
+        df['entity_id'] = entity.id
+        df['code'] = entity.code
+        schema_columns = get_schema_columns(self.data_schema)
+        if 'name' in schema_columns:
+            df['name'] = entity.name
+        if 'level' in schema_columns:
+            df['level'] = self.level.value
+        if 'provider' in schema_columns:
+            df['provider'] = self.provider
+        return df
+
+    def run(self):
+        raising_exception = None
+        self.metrics.reset()
+        count = len(self.entities)
+        for index, entity_item in enumerate(self.entities):
+            entity_start = time.time()
+            try:
+                self.logger.info(f'run to {index + 1}/{count}')
+
+                with self.metrics.timer('evaluate'):
+                    watermark = self.get_rollup_watermark(entity_item)
+
+                if self.end_timestamp and watermark and watermark > self.end_timestamp:
+                    continue
+
+                self.metrics.incr('entities')
+                with self.metrics.timer('record'):
+                    source_df = self.load_source_df(entity_item, watermark)
+
+                if pd_is_not_null(source_df):
+                    self.metrics.incr('rows_fetched', len(source_df))
+
+                    with self.metrics.timer('generate_domain'):
+                        df = self.rollup(entity_item, source_df)
+
+                    with self.metrics.timer('persist'):
+                        df_to_db(df=df, data_schema=self.data_schema, provider=self.provider, force_update=True)
+                    self.metrics.incr('rows_new', len(df))
+
+                    self.logger.info(
+                        "rollup {} for entity_id:{},time interval:[{},{}]".format(
+                            self.data_schema, entity_item.id, df['timestamp'].iloc[0], df['timestamp'].iloc[-1]))
+
+                self.on_entity_metrics(entity_item.id, time.time() - entity_start)
+                self.on_finish_entity(entity_item)
+            except Exception as e:
+                self.metrics.incr('entities_failed')
+                self.logger.exception(
+                    "rollup data for entity_id:{},{},error:{}".format(entity_item.id, self.data_schema, e))
+                raising_exception = e
+                break
+
+        self.on_finish()
+        self.on_run_metrics()
+
+        if raising_exception:
+            raise raising_exception
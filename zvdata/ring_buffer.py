@@ -0,0 +1,289 @@
+# -*- coding: utf-8 -*-
+from typing import Dict, List
+
+import numpy as np
+import pandas as pd
+
+from zvdata.utils.pd_utils import pd_is_not_null
+
+
+class RingBuffer(object):
+    """
+    column oriented buffer of one entity,the oldest rows are dropped if the rows exceed the capacity
+    """
+
+    def __init__(self, capacity: int = None, initial_size: int = 16) -> None:
+        """
+
+        :param capacity: max rows kept,None means no limit
+        :type capacity: int
+        :param initial_size: the initial size of the arrays
+        :type initial_size: int
+        """
+        self.capacity = capacity
+        self.initial_size = initial_size
+
+        self.timestamps: np.ndarray = None
+        self.arrays: Dict[str, np.ndarray] = {}
+        # position of the oldest row
+        self.start = 0
+        self.count = 0
+        # whether the timestamps are appended in order
+        self.is_sorted = True
+
+    def physical_size(self) -> int:
+        if self.timestamps is None:
+            return 0
+        return len(self.timestamps)
+
+    def _ordered(self, array: np.ndarray) -> np.ndarray:
+        size = self.physical_size()
+        end = self.start + self.count
+        if end <= size:
+            return array[self.start:end]
+        return np.concatenate([array[self.start:], array[:end - size]])
+
+    def _resize(self, size: int):
+        """
+        reallocate the arrays to size and move the rows to the head
+
+        """
+        arrays = {}
+        for name, array in self.arrays.items():
+            new_array = np.empty(size, dtype=array.dtype)
+            new_array[:self.count] = self._ordered(array)
+            arrays[name] = new_array
+        self.arrays = arrays
+
+        timestamps = np.empty(size, dtype=self.timestamps.dtype)
+        timestamps[:self.count] = self._ordered(self.timestamps)
+        self.timestamps = timestamps
+        self.start = 0
+
+    def _init_arrays(self, timestamps: np.ndarray, columns: Dict[str, np.ndarray], size: int):
+        self.timestamps = np.empty(size, dtype=timestamps.dtype)
+        self.arrays = {name: np.empty(size, dtype=values.dtype) for name, values in columns.items()}
+
+    def _promote_dtypes(self, columns: Dict[str, np.ndarray]):
+        if set(columns) != set(self.arrays):
+            raise ValueError(f'the columns should be the same,{list(columns)} != {list(self.arrays)}')
+
+        for name, values in columns.items():
+            array = self.arrays[name]
+            if values.dtype != array.dtype:
+                dtype = np.result_type(array.dtype, values.dtype)
+                if dtype != array.dtype:
+                    self.arrays[name] = array.astype(dtype)
+
+    def trim(self):
+        """
+        drop the oldest rows exceeding the capacity
+
+        """
+        if self.capacity and self.count > self.capacity:
+            overflow = self.count - self.capacity
+            self.start = (self.start + overflow) % self.physical_size()
+            self.count = self.capacity
+
+        # release the memory of the untrimmed rows
+        if self.capacity and self.physical_size() > 2 * self.capacity:
+            self._resize(self.capacity)
+
+    def append(self, timestamps: np.ndarray, columns: Dict[str, np.ndarray], trim: bool = True):
+        """
+        append the rows,amortized O(1) for every row
+
+        :param timestamps: datetime64 array
+        :type timestamps: np.ndarray
+        :param columns: column name -> values
+        :type columns: Dict[str, np.ndarray]
+        :param trim: whether drop the oldest rows exceeding the capacity,set it to False for keeping all of them
+        :type trim: bool
+        """
+        n = len(timestamps)
+        if n == 0:
+            return
+
+        bounded = trim and self.capacity
+
+        # only the latest rows could be kept
+        if bounded and n >= self.capacity:
+            timestamps = timestamps[-self.capacity:]
+            columns = {name: values[-self.capacity:] for name, values in columns.items()}
+            n = self.capacity
+            self.start = 0
+            self.count = 0
+            self.is_sorted = True
+
+        if self.timestamps is None:
+            size = max(n, self.initial_size)
+            if bounded:
+                size = min(size, self.capacity)
+            self._init_arrays(timestamps, columns, size)
+        else:
+            self._promote_dtypes(columns)
+
+        if self.count and (timestamps[0] < self.timestamps[(self.start + self.count - 1) % self.physical_size()]):
+            self.is_sorted = False
+        if n > 1 and np.any(timestamps[1:] < timestamps[:-1]):
+            self.is_sorted = False
+
+        size = self.physical_size()
+        needed = self.count + n
+        if bounded:
+            if needed > size and size < self.capacity:
+                self._resize(min(self.capacity, max(needed, 2 * size)))
+            # drop the oldest rows
+            overflow = max(0, self.count + n - self.capacity)
+            if overflow:
+                self.start = (self.start + overflow) % self.physical_size()
+                self.count = self.count - overflow
+        elif needed > size:
+            self._resize(max(needed, 2 * size))
+
+        positions = (self.start + self.count + np.arange(n)) % self.physical_size()
+        self.timestamps[positions] = timestamps
+        for name, values in columns.items():
+            self.arrays[name][positions] = values
+        self.count = self.count + n
+
+        if bounded:
+            self.trim()
+
+    def latest_timestamp(self):
+        if not self.count:
+            return None
+        if self.is_sorted:
+            return self.timestamps[(self.start + self.count - 1) % self.physical_size()]
+        return self._ordered(self.timestamps).max()
+
+    def to_arrays(self) -> (np.ndarray, Dict[str, np.ndarray]):
+        """
+        the rows ordered by timestamp
+
+        """
+        timestamps = self._ordered(self.timestamps)
+        columns = {name: self._ordered(array) for name, array in self.arrays.items()}
+        if not self.is_sorted:
+            order = np.argsort(timestamps, kind='mergesort')
+            timestamps = timestamps[order]
+            columns = {name: values[order] for name, values in columns.items()}
+        return timestamps, columns
+
+    def __len__(self):
+        return self.count
+
+
+class EntityRingBuffers(object):
+    """
+    the store of normal data(entity_id,timestamp),every entity has its own ring buffer,the MultiIndex DataFrame is
+    materialized only on demand
+    """
+
+    def __init__(self, capacity: int = None, category_field: str = 'entity_id', time_field: str = 'timestamp') -> None:
+        self.capacity = capacity
+        self.category_field = category_field
+        self.time_field = time_field
+
+        self.buffers: Dict[str, RingBuffer] = {}
+        self.columns: List[str] = None
+
+        self._df: pd.DataFrame = None
+
+    def clear(self):
+        self.buffers = {}
+        self.columns = None
+        self._df = None
+
+    def append_df(self, df: pd.DataFrame, trim: bool = True):
+        """
+        append the normal data
+
+        :param df: the DataFrame with index (entity_id,timestamp)
+        :type df: pd.DataFrame
+        :param trim: whether drop the oldest rows exceeding the capacity
+        :type trim: bool
+        """
+        if not pd_is_not_null(df):
+            return
+
+        if self.columns is None:
+            self.columns = df.columns.tolist()
+
+        entity_ids = df.index.get_level_values(0)
+        if not entity_ids.is_monotonic_increasing:
+            df = df.sort_index(level=[0, 1])
+            entity_ids = df.index.get_level_values(0)
+
+        entity_values = entity_ids.values
+        timestamps = df.index.get_level_values(1).values
+        columns = {column: df[column].values for column in self.columns}
+
+        # the boundaries of the entities
+        boundaries = np.flatnonzero(entity_values[1:] != entity_values[:-1]) + 1
+        starts = np.concatenate([[0], boundaries])
+        ends = np.concatenate([boundaries, [len(entity_values)]])
+
+        for start, end in zip(starts, ends):
+            entity_id = entity_values[start]
+            buffer = self.buffers.get(entity_id)
+            if buffer is None:
+                buffer = RingBuffer(capacity=self.capacity)
+                self.buffers[entity_id] = buffer
+            buffer.append(timestamps[start:end], {name: values[start:end] for name, values in columns.items()},
+                          trim=trim)
+
+        self._df = None
+
+    def trim(self):
+        for buffer in self.buffers.values():
+            buffer.trim()
+        self._df = None
+
+    def watermarks(self) -> pd.Series:
+        """
+        the latest timestamp of every entity
+
+        """
+        entity_ids = sorted(self.buffers)
+        return pd.Series([pd.Timestamp(self.buffers[entity_id].latest_timestamp()) for entity_id in entity_ids],
+                         index=pd.Index(entity_ids, name=self.category_field))
+
+    def to_df(self) -> pd.DataFrame:
+        """
+        the DataFrame sorted by (entity_id,timestamp),it's cached until the next change
+
+        """
+        if self._df is not None:
+            return self._df
+
+        if not self.buffers:
+            return None
+
+        entity_ids = []
+        counts = []
+        timestamps_list = []
+        columns_list = {column: [] for column in self.columns}
+        for entity_id in sorted(self.buffers):
+            buffer = self.buffers[entity_id]
+            if not len(buffer):
+                continue
+            timestamps, columns = buffer.to_arrays()
+            entity_ids.append(entity_id)
+            counts.append(len(timestamps))
+            timestamps_list.append(timestamps)
+            for column in self.columns:
+                columns_list[column].append(columns[column])
+
+        if not entity_ids:
+            return None
+
+        index = pd.MultiIndex.from_arrays([np.repeat(np.array(entity_ids, dtype=object), counts),
+                                           np.concatenate(timestamps_list)],
+                                          names=[self.category_field, self.time_field])
+        self._df = pd.DataFrame({column: np.concatenate(values) for column, values in columns_list.items()},
+                                index=index, columns=self.columns)
+        return self._df
+
+    def __len__(self):
+        return sum(len(buffer) for buffer in self.buffers.values())
@@ -0,0 +1,136 @@
+# -*- coding: utf-8 -*-
+import heapq
+import itertools
+from typing import List, Tuple
+
+import pandas as pd
+
+from zvdata import IntervalLevel
+from zvdata.utils.time_utils import to_pd_timestamp
+
+
+def parse_sessions(sessions: List[Tuple[str, str]]) -> List[Tuple[pd.Timedelta, pd.Timedelta]]:
+    """
+    parse the trading sessions,e.g. [('09:30','11:30'),('13:00','15:00')] to the offsets from 00:00
+
+    :param sessions:
+    :type sessions: List[Tuple[str, str]]
+    :return:
+    :rtype: List[Tuple[pd.Timedelta, pd.Timedelta]]
+    """
+    result = []
+    for start, end in sessions:
+        result.append((pd.Timedelta(f'{start}:00'), pd.Timedelta(f'{end}:00')))
+    return sorted(result)
+
+
+class BarCloseScheduler(object):
+    """
+    priority queue of the items(e.g. entities) keyed by the time they are due,which is the next bar close time of
+    the level plus the delay
+
+    the bar close times are from the trading sessions if set,otherwise every interval of the level from 00:00
+    """
+
+    def __init__(self,
+                 level: IntervalLevel,
+                 sessions: List[Tuple[str, str]] = None,
+                 delay: float = 0,
+                 trading_calendar=None) -> None:
+        """
+
+        :param level:
+        :type level: IntervalLevel
+        :param sessions: trading sessions of a day,e.g. [('09:30','11:30'),('13:00','15:00')]
+        :type sessions: List[Tuple[str, str]]
+        :param delay: seconds to wait after the bar close for the provider to publish the data
+        :type delay: float
+        :param trading_calendar: the days closed are skipped and its sessions are used if sessions not set
+        :type trading_calendar: zvdata.trading_calendar.TradingCalendar
+        """
+        self.level = IntervalLevel(level)
+        self.trading_calendar = trading_calendar
+        if sessions:
+            self.sessions = parse_sessions(sessions)
+        elif trading_calendar:
+            self.sessions = trading_calendar.sessions
+        else:
+            self.sessions = None
+        self.delay = pd.Timedelta(seconds=delay)
+
+        self.queue = []
+        self.counter = itertools.count()
+
+    def bar_closes_of_day(self, day: pd.Timestamp) -> List[pd.Timestamp]:
+        """
+        all bar close times of the trading day
+
+        """
+        day = day.normalize()
+        if self.trading_calendar and not self.trading_calendar.is_trading_day(day):
+            return []
+
+        if not self.sessions:
+            if self.level >= IntervalLevel.LEVEL_1DAY:
+                return [day + pd.Timedelta(days=1)]
+            return list(pd.date_range(day + pd.Timedelta(seconds=self.level.to_second()), day + pd.Timedelta(days=1),
+                                      freq=pd.Timedelta(seconds=self.level.to_second())))
+
+        if self.level >= IntervalLevel.LEVEL_1DAY:
+            return [day + self.sessions[-1][1]]
+
+        interval = pd.Timedelta(seconds=self.level.to_second())
+        closes = []
+        for start, end in self.sessions:
+            close = day + start + interval
+            while close < day + end:
+                closes.append(close)
+                close = close + interval
+            # the last bar of the session may be shorter than the interval
+            closes.append(day + end)
+        return closes
+
+    def next_bar_close(self, timestamp) -> pd.Timestamp:
+        """
+        the first bar close time after the timestamp
+
+        """
+        timestamp = to_pd_timestamp(timestamp)
+        day = timestamp.normalize()
+        # the bar close of the day may be in the next day,e.g. 00:00
+        while True:
+            for close in self.bar_closes_of_day(day):
+                if close > timestamp:
+                    return close
+            day = day + pd.Timedelta(days=1)
+
+    def last_bar_close_of_day(self, timestamp) -> pd.Timestamp:
+        timestamp = to_pd_timestamp(timestamp)
+        closes = self.bar_closes_of_day(timestamp)
+        # the day closed has no bar
+        if not closes:
+            return timestamp.normalize()
+        return closes[-1]
+
+    def schedule(self, item, due_time: pd.Timestamp):
+        heapq.heappush(self.queue, (to_pd_timestamp(due_time), next(self.counter), item))
+
+    def next_due_time(self) -> pd.Timestamp:
+        if self.queue:
+            return self.queue[0][0]
+        return None
+
+    def pop_due(self, now: pd.Timestamp = None) -> list:
+        """
+        pop all the items due before now
+
+        """
+        if now is None:
+            now = pd.Timestamp.now()
+        items = []
+        while self.queue and self.queue[0][0] <= now:
+            items.append(heapq.heappop(self.queue)[2])
+        return items
+
+    def __len__(self):
+        return len(self.queue)
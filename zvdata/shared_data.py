@@ -0,0 +1,325 @@
+# -*- coding: utf-8 -*-
+import json
+import logging
+import os
+import shutil
+import tempfile
+from typing import Dict, List
+
+import numpy as np
+import pandas as pd
+
+from zvdata.reader import DataListener
+from zvdata.utils.pd_utils import pd_is_not_null
+
+logger = logging.getLogger(__name__)
+
+HEADER_FILE = 'header.json'
+
+
+def get_shared_data_path(name: str) -> str:
+    """
+    the data is in /dev/shm if it exists,otherwise in the temp dir
+
+    """
+    base = '/dev/shm' if os.path.isdir('/dev/shm') else tempfile.gettempdir()
+    return os.path.join(base, f'zvdata_{name}')
+
+
+class SharedDataPublisher(DataListener):
+    """
+    publish the normal data(entity_id,timestamp) to the memory mapped column files for the readers in other processes
+
+    the rows are appended only,the numeric,bool and datetime columns are shared and the entity_id is stored as int32
+    code,the header with a version is replaced atomically after the rows written,so the readers always see the
+    complete rows
+
+    register it to the DataReader to publish the data loaded and the data added by move_on,the rows added in one
+    move_on are appended as one version
+    """
+
+    def __init__(self, name: str, category_field: str = 'entity_id', time_field: str = 'timestamp',
+                 initial_capacity: int = 1024) -> None:
+        self.name = name
+        self.path = get_shared_data_path(name)
+        self.category_field = category_field
+        self.time_field = time_field
+        self.initial_capacity = initial_capacity
+
+        self.version = 0
+        self.generation = 0
+        self.rows = 0
+        self.capacity = 0
+        # column -> dtype str
+        self.dtypes: Dict[str, str] = None
+        self.arrays: Dict[str, np.memmap] = {}
+        self.entities: List[str] = []
+        self.entity_codes: Dict[str, int] = {}
+        # entity -> the latest timestamp published
+        self.entity_times: Dict[str, pd.Timestamp] = {}
+        # the stale files are removed only after the generation changed
+        self.cleaned_generation = 0
+
+    def column_file(self, column: str, generation: int = None) -> str:
+        if generation is None:
+            generation = self.generation
+        return os.path.join(self.path, f'{column}.{generation}.bin')
+
+    def _shared_columns(self, df: pd.DataFrame) -> Dict[str, str]:
+        dtypes = {'__code__': 'int32', '__time__': 'datetime64[ns]'}
+        for column, dtype in df.dtypes.items():
+            if column in (self.category_field, self.time_field):
+                continue
+            if dtype.kind in 'biuf':
+                dtypes[column] = dtype.str
+            elif dtype.kind == 'M':
+                dtypes[column] = 'datetime64[ns]'
+        return dtypes
+
+    def _allocate(self, capacity: int):
+        """
+        create the files of next generation and copy the rows,the files of the old generation are removed after the
+        header of the new one is written
+
+        """
+        generation = self.generation + 1
+        arrays = {}
+        for column, dtype in self.dtypes.items():
+            array = np.memmap(self.column_file(column, generation), dtype=dtype, mode='w+', shape=(capacity,))
+            if column in self.arrays:
+                array[:self.rows] = self.arrays[column][:self.rows]
+            arrays[column] = array
+
+        self.arrays = arrays
+        self.generation = generation
+        self.capacity = capacity
+
+    def _remove_stale_files(self):
+        """
+        remove the files older than the previous generation,the reader read the previous header just now could still
+        open its files
+
+        """
+        for file_name in os.listdir(self.path):
+            parts = file_name.split('.')
+            if len(parts) == 3 and parts[2] == 'bin' and parts[1].isdigit() and int(parts[1]) < self.generation - 1:
+                try:
+                    os.remove(os.path.join(self.path, file_name))
+                except FileNotFoundError:
+                    pass
+
+    def _restore_version(self):
+        """
+        continue the version and generation of the data published before,so the attached readers see the change
+
+        """
+        header_path = os.path.join(self.path, HEADER_FILE)
+        if os.path.exists(header_path):
+            try:
+                with open(header_path) as f:
+                    header = json.load(f)
+                self.version = max(self.version, header['version'])
+                self.generation = max(self.generation, header['generation'])
+            except (OSError, ValueError, KeyError) as e:
+                logger.warning(f'read header {header_path} failed:{e}')
+
+    def _write_header(self):
+        header = {
+            'version': self.version,
+            'generation': self.generation,
+            'rows': self.rows,
+            'capacity': self.capacity,
+            'dtypes': self.dtypes or {},
+            'entities': self.entities,
+            'category_field': self.category_field,
+            'time_field': self.time_field
+        }
+        tmp_path = os.path.join(self.path, f'{HEADER_FILE}.{os.getpid()}.tmp')
+        with open(tmp_path, 'w') as f:
+            json.dump(header, f)
+        os.replace(tmp_path, os.path.join(self.path, HEADER_FILE))
+
+        if self.cleaned_generation != self.generation:
+            self._remove_stale_files()
+            self.cleaned_generation = self.generation
+
+    def publish(self, df: pd.DataFrame):
+        """
+        publish the df as a new snapshot in the next generation,the data published before is discarded
+
+        """
+        self.close()
+        if not os.path.exists(self.path):
+            os.makedirs(self.path)
+        self._restore_version()
+
+        self.rows = 0
+        self.capacity = 0
+        self.dtypes = None
+        self.arrays = {}
+        self.entities = []
+        self.entity_codes = {}
+        self.entity_times = {}
+
+        if pd_is_not_null(df):
+            self.append(df)
+        else:
+            # publish the empty data
+            self.generation += 1
+            self.version += 1
+            self._write_header()
+
+    def append(self, df: pd.DataFrame):
+        """
+        append the rows of df and publish a new version,the memory mapped files are shared with the readers without
+        flushing
+
+        """
+        if self.dtypes is None:
+            if not pd_is_not_null(df):
+                return
+            if not os.path.exists(self.path):
+                os.makedirs(self.path)
+            self._restore_version()
+            self.dtypes = self._shared_columns(df)
+            self._allocate(max(self.initial_capacity, len(df)))
+
+        if not pd_is_not_null(df):
+            return
+
+        entity_ids = df.index.get_level_values(0)
+        timestamps = df.index.get_level_values(1)
+        for entity_id in entity_ids.unique():
+            if entity_id not in self.entity_codes:
+                self.entity_codes[entity_id] = len(self.entities)
+                self.entities.append(entity_id)
+
+        n = len(df)
+        if self.rows + n > self.capacity:
+            self._allocate(max(self.rows + n, 2 * self.capacity))
+
+        start, end = self.rows, self.rows + n
+        self.arrays['__code__'][start:end] = entity_ids.map(self.entity_codes).values
+        self.arrays['__time__'][start:end] = timestamps.values
+        for column in self.dtypes:
+            if column in ('__code__', '__time__'):
+                continue
+            self.arrays[column][start:end] = df[column].values
+
+        self.entity_times.update(pd.Series(timestamps, index=entity_ids).groupby(level=0).max().to_dict())
+        self.rows = end
+        self.version += 1
+        self._write_header()
+
+    def close(self):
+        for array in self.arrays.values():
+            array.flush()
+
+    def destroy(self):
+        """
+        remove the shared data
+
+        """
+        self.arrays = {}
+        if os.path.exists(self.path):
+            shutil.rmtree(self.path)
+
+    def on_data_loaded(self, data: pd.DataFrame) -> object:
+        self.publish(data)
+
+    def on_data_changed(self, data: pd.DataFrame) -> object:
+        self.append(self.get_added_df(data))
+
+    def get_added_df(self, data: pd.DataFrame) -> pd.DataFrame:
+        """
+        the rows after the latest timestamp published of every entity
+
+        """
+        if not pd_is_not_null(data):
+            return None
+        latest = data.index.get_level_values(0).map(self.entity_times)
+        timestamps = data.index.get_level_values(1)
+        return data[pd.isnull(latest) | (timestamps > latest)]
+
+
+class SharedDataReader(object):
+    """
+    attach to the data published by SharedDataPublisher in read only mode
+    """
+
+    def __init__(self, name: str) -> None:
+        self.name = name
+        self.path = get_shared_data_path(name)
+
+        self.header = None
+        self.arrays: Dict[str, np.memmap] = {}
+
+        self.refresh()
+
+    def read_header(self) -> dict:
+        with open(os.path.join(self.path, HEADER_FILE)) as f:
+            return json.load(f)
+
+    @property
+    def version(self) -> int:
+        return self.header['version']
+
+    @property
+    def rows(self) -> int:
+        return self.header['rows']
+
+    def refresh(self, retry: int = 3) -> bool:
+        """
+        read the latest header,return True if the data changed
+
+        """
+        header = self.read_header()
+        if self.header and header['version'] == self.header['version']:
+            return False
+
+        if not self.header or header['generation'] != self.header['generation']:
+            try:
+                arrays = {}
+                for column, dtype in header['dtypes'].items():
+                    arrays[column] = np.memmap(os.path.join(self.path, f'{column}.{header["generation"]}.bin'),
+                                               dtype=dtype, mode='r', shape=(header['capacity'],))
+            except FileNotFoundError:
+                # the generation is replaced twice after the header read,read the latest one
+                if retry <= 0:
+                    raise
+                return self.refresh(retry=retry - 1)
+            self.arrays = arrays
+        self.header = header
+        return True
+
+    def get_arrays(self) -> Dict[str, np.ndarray]:
+        """
+        the read only views of the published rows without copying,__code__ is the index of the entities and __time__
+        is the timestamp
+
+        """
+        return {column: array[:self.rows] for column, array in self.arrays.items()}
+
+    def entities(self) -> List[str]:
+        return self.header['entities']
+
+    def to_df(self) -> pd.DataFrame:
+        """
+        copy the rows to the normal DataFrame sorted by (entity_id,timestamp)
+
+        """
+        arrays = self.get_arrays()
+        if not self.rows:
+            return None
+
+        category_field = self.header['category_field']
+        time_field = self.header['time_field']
+
+        entity_ids = np.array(self.entities(), dtype=object)[arrays['__code__']]
+        timestamps = np.array(arrays['__time__'])
+        df = pd.DataFrame({column: np.array(values) for column, values in arrays.items() if
+                           column not in ('__code__', '__time__')})
+        df[category_field] = entity_ids
+        df[time_field] = timestamps
+        df.index = pd.MultiIndex.from_arrays([entity_ids, timestamps], names=[category_field, time_field])
+        return df.sort_index(level=[0, 1])
@@ -0,0 +1,241 @@
+# -*- coding: utf-8 -*-
+import hashlib
+import json
+import logging
+import os
+import time
+from contextlib import contextmanager
+
+import pandas as pd
+
+from zvdata.contract import zvdata_env
+
+try:
+    import pyarrow
+
+    # the columnar format read fast and not depending on the pandas version
+    SNAPSHOT_FORMAT = 'feather'
+except ImportError:
+    SNAPSHOT_FORMAT = 'pkl'
+
+logger = logging.getLogger(__name__)
+
+# the max entries of the rewrites kept for a table
+MAX_REWRITE_ENTRIES = 32
+
+
+def get_snapshot_dir() -> str:
+    return os.path.join(zvdata_env['data_path'], 'snapshots')
+
+
+def get_rewrite_state_path(provider: str, data_schema) -> str:
+    return os.path.join(get_snapshot_dir(), 'rewrites', f'{provider}_{data_schema.__tablename__}.json')
+
+
+def _filter_to_str(the_filter) -> str:
+    try:
+        return str(the_filter.compile(compile_kwargs={'literal_binds': True}))
+    except Exception:
+        return f'{the_filter}{the_filter.compile().params}'
+
+
+def get_snapshot_key(data_schema, provider: str, columns=None, filters=None, level=None, entity_ids=None,
+                     start_timestamp=None, category_field='entity_id', time_field='timestamp') -> str:
+    """
+    the hash of the params deciding the data of the reader,end_timestamp is not in it because the data is fetched
+    incrementally
+
+    """
+    params = {
+        'table': data_schema.__tablename__,
+        'provider': provider,
+        'columns': sorted(str(col) for col in columns) if columns else None,
+        'filters': [_filter_to_str(the_filter) for the_filter in filters] if filters else None,
+        'level': str(level.value if hasattr(level, 'value') else level) if level else None,
+        'entity_ids': sorted(entity_ids) if entity_ids else None,
+        'start_timestamp': str(start_timestamp) if start_timestamp is not None else None,
+        'category_field': category_field,
+        'time_field': time_field
+    }
+    return hashlib.sha1(json.dumps(params, sort_keys=True).encode()).hexdigest()
+
+
+def get_snapshot_path(key: str) -> str:
+    return os.path.join(get_snapshot_dir(), f'{key}.{SNAPSHOT_FORMAT}')
+
+
+def _write_df(df: pd.DataFrame, path: str):
+    if SNAPSHOT_FORMAT == 'pkl':
+        df.to_pickle(path)
+        return
+    # feather saves the default index only,the index levels are saved as the columns
+    the_df = df.reset_index(drop=True)
+    for i in range(df.index.nlevels):
+        the_df[f'__index_{i}__'] = df.index.get_level_values(i)
+    the_df.to_feather(path)
+
+
+def _read_df(path: str, index_names: list) -> pd.DataFrame:
+    if SNAPSHOT_FORMAT == 'pkl':
+        return pd.read_pickle(path)
+    df = pd.read_feather(path)
+    index_columns = [f'__index_{i}__' for i in range(len(index_names))]
+    df = df.set_index(index_columns)
+    df.index.names = index_names
+    return df
+
+
+def save_snapshot(key: str, df: pd.DataFrame, created_time: float):
+    """
+    save the df with the time when its data is queried,it's in feather if pyarrow installed,otherwise in pickle
+
+    """
+    dir_name = get_snapshot_dir()
+    if not os.path.exists(dir_name):
+        os.makedirs(dir_name)
+
+    path = get_snapshot_path(key)
+    tmp_path = f'{path}.{os.getpid()}.tmp'
+    _write_df(df, tmp_path)
+    os.replace(tmp_path, path)
+
+    meta_path = os.path.join(dir_name, f'{key}.json')
+    tmp_path = f'{meta_path}.{os.getpid()}.tmp'
+    with open(tmp_path, 'w') as f:
+        json.dump({'created_time': created_time, 'rows': len(df), 'index': list(df.index.names)}, f)
+    os.replace(tmp_path, meta_path)
+
+
+def load_snapshot(key: str) -> (pd.DataFrame, float):
+    """
+    the df saved and its created time,(None,None) if not found
+
+    """
+    path = get_snapshot_path(key)
+    meta_path = os.path.join(get_snapshot_dir(), f'{key}.json')
+    if not os.path.exists(path) or not os.path.exists(meta_path):
+        return None, None
+    try:
+        with open(meta_path) as f:
+            meta = json.load(f)
+        return _read_df(path, meta['index']), meta['created_time']
+    except Exception as e:
+        logger.warning(f'load snapshot {key} failed:{e}')
+        return None, None
+
+
+def enable_rewrite_tracking(provider: str, data_schema):
+    """
+    the rewriting of the table is recorded only after a snapshot of it is used
+
+    """
+    path = get_rewrite_state_path(provider, data_schema)
+    if not os.path.exists(path):
+        with _file_lock(f'{path}.lock'):
+            if not os.path.exists(path):
+                _save_rewrites(path, [])
+
+
+def mark_rewritten(provider: str, data_schema, min_timestamp):
+    """
+    record that the rows from min_timestamp are rewritten,the snapshots created before are invalid from it
+
+    """
+    path = get_rewrite_state_path(provider, data_schema)
+    # no snapshot of the table,nothing to invalidate
+    if not os.path.exists(path):
+        return
+
+    the_time = time.time()
+    min_timestamp = pd.Timestamp(min_timestamp)
+    with _file_lock(f'{path}.lock'):
+        rewrites = _load_rewrites(path)
+        rewrites.append((the_time, min_timestamp))
+        _save_rewrites(path, _compact_rewrites(rewrites))
+
+
+def get_rewritten_timestamp(provider: str, data_schema, since: float) -> pd.Timestamp:
+    """
+    the min timestamp of the rows rewritten after since,None if no rewriting
+
+    """
+    path = get_rewrite_state_path(provider, data_schema)
+    if not os.path.exists(path):
+        return None
+
+    timestamps = [timestamp for the_time, timestamp in _load_rewrites(path) if the_time >= since]
+    if timestamps:
+        return min(timestamps)
+    return None
+
+
+def _compact_rewrites(rewrites: list) -> list:
+    """
+    keep the entries with the min timestamp increasing by time,the earlier one with larger timestamp is covered by the
+    later one.if too many,the oldest two are merged into the later time with the smaller timestamp,it may invalidate
+    more rows of the snapshot but never less
+
+    """
+    result = []
+    for the_time, timestamp in sorted(rewrites, key=lambda x: x[0]):
+        while result and result[-1][1] >= timestamp:
+            result.pop()
+        result.append((the_time, timestamp))
+
+    while len(result) > MAX_REWRITE_ENTRIES:
+        result[0:2] = [(result[1][0], result[0][1])]
+    return result
+
+
+def _load_rewrites(path: str) -> list:
+    try:
+        with open(path) as f:
+            return [(the_time, pd.Timestamp(timestamp)) for the_time, timestamp in json.load(f)]
+    except (OSError, ValueError) as e:
+        logger.warning(f'load rewrites {path} failed:{e}')
+        # invalidate all the snapshots
+        return [(0, pd.Timestamp.min)]
+
+
+def _save_rewrites(path: str, rewrites: list):
+    dir_name = os.path.dirname(path)
+    if not os.path.exists(dir_name):
+        os.makedirs(dir_name, exist_ok=True)
+
+    tmp_path = f'{path}.{os.getpid()}.tmp'
+    with open(tmp_path, 'w') as f:
+        json.dump([[the_time, str(timestamp)] for the_time, timestamp in rewrites], f)
+    os.replace(tmp_path, path)
+
+
+@contextmanager
+def _file_lock(path: str, timeout: float = 10, stale: float = 30):
+    """
+    the lock between the processes by creating the file exclusively,the lock file older than stale is left by a dead
+    process and removed
+
+    """
+    dir_name = os.path.dirname(path)
+    if not os.path.exists(dir_name):
+        os.makedirs(dir_name, exist_ok=True)
+
+    deadline = time.time() + timeout
+    while True:
+        try:
+            fd = os.open(path, os.O_CREAT | os.O_EXCL | os.O_WRONLY)
+            break
+        except FileExistsError:
+            try:
+                if time.time() - os.path.getmtime(path) > stale:
+                    os.remove(path)
+                    continue
+            except OSError:
+                continue
+            if time.time() > deadline:
+                raise TimeoutError(f'wait for the lock {path} timeout')
+            time.sleep(0.01)
+    try:
+        yield
+    finally:
+        os.close(fd)
+        os.remove(path)
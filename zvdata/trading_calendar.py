@@ -0,0 +1,211 @@
+# -*- coding: utf-8 -*-
+import json
+import os
+from typing import List, Tuple, Union
+
+import numpy as np
+import pandas as pd
+
+from zvdata import IntervalLevel
+from zvdata.contract import zvdata_env
+from zvdata.scheduler import parse_sessions
+from zvdata.utils.time_utils import to_pd_timestamp, to_bar_timestamps
+
+# name -> TradingCalendar
+_calendars = {}
+
+
+class TradingCalendar(object):
+    """
+    the trading days and the sessions of a day of the exchange,the bars are generated only in the sessions of the
+    trading days,so the lunch break,weekends and holidays are skipped
+
+    the intraday bar uses the end time as timestamp,e.g. (09:30,09:35] -> 09:35,the begin time if kdata_use_begin_time,
+    the day,week and month bar use the start time of the period
+    """
+
+    def __init__(self,
+                 sessions: List[Tuple[str, str]] = None,
+                 holidays: List = None,
+                 weekmask: str = 'Mon Tue Wed Thu Fri',
+                 name: str = None) -> None:
+        """
+
+        :param sessions: trading sessions of a day,e.g. [('09:30','11:30'),('13:00','15:00')],the whole day if not set
+        :type sessions: List[Tuple[str, str]]
+        :param holidays: the closed days which are not weekends
+        :type holidays: List
+        :param weekmask: the trading days of a week
+        :type weekmask: str
+        :param name:
+        :type name: str
+        """
+        self.name = name
+        self.sessions = parse_sessions(sessions if sessions else [('00:00', '24:00')])
+        self.holidays = pd.DatetimeIndex([to_pd_timestamp(holiday) for holiday in holidays or []]).normalize()
+        self.weekmask = weekmask
+
+        self.freq = pd.offsets.CustomBusinessDay(weekmask=weekmask, holidays=self.holidays)
+        # (level,kdata_use_begin_time) -> offsets of the bars in a day
+        self._bar_offsets = {}
+
+    @classmethod
+    def from_file(cls, path: str):
+        """
+        load the calendar from the json file,e.g.
+
+        {"sessions": [["09:30", "11:30"], ["13:00", "15:00"]], "holidays": ["2019-10-01"], "weekmask": "Mon Tue Wed Thu Fri"}
+
+        """
+        with open(path) as f:
+            config = json.load(f)
+        return cls(sessions=[tuple(session) for session in config.get('sessions', [])] or None,
+                   holidays=config.get('holidays'),
+                   weekmask=config.get('weekmask', 'Mon Tue Wed Thu Fri'),
+                   name=config.get('name', os.path.splitext(os.path.basename(path))[0]))
+
+    def trading_days(self, start, end) -> pd.DatetimeIndex:
+        """
+        the trading days in [start,end]
+
+        """
+        start = to_pd_timestamp(start).normalize()
+        end = to_pd_timestamp(end).normalize()
+        if start > end:
+            return pd.DatetimeIndex([])
+        return pd.date_range(start, end, freq=self.freq)
+
+    def is_trading_day(self, timestamp) -> bool:
+        day = to_pd_timestamp(timestamp).normalize()
+        return self.freq.is_on_offset(day)
+
+    def is_trading_time(self, timestamp) -> bool:
+        timestamp = to_pd_timestamp(timestamp)
+        if not self.is_trading_day(timestamp):
+            return False
+        offset = timestamp - timestamp.normalize()
+        return any(start <= offset <= end for start, end in self.sessions)
+
+    def bar_offsets(self, level: IntervalLevel, kdata_use_begin_time: bool = False) -> np.ndarray:
+        """
+        the offsets from 00:00 of the intraday bar timestamps of a trading day,the last bar of the session may be
+        shorter than the interval
+
+        """
+        key = (level, kdata_use_begin_time)
+        offsets = self._bar_offsets.get(key)
+        if offsets is None:
+            interval = pd.Timedelta(seconds=level.to_second())
+            result = []
+            for start, end in self.sessions:
+                begins = pd.timedelta_range(start, end - pd.Timedelta(nanoseconds=1), freq=interval).values
+                if kdata_use_begin_time:
+                    result.append(begins)
+                else:
+                    result.append(np.minimum(begins + interval.to_timedelta64(), end.to_timedelta64()))
+            offsets = np.concatenate(result)
+            self._bar_offsets[key] = offsets
+        return offsets
+
+    def _all_bar_timestamps(self, start: pd.Timestamp, end: pd.Timestamp, level: IntervalLevel,
+                            kdata_use_begin_time: bool) -> pd.DatetimeIndex:
+        if level == IntervalLevel.LEVEL_1WEEK or level == IntervalLevel.LEVEL_1MON:
+            freq = 'W' if level == IntervalLevel.LEVEL_1WEEK else 'M'
+            days = self.trading_days(pd.Period(start, freq).start_time, end)
+            return days.to_period(freq).start_time.unique()
+        if level >= IntervalLevel.LEVEL_1DAY:
+            return self.trading_days(start, end)
+
+        days = self.trading_days(start, end).values
+        offsets = self.bar_offsets(level, kdata_use_begin_time)
+        return pd.DatetimeIndex((days[:, None] + offsets[None, :]).ravel())
+
+    def bar_timestamps(self, start, end, level: IntervalLevel, kdata_use_begin_time: bool = False) -> pd.DatetimeIndex:
+        """
+        the timestamps of the bars from the bar containing start to the bar containing end,it's the gap-free index for
+        the data of the level
+
+        """
+        start = to_pd_timestamp(start)
+        end = to_pd_timestamp(end)
+        level = IntervalLevel(level)
+
+        timestamps = self._all_bar_timestamps(start, end, level, kdata_use_begin_time)
+        first, last = self._locate(timestamps, np.array([start.to_datetime64()]), end, level, kdata_use_begin_time)
+        return timestamps[first[0]:last]
+
+    def _locate(self, timestamps: pd.DatetimeIndex, starts: np.ndarray, end: pd.Timestamp, level: IntervalLevel,
+                kdata_use_begin_time: bool):
+        """
+        the positions of the bars containing starts and the position after the last bar begun before end
+
+        """
+        values = timestamps.values
+        end = end.to_datetime64()
+
+        if level >= IntervalLevel.LEVEL_1DAY:
+            # the start in holiday belongs to the next bar
+            first = np.searchsorted(values, to_bar_timestamps(starts, level, kdata_use_begin_time=True).values, side='left')
+            last = np.searchsorted(values, end, side='right')
+        elif kdata_use_begin_time:
+            # the bar containing t is the last bar begun at or before t
+            first = np.maximum(np.searchsorted(values, starts, side='right') - 1, 0)
+            last = np.searchsorted(values, end, side='right')
+        else:
+            # the bar containing t is the first bar ended at or after t,the bar not begun before end is excluded
+            first = np.searchsorted(values, starts, side='left')
+            begins = self._all_bar_timestamps(pd.Timestamp(timestamps[0]).normalize(), pd.Timestamp(end), level,
+                                              True) if len(values) else timestamps
+            last = np.searchsorted(begins.values, end, side='left')
+        return first, last
+
+    def count_bars(self, start, end=None, level: IntervalLevel = IntervalLevel.LEVEL_1DAY,
+                   kdata_use_begin_time: bool = False) -> Union[int, np.ndarray]:
+        """
+        the exact count of the bars from the bar containing start to the bar containing end,the start could be an array
+        for counting many entities in one pass
+
+        :param start: the timestamp or the array of timestamps
+        :param end: now if not set
+        :type end: pd.Timestamp
+        :param level:
+        :type level: IntervalLevel
+        :param kdata_use_begin_time:
+        :type kdata_use_begin_time: bool
+        :return: int for one start,np.ndarray for the array
+        """
+        end = to_pd_timestamp(end) if end is not None else pd.Timestamp.now()
+        level = IntervalLevel(level)
+
+        is_scalar = np.ndim(start) == 0
+        starts = pd.DatetimeIndex([to_pd_timestamp(start)] if is_scalar else pd.to_datetime(start)).values
+
+        timestamps = self._all_bar_timestamps(pd.Timestamp(starts.min()), end, level, kdata_use_begin_time)
+        first, last = self._locate(timestamps, starts, end, level, kdata_use_begin_time)
+        counts = np.maximum(last - first, 0)
+        if is_scalar:
+            return int(counts[0])
+        return counts
+
+
+def register_trading_calendar(name: str, calendar: TradingCalendar):
+    _calendars[name] = calendar
+
+
+def get_trading_calendar(name: str) -> TradingCalendar:
+    """
+    the calendar registered or loaded from {data_path}/calendars/{name}.json
+
+    """
+    calendar = _calendars.get(name)
+    if calendar is None:
+        path = os.path.join(zvdata_env['data_path'], 'calendars', f'{name}.json')
+        calendar = TradingCalendar.from_file(path)
+        _calendars[name] = calendar
+    return calendar
+
+
+def to_trading_calendar(calendar) -> TradingCalendar:
+    if calendar is None or isinstance(calendar, TradingCalendar):
+        return calendar
+    return get_trading_calendar(calendar)
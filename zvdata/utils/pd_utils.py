@@ -8,8 +8,16 @@ def pd_is_not_null(df: Union[pd.DataFrame, pd.Series]):
     return df is not None and not df.empty
 
 
-def index_df(df, index='timestamp', inplace=True, drop=False, time_field='timestamp'):
-    if time_field:
+def index_df(df, index='timestamp', inplace=True, drop=False, time_field='timestamp', presorted=False):
+    """
+    set the index of df and sort it
+
+    :param presorted: whether df is ordered by the index already,e.g. by the ORDER BY of the query,the sort is
+    skipped if the order is checked
+    :type presorted: bool
+    """
+    # the time column from the db is parsed already
+    if time_field and not pd.api.types.is_datetime64_any_dtype(df[time_field]):
         df[time_field] = pd.to_datetime(df[time_field])
 
     if inplace:
@@ -17,10 +25,15 @@ def index_df(df, index='timestamp', inplace=True, drop=False, time_field='timest
     else:
         df = df.set_index(index, drop=drop, inplace=inplace)
 
+    if type(index) == list:
+        df.index.names = index
+
+    if presorted and df.index.is_monotonic_increasing:
+        return df
+
     if type(index) == str:
         df = df.sort_index()
     elif type(index) == list:
-        df.index.names = index
         level = list(range(len(index)))
         df = df.sort_index(level=level)
     return df
@@ -50,23 +63,46 @@ def df_subset(df, columns=None):
     return df
 
 
-def fill_with_same_index(df_list: List[pd.DataFrame]):
-    idx = None
-    for df in df_list:
-        if idx is None:
-            idx = df.index
-        else:
-            idx = idx.append(df.index).drop_duplicates()
-    idx = idx.sort_values()
+def fill_with_same_index(df_list: List[pd.DataFrame], target_index: pd.Index = None, fill_method: str = None):
+    """
+    align the dfs to the same sorted index
+
+    :param df_list:
+    :type df_list: List[pd.DataFrame]
+    :param target_index: the index aligned to,e.g. the trading times from the calendar,the union of the indexes of the
+    dfs if not set
+    :type target_index: pd.Index
+    :param fill_method: None,'ffill' or 'bfill' for the added rows
+    :type fill_method: str
+    :return:
+    :rtype: List[pd.DataFrame]
+    """
+    if not df_list:
+        return df_list
+
+    if target_index is None:
+        # the union in one pass
+        idx = df_list[0].index.append([df.index for df in df_list[1:]]).unique().sort_values()
+        idx.name = df_list[0].index.name
+    else:
+        idx = pd.Index(target_index).sort_values()
 
     result = []
     for df in df_list:
-        # print(df[df.index.duplicated()])
-        added_index = idx.difference(df.index.drop_duplicates())
-        added_df = pd.DataFrame(index=added_index, columns=df.columns)
-
-        # df1 = df.reindex(idx)
-        df1 = df.append(added_df)
-        df1 = df1.sort_index()
+        if df.index.is_unique:
+            if fill_method and not df.index.is_monotonic_increasing:
+                df = df.sort_index()
+            df1 = df.reindex(idx, method=fill_method)
+        else:
+            # reindex needs unique index,keep the duplicated rows in idx and fill the added rows only
+            df = df.sort_index(kind='mergesort')
+            added_index = idx.difference(df.index)
+            if fill_method:
+                # fill from the last row of the duplicated ones before,or the first one after
+                unique_df = df[~df.index.duplicated(keep='last' if fill_method == 'ffill' else 'first')]
+                added_df = unique_df.reindex(added_index, method=fill_method)
+            else:
+                added_df = df.iloc[:0].reindex(added_index)
+            df1 = pd.concat([df[df.index.isin(idx)], added_df]).sort_index(kind='mergesort')
         result.append(df1)
     return result
@@ -1,8 +1,10 @@
 # -*- coding: utf-8 -*-
 import datetime
 import math
+import re
 
 import arrow
+import numpy as np
 import pandas as pd
 import tzlocal
 
@@ -36,6 +38,34 @@ def to_pd_timestamp(the_time):
     return pd.Timestamp(the_time)
 
 
+def to_pd_timestamps(the_times) -> pd.DatetimeIndex:
+    """
+    the vectorized to_pd_timestamp,the int array is ms and the float array is second from the epoch in local time
+
+    """
+    if isinstance(the_times, pd.DatetimeIndex):
+        return the_times
+
+    values = np.asarray(the_times)
+    if values.dtype.kind in 'iuf':
+        if values.dtype.kind in 'iu':
+            timestamps = pd.to_datetime(values, unit='ms', utc=True)
+        else:
+            # rounded to us as datetime.fromtimestamp
+            frac, whole = np.modf(values)
+            us = whole.astype(np.int64) * 1000000 + np.round(frac * 1e6).astype(np.int64)
+            timestamps = pd.to_datetime(us, unit='us', utc=True)
+        return timestamps.tz_convert(str(tzlocal.get_localzone())).tz_localize(None)
+
+    if values.dtype == object and len(values):
+        types = set(map(type, values))
+        if int in types or float in types:
+            # mixed with the epochs
+            return pd.DatetimeIndex([to_pd_timestamp(the_time) for the_time in values])
+
+    return pd.DatetimeIndex(pd.to_datetime(values))
+
+
 def to_timestamp(the_time):
     return int(to_pd_timestamp(the_time).tz_localize(tzlocal.get_localzone()).timestamp() * 1000)
 
@@ -55,6 +85,63 @@ def to_time_str(the_time, fmt=TIME_FORMAT_DAY):
         return the_time
 
 
+# the arrow tokens in TIME_FORMAT_* -> strftime directives
+_ARROW_TOKEN_MAP_STRFTIME = {
+    'YYYY': '%Y',
+    'MM': '%m',
+    'DD': '%d',
+    'HH': '%H',
+    'mm': '%M',
+    'ss': '%S'
+}
+
+_ARROW_TOKEN_RE = re.compile(r'YYYY|SSS|MM|DD|HH|mm|ss|[A-Za-z]|.', re.S)
+
+
+def _to_strftime_parts(fmt):
+    """
+    split the arrow format by SSS(ms) to the strftime formats
+
+    """
+    parts = ['']
+    for token in _ARROW_TOKEN_RE.findall(fmt):
+        if token == 'SSS':
+            parts.append('')
+        elif token in _ARROW_TOKEN_MAP_STRFTIME:
+            parts[-1] += _ARROW_TOKEN_MAP_STRFTIME[token]
+        elif token.isalpha():
+            raise ValueError(f'not supported token {token} in {fmt}')
+        else:
+            parts[-1] += token.replace('%', '%%')
+    return parts
+
+
+def to_time_strs(the_times, fmt=TIME_FORMAT_DAY) -> np.ndarray:
+    """
+    the vectorized to_time_str for TIME_FORMAT_*,NaT -> None
+
+    """
+    timestamps = to_pd_timestamps(the_times)
+    values = timestamps.values
+
+    # the fast path by numpy,the values of tz aware timestamps are utc
+    if fmt == TIME_FORMAT_DAY and timestamps.tz is None:
+        result = np.datetime_as_string(values, unit='D')
+    elif fmt == TIME_FORMAT_ISO8601 and timestamps.tz is None:
+        result = np.datetime_as_string(values, unit='ms')
+    else:
+        parts = _to_strftime_parts(fmt)
+        result = timestamps.strftime(parts[0]).values.astype(str)
+        if len(parts) > 1:
+            ms = np.char.zfill((timestamps.microsecond // 1000).values.astype(str), 3)
+            for part in parts[1:]:
+                result = np.char.add(np.char.add(result, ms), timestamps.strftime(part).values.astype(str))
+
+    result = result.astype(object)
+    result[np.isnat(values)] = None
+    return result
+
+
 def now_time_str(fmt=TIME_FORMAT_DAY):
     return to_time_str(the_time=now_pd_timestamp(), fmt=fmt)
 
@@ -107,10 +194,50 @@ def next_timestamp(current_timestamp: pd.Timestamp, level: IntervalLevel) -> pd.
     return current_timestamp + pd.Timedelta(seconds=level.to_second())
 
 
+def next_timestamps(timestamps, level: IntervalLevel) -> pd.DatetimeIndex:
+    """
+    the vectorized next_timestamp
+
+    """
+    return to_pd_timestamps(timestamps) + pd.Timedelta(seconds=level.to_second())
+
+
+def floor_timestamps(timestamps, level: IntervalLevel) -> pd.DatetimeIndex:
+    """
+    the vectorized IntervalLevel.floor_timestamp,NaT for the levels not floored by it(tick,week and month)
+
+    """
+    timestamps = to_pd_timestamps(timestamps)
+    if level == IntervalLevel.LEVEL_TICK or level > IntervalLevel.LEVEL_1DAY:
+        return pd.DatetimeIndex([pd.NaT] * len(timestamps))
+    return timestamps.floor(level.to_pd_freq())
+
+
+def to_bar_timestamps(timestamps, level: IntervalLevel, kdata_use_begin_time=False) -> pd.DatetimeIndex:
+    """
+    the timestamps of the bars of the level which the timestamps(e.g. the finer bars) belong to,the intraday bar
+    use end time if not kdata_use_begin_time,e.g. (09:30,09:35] -> 09:35,the week and month bar use the start of the
+    period
+
+    """
+    timestamps = to_pd_timestamps(timestamps)
+    if level == IntervalLevel.LEVEL_TICK:
+        return timestamps
+    if level == IntervalLevel.LEVEL_1WEEK:
+        return timestamps.to_period('W').start_time
+    if level == IntervalLevel.LEVEL_1MON:
+        return timestamps.to_period('M').start_time
+    if level < IntervalLevel.LEVEL_1DAY and not kdata_use_begin_time:
+        return timestamps.ceil(level.to_pd_freq())
+    return floor_timestamps(timestamps, level)
+
+
 def evaluate_size_from_timestamp(start_timestamp,
                                  level: IntervalLevel,
                                  one_day_trading_minutes,
-                                 end_timestamp: pd.Timestamp = None):
+                                 end_timestamp: pd.Timestamp = None,
+                                 trading_calendar=None,
+                                 kdata_use_begin_time=False):
     """
     given from timestamp,level,one_day_trading_minutes,this func evaluate size of kdata to current.
     it maybe a little bigger than the real size for fetching all the kdata.
@@ -121,12 +248,20 @@ def evaluate_size_from_timestamp(start_timestamp,
     :type level: IntervalLevel
     :param one_day_trading_minutes:
     :type one_day_trading_minutes: int
+    :param trading_calendar: the exact size counted in the trading sessions if set
+    :type trading_calendar: zvdata.trading_calendar.TradingCalendar
+    :param kdata_use_begin_time: the bar timestamp is the begin time,for counting by the trading_calendar
+    :type kdata_use_begin_time: bool
     """
     if not end_timestamp:
         end_timestamp = pd.Timestamp.now()
     else:
         end_timestamp = to_pd_timestamp(end_timestamp)
 
+    if trading_calendar:
+        return trading_calendar.count_bars(start_timestamp, end_timestamp, level=level,
+                                           kdata_use_begin_time=kdata_use_begin_time)
+
     time_delta = end_timestamp - to_pd_timestamp(start_timestamp)
 
     one_day_trading_seconds = one_day_trading_minutes * 60
@@ -167,5 +302,42 @@ def is_in_same_interval(t1: pd.Timestamp, t2: pd.Timestamp, level: IntervalLevel
     return level.floor_timestamp(t1) == level.floor_timestamp(t2)
 
 
+def is_finished_kdata_timestamps(timestamps, level: IntervalLevel) -> np.ndarray:
+    """
+    the vectorized is_finished_kdata_timestamp
+
+    """
+    if level > IntervalLevel.LEVEL_1DAY or level == IntervalLevel.LEVEL_TICK:
+        # floor_timestamp is None for them
+        return np.zeros(len(timestamps), dtype=bool)
+    timestamps = to_pd_timestamps(timestamps)
+    return np.asarray(floor_timestamps(timestamps, level) == timestamps)
+
+
+def _iso_weeks(timestamps: pd.DatetimeIndex) -> np.ndarray:
+    # isocalendar() is added in pandas 1.1 and week is removed in pandas 2.0
+    if hasattr(timestamps, 'isocalendar'):
+        return timestamps.isocalendar().week.values.astype(np.int64)
+    return np.asarray(timestamps.week, dtype=np.int64)
+
+
+def same_interval_mask(t1s, t2s, level: IntervalLevel) -> np.ndarray:
+    """
+    the vectorized is_in_same_interval of the pairs
+
+    """
+    t1s = to_pd_timestamps(t1s)
+    t2s = to_pd_timestamps(t2s)
+    if level == IntervalLevel.LEVEL_1WEEK:
+        return _iso_weeks(t1s) == _iso_weeks(t2s)
+    if level == IntervalLevel.LEVEL_1MON:
+        return np.asarray(t1s.month == t2s.month)
+    if level == IntervalLevel.LEVEL_TICK:
+        # floor_timestamp is None for tick
+        return np.ones(len(t1s), dtype=bool)
+
+    return np.asarray(floor_timestamps(t1s, level) == floor_timestamps(t2s, level))
+
+
 if __name__ == '__main__':
     print(date_and_time('2019-10-01', '10:00'))
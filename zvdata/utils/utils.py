@@ -1,4 +1,5 @@
 # -*- coding: utf-8 -*-
+import keyword
 import logging
 import numbers
 from decimal import *
@@ -15,6 +16,13 @@ logger = logging.getLogger(__name__)
 none_values = ['不变', '--', '-', '新进']
 zero_values = ['不变', '--', '-', '新进']
 
+# for checking in O(1),only the str is checked,the unhashable values(e.g. list) are never none values
+none_value_set = frozenset(none_values)
+
+
+def is_none_value(the_value):
+    return isinstance(the_value, str) and the_value in none_value_set
+
 
 def first_item_to_float(the_list):
     return to_float(the_list[0])
@@ -33,7 +41,7 @@ def add_func_to_value(the_map, the_func):
 def to_float(the_str, default=None):
     if not the_str:
         return default
-    if the_str in none_values:
+    if is_none_value(the_str):
         return None
 
     if '%' in the_str:
@@ -59,7 +67,7 @@ def to_float(the_str, default=None):
 
 
 def pct_to_float(the_str, default=None):
-    if the_str in none_values:
+    if is_none_value(the_str):
         return None
 
     try:
@@ -74,10 +82,15 @@ def json_callback_param(the_str):
     return eval(json_str)
 
 
-def fill_domain_from_dict(the_domain, the_dict: dict, the_map: dict, default_func=lambda x: x):
+def _identity(x):
+    return x
+
+
+def fill_domain_from_dict(the_domain, the_dict: dict, the_map: dict, default_func=_identity):
     """
     use field map and related func to fill properties from the dict to the domain
 
+    the map is parsed in every call,compile it by compile_field_mapper once for filling many domains
 
     :param the_domain:
     :type the_domain: DeclarativeMeta
@@ -89,27 +102,66 @@ def fill_domain_from_dict(the_domain, the_dict: dict, the_map: dict, default_fun
     :type default_func: function
     """
     if not the_map:
-        the_map = {}
-        for k in the_dict:
-            the_map[k] = (k, default_func)
+        _fill_domain_by_keys(the_domain, the_dict, default_func)
+        return
 
     for k, v in the_map.items():
         if isinstance(v, tuple):
-            field_in_dict = v[0]
-            the_func = v[1]
+            field_in_dict, the_func = v[0], v[1]
         else:
-            field_in_dict = v
-            the_func = default_func
+            field_in_dict, the_func = v, default_func
 
         the_value = the_dict.get(field_in_dict)
         if the_value is not None:
-            to_value = the_value
-            if to_value in none_values:
-                setattr(the_domain, k, None)
-            else:
-                result_value = the_func(to_value)
-                setattr(the_domain, k, result_value)
-                exec('the_domain.{}=result_value'.format(k))
+            setattr(the_domain, k, None if is_none_value(the_value) else the_func(the_value))
+
+
+def _fill_domain_by_keys(the_domain, the_dict: dict, default_func=_identity):
+    for k, the_value in the_dict.items():
+        if the_value is not None:
+            setattr(the_domain, k, None if is_none_value(the_value) else default_func(the_value))
+
+
+def compile_field_mapper(the_map: dict, default_func=_identity):
+    """
+    compile the field map to the function filling the domain from the dict,the same as fill_domain_from_dict but
+    the map is parsed once and the fields are assigned by the generated code
+
+    :param the_map: domain field -> field in dict or (field in dict,func),all the fields in dict are used if empty
+    :type the_map: dict
+    :param default_func: the func for the fields without func
+    :type default_func: function
+    :return: func(the_domain,the_dict)
+    :rtype: function
+    """
+    if not the_map:
+        return lambda the_domain, the_dict: _fill_domain_by_keys(the_domain, the_dict, default_func)
+
+    namespace = {'none_value_set': none_value_set}
+    lines = ['def mapper(the_domain, the_dict):',
+             '    get = the_dict.get']
+    for i, (k, v) in enumerate(the_map.items()):
+        if isinstance(v, tuple):
+            field_in_dict, the_func = v[0], v[1]
+        else:
+            field_in_dict, the_func = v, default_func
+
+        namespace[f'func_{i}'] = the_func
+        value = 'v' if the_func is _identity else f'func_{i}(v)'
+        if k.isidentifier() and not keyword.iskeyword(k):
+            target = f'the_domain.{k} = {{}}'
+        else:
+            target = f'setattr(the_domain, {k!r}, {{}})'
+
+        lines.extend([f'    v = get({field_in_dict!r})',
+                      '    if v is not None:',
+                      '        if isinstance(v, str) and v in none_value_set:',
+                      f'            {target.format("None")}',
+                      '        else:',
+                      f'            {target.format(value)}'])
+
+    exec('\n'.join(lines), namespace)
+    return namespace['mapper']
 
 
 SUPPORT_ENCODINGS = ['GB2312', 'GBK', 'GB18030', 'UTF-8']